@@ -1,35 +1,313 @@
+import math
 import os
 import logging
+import sys
+import time
+from dataclasses import dataclass
 from pathlib import Path
+from typing import Literal
 
-from fastapi import Depends, FastAPI, HTTPException, Request
+from fastapi import Depends, FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, Response
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel, Field
 from dotenv import load_dotenv
+from starlette.concurrency import run_in_threadpool
 
-from minesweeper.persistence import InMemoryPersistence, FirestorePersistence
+from minesweeper import costs, infinite, metrics, profiling
+from minesweeper.costs import COST_FIELDS, CostBudget, CostStats
+from minesweeper.journal import JournalConfig
+from minesweeper.move_log import MoveLogConfig
+from minesweeper.profiling import ProfileConfig, Profiler
+from minesweeper.persistence import (
+    AsyncFirestorePersistence,
+    FirestorePersistence,
+    InMemoryPersistence,
+    MemoryLimits,
+    SqlitePersistence,
+    STATS_CACHE_TTL,
+    to_client_infinite,
+)
 
 load_dotenv(dotenv_path=Path('.env.local'))
 
 API_BASE = "/api/minesweeper"
 
 
+def _optional_env(name: str, cast):
+    value = os.getenv(name)
+    return cast(value) if value else None
+
+
+def memory_limits_from_env() -> MemoryLimits:
+    return MemoryLimits(
+        max_users=_optional_env("INMEMORY_MAX_USERS", int),
+        finished_ttl=_optional_env("INMEMORY_FINISHED_TTL", float),
+        max_moves_per_game=_optional_env("INMEMORY_MAX_MOVES", int),
+    )
+
+
+def journal_from_env() -> JournalConfig | None:
+    directory = os.getenv("INMEMORY_JOURNAL_DIR")
+    if not directory:
+        return None
+    return JournalConfig(
+        directory=directory,
+        snapshot_every=int(os.getenv("INMEMORY_SNAPSHOT_EVERY", "100000")),
+        fsync=os.getenv("INMEMORY_JOURNAL_FSYNC", "0").lower() in ("1", "true", "yes"),
+    )
+
+
+def profile_config_from_env() -> ProfileConfig | None:
+    directory = os.getenv("PROFILE_DIR")
+    if not directory:
+        return None
+    return ProfileConfig(
+        directory=directory,
+        sample_rate=float(os.getenv("PROFILE_SAMPLE_RATE", "0.01")),
+        interval=float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000,
+        requests_per_profile=int(os.getenv("PROFILE_REQUESTS_PER_FILE", "100")),
+    )
+
+
+@dataclass(frozen=True)
+class IdentityConfig:
+    # Accept X-User-Id from the client; off by default on Cloud Run
+    trust_x_user_id: bool = True
+    # Serve requests without an identity as default_user_id; off by default on Cloud Run
+    allow_anon: bool = True
+    default_user_id: str = "local-user"
+    # Seconds between log lines per auth path
+    log_interval: float = 60.0
+
+
+def identity_config_from_env() -> IdentityConfig:
+    # Detect Cloud Run to set safer defaults in production
+    is_cloud_run = bool(os.getenv("K_SERVICE") or os.getenv("K_REVISION") or os.getenv("K_CONFIGURATION"))
+    return IdentityConfig(
+        trust_x_user_id=os.getenv("TRUST_X_USER_ID", "0" if is_cloud_run else "1").lower() in ("1", "true", "yes"),
+        allow_anon=os.getenv("ALLOW_ANON", "0" if is_cloud_run else "1").lower() in ("1", "true", "yes"),
+        default_user_id=os.getenv("DEFAULT_USER_ID", "local-user"),
+        log_interval=float(os.getenv("IDENTITY_LOG_INTERVAL", "60")),
+    )
+
+
+def move_log_from_env() -> MoveLogConfig | None:
+    if os.getenv("MOVE_LOG_WRITE_BEHIND", "0").lower() not in ("1", "true", "yes"):
+        return None
+    return MoveLogConfig(
+        flush_interval=float(os.getenv("MOVE_LOG_FLUSH_INTERVAL", "1.0")),
+        flush_size=int(os.getenv("MOVE_LOG_FLUSH_SIZE", "200")),
+        max_buffer=int(os.getenv("MOVE_LOG_MAX_BUFFER", "10000")),
+    )
+
+
 def choose_persistence():
     use_inmem = os.getenv("USE_INMEMORY", "0").lower() in ("1", "true", "yes")
     emulator = os.getenv("FIRESTORE_EMULATOR_HOST")
+    use_async = os.getenv("FIRESTORE_ASYNC", "0").lower() in ("1", "true", "yes")
     if use_inmem:
-        return InMemoryPersistence()
+        return InMemoryPersistence(limits=memory_limits_from_env(), journal=journal_from_env())
+    options = {
+        "derive_layout": os.getenv("DERIVE_MINE_LAYOUT", "0").lower() in ("1", "true", "yes"),
+        "packed_moves": os.getenv("MOVE_LOG_FORMAT", "docs").lower() == "packed",
+        "stats_cache_ttl": float(os.getenv("STATS_CACHE_TTL", str(STATS_CACHE_TTL))),
+        "compact_boards": os.getenv("BOARD_ENCODING", "text").lower() == "compact",
+    }
+    sqlite_path = os.getenv("SQLITE_PATH")
+    if sqlite_path:
+        return SqlitePersistence(sqlite_path, derive_layout=options["derive_layout"])
+    write_behind = move_log_from_env()
+    if use_async and write_behind is not None:
+        # Raised here, not in the try below, which would fall back to in-memory
+        raise ValueError("MOVE_LOG_WRITE_BEHIND is not supported with FIRESTORE_ASYNC; unset one of them")
     try:
+        if use_async:
+            return AsyncFirestorePersistence(**options)
+        if write_behind is not None:
+            options["write_behind"] = write_behind
         if emulator:
-            return FirestorePersistence()
+            return FirestorePersistence(**options)
         # default to Firestore in production
-        return FirestorePersistence()
+        return FirestorePersistence(**options)
     except Exception:
         # Fallback to in-memory if firestore client not available
         return InMemoryPersistence()
 
 
+class ThreadpoolPersistence:
+    """Async view of a blocking persistence backend.
+
+    Each storage call runs on the threadpool, as it did when the handlers were
+    plain ``def``s; the pure ``to_client*`` formatters stay inline.
+    """
+
+    is_async = True
+    _INLINE = ("to_client", "to_client_delta")
+
+    def __init__(self, persistence) -> None:
+        self.persistence = persistence
+
+    def __getattr__(self, name: str):
+        attr = getattr(self.persistence, name)
+        if name in self._INLINE or not callable(attr):
+            return attr
+
+        async def call(*args, **kwargs):
+            return await run_in_threadpool(profiling.attributed(attr), *args, **kwargs)
+
+        return call
+
+
+def async_persistence(persistence):
+    """``persistence`` itself when it is natively async, else a threadpool adapter."""
+    if getattr(persistence, "is_async", False):
+        return persistence
+    return ThreadpoolPersistence(persistence)
+
+
+class TimedPersistence:
+    """Async persistence that observes how long each storage call takes, by method."""
+
+    _INLINE = ThreadpoolPersistence._INLINE
+
+    def __init__(self, store, latency: metrics.Histogram) -> None:
+        self.store = store
+        self.latency = latency
+
+    def __getattr__(self, name: str):
+        attr = getattr(self.store, name)
+        if name in self._INLINE or not callable(attr):
+            return attr
+        observe = self.latency.labels(name).observe
+
+        async def call(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await attr(*args, **kwargs)
+            finally:
+                observe(time.perf_counter() - start)
+
+        return call
+
+
+class MetricsMiddleware:
+    """Observes each request's latency by route, method and status."""
+
+    def __init__(self, app, latency: metrics.Histogram, in_progress: metrics.Gauge) -> None:
+        self.app = app
+        self.latency = latency
+        self.in_progress = in_progress.labels()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        self.in_progress.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            self.in_progress.dec()
+            route = scope.get("route")
+            # Unmatched paths share one label so scanners cannot grow the series
+            path = route.path if route is not None else "unmatched"
+            self.latency.labels(path, scope["method"], str(status)).observe(time.perf_counter() - start)
+
+
+AUTH_PATHS = ("iap_email", "forwarded_user", "x-user-id", "anon", "missing")
+
+
+class IdentityLog:
+    """Counts requests by auth path, logging the first and then one per ``interval`` seconds.
+
+    Each line carries the number of requests on its path since the previous one.
+    Called from the event loop only, so the bookkeeping takes no lock.
+    """
+
+    def __init__(self, counter: metrics.Counter, interval: float) -> None:
+        self._counts = {path: counter.labels(path) for path in AUTH_PATHS}
+        self._interval = interval
+        self._next = dict.fromkeys(AUTH_PATHS, 0.0)
+        self._since = dict.fromkeys(AUTH_PATHS, 0)
+        self._logger = logging.getLogger("uvicorn.error")
+
+    def record(self, path: str, user_id: str | None) -> None:
+        self._counts[path].inc()
+        self._since[path] += 1
+        now = time.monotonic()
+        if now < self._next[path]:
+            return
+        self._next[path] = now + self._interval
+        requests, self._since[path] = self._since[path], 0
+        self._logger.log(
+            logging.WARNING if path == "missing" else logging.INFO,
+            "[minesweeper] get_user_id via=%s user_id=%s requests=%d",
+            path,
+            user_id or "-",
+            requests,
+            extra={"auth_path": path, "user_id": user_id, "requests": requests},
+        )
+
+
+class ProfileMiddleware:
+    """Profiles a sample of requests, and every request sent with ``X-Profile: 1``."""
+
+    def __init__(self, app, profiler: Profiler) -> None:
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.profiler.wanted((b"x-profile", b"1") in scope["headers"]):
+            await self.app(scope, receive, send)
+            return
+        with self.profiler.profile(sys._getframe()) as session:
+            await self.app(scope, receive, send)
+        route = scope.get("route")
+        self.profiler.finish(session, f"{scope['method']} {route.path if route is not None else 'unmatched'}")
+
+
+class CostMiddleware:
+    """Records the Firestore reads, writes and retries of each request by route.
+
+    With ``headers`` the request's cost is also returned in ``X-Persistence-Cost``.
+    """
+
+    def __init__(self, app, stats: CostStats, headers: bool = False) -> None:
+        self.app = app
+        self.stats = stats
+        self.headers = headers
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        with costs.tracking() as cost:
+            if self.headers:
+                async def send_with_cost(message):
+                    if message["type"] == "http.response.start":
+                        message["headers"] = list(message.get("headers", [])) + [(b"x-persistence-cost", cost.header().encode())]
+                    await send(message)
+
+                await self.app(scope, receive, send_with_cost)
+            else:
+                await self.app(scope, receive, send)
+        route = scope.get("route")
+        if route is not None:
+            exceeded = self.stats.record(route.path, cost)
+            if exceeded:
+                logging.getLogger("uvicorn.error").warning(f"[minesweeper] {route.path} over budget on {','.join(exceeded)}: {cost.header()}")
+
+
 class StartBody(BaseModel):
     board_width: int = Field(..., ge=2, le=40)
     board_height: int = Field(..., ge=2, le=40)
@@ -41,6 +319,137 @@ class MoveBody(BaseModel):
     col: int = Field(..., ge=0)
 
 
+MAX_BATCH_ACTIONS = 200
+MAX_INFINITE_VIEW = 128
+
+
+class InfiniteStartBody(BaseModel):
+    mines_per_chunk: int = Field(40, ge=1, le=infinite.CHUNK_CELLS - 9)
+
+
+class CellBody(BaseModel):
+    # Unbounded boards extend in every direction, so coordinates may be negative
+    row: int
+    col: int
+
+
+class ActionBody(MoveBody):
+    action: Literal["reveal", "flag", "chord"]
+
+
+class MovesBody(BaseModel):
+    actions: list[ActionBody] = Field(..., min_length=1, max_length=MAX_BATCH_ACTIONS)
+
+
+# "board" returns the full client board; "delta" only the cells the move changed
+ViewParam = Query("board", pattern="^(board|delta)$")
+
+FLAT_BOARD_MEDIA_TYPE = "application/vnd.minesweeper.flat+json"
+
+# Chunks a side spanned by a reveal capped at MAX_OPEN_PER_MOVE cells, whose
+# flood is at worst a diamond
+_FLOOD_SPAN = math.isqrt(2 * infinite.MAX_OPEN_PER_MOVE) // infinite.CHUNK + 2
+
+# Firestore documents a request may read and write; requests over budget are logged
+# and counted at /metrics/costs. Finishing a game adds the two stats documents.
+COST_BUDGETS = {
+    f"{API_BASE}/start": CostBudget(reads=1, writes=1),
+    f"{API_BASE}/state": CostBudget(reads=1, writes=0),
+    f"{API_BASE}/reveal": CostBudget(reads=1, writes=4),
+    f"{API_BASE}/flag": CostBudget(reads=1, writes=2),
+    # Legacy move logs write a document per move
+    f"{API_BASE}/moves": CostBudget(reads=1, writes=3 + MAX_BATCH_ACTIONS),
+    f"{API_BASE}/abandon": CostBudget(reads=1, writes=4),
+    f"{API_BASE}/stats": CostBudget(reads=1, writes=0),
+    f"{API_BASE}/infinite/start": CostBudget(reads=1, writes=1),
+    # A view reads the game plus every chunk it overlaps
+    f"{API_BASE}/infinite/state": CostBudget(reads=1 + (MAX_INFINITE_VIEW // infinite.CHUNK + 1) ** 2, writes=0),
+    # A cascading reveal also reads the ring of chunks around its flood
+    f"{API_BASE}/infinite/reveal": CostBudget(reads=1 + (_FLOOD_SPAN + 2) ** 2, writes=1 + _FLOOD_SPAN**2),
+    f"{API_BASE}/infinite/flag": CostBudget(reads=2, writes=2),
+    f"{API_BASE}/infinite/abandon": CostBudget(reads=1, writes=1),
+}
+
+
+def board_format(req: Request, board: str | None = Query(None, pattern="^(rows|flat)$")) -> str:
+    """Board encoding: nested rows (default) or one row-major string ("flat").
+
+    Chosen with ``?board=flat`` or by accepting ``application/vnd.minesweeper.flat+json``.
+    """
+    if board:
+        return board
+    if FLAT_BOARD_MEDIA_TYPE in req.headers.get("accept", ""):
+        return "flat"
+    return "rows"
+
+
+def _register_collectors(app: FastAPI) -> None:
+    """Metrics read at scrape time from state the app keeps anyway."""
+    registry: metrics.Registry = app.state.metrics
+
+    def cost_samples(field: str):
+        def collect():
+            snapshot = app.state.costs.snapshot()
+            for route, entry in snapshot["routes"].items():
+                yield "_total", (route,), entry["total"][field]
+            yield "_total", ("background",), snapshot["background"][field]
+
+        return collect
+
+    helps = {
+        "reads": "Firestore documents read, by route.",
+        "writes": "Firestore documents written, by route.",
+        "read_bytes": "Estimated bytes of Firestore documents read, by route.",
+        "write_bytes": "Estimated bytes of Firestore fields written, by route.",
+        "retries": "Firestore transaction retries, by route.",
+    }
+    for field in COST_FIELDS:
+        registry.collected(
+            f"minesweeper_persistence_{field}",
+            helps[field],
+            "counter",
+            ("route",),
+            cost_samples(field),
+        )
+    registry.collected(
+        "minesweeper_persistence_over_budget_requests",
+        "Requests over their route's persistence cost budget.",
+        "counter",
+        ("route",),
+        lambda: (("_total", (route,), entry["over_budget"]) for route, entry in app.state.costs.snapshot()["routes"].items()),
+    )
+    move_log = getattr(app.state.persistence, "move_log", None)
+    if move_log is not None:
+
+        def move_log_sample(key: str, suffix: str):
+            def collect():
+                value = move_log.metrics()[key]
+                # No flush has finished yet
+                if value is not None:
+                    yield suffix, (), value
+
+            return collect
+
+        for name, key, kind, help in (
+            ("minesweeper_move_log_depth", "depth", "gauge", "Move records buffered for write-behind."),
+            ("minesweeper_move_log_lag_seconds", "lag_seconds", "gauge", "Age of the oldest buffered move record."),
+            ("minesweeper_move_log_last_flush_lag_seconds", "last_flush_lag_seconds", "gauge", "Age of the oldest record in the last successful flush."),
+            ("minesweeper_move_log_flushed_records", "flushed_total", "counter", "Move records written by the write-behind log."),
+            ("minesweeper_move_log_dropped_records", "dropped_total", "counter", "Move records dropped because the buffer was full."),
+            ("minesweeper_move_log_flush_errors", "flush_errors", "counter", "Write-behind flushes that failed; their records were requeued."),
+        ):
+            registry.collected(name, help, kind, (), move_log_sample(key, "_total" if kind == "counter" else ""))
+    active_games = getattr(app.state.persistence, "active_games", None)
+    if active_games is not None:
+        registry.collected(
+            "minesweeper_active_games",
+            "Games in progress, by kind.",
+            "gauge",
+            ("kind",),
+            lambda: (("", (kind,), n) for kind, n in active_games().items()),
+        )
+
+
 def create_app(persistence=None) -> FastAPI:
     app = FastAPI(title="Minesweeper Service", version="0.1.0")
 
@@ -52,7 +461,51 @@ def create_app(persistence=None) -> FastAPI:
         allow_headers=["*"]
     )
 
+    app.state.costs = CostStats(COST_BUDGETS)
+    app.add_middleware(
+        CostMiddleware,
+        stats=app.state.costs,
+        headers=os.getenv("COST_HEADERS", "0").lower() in ("1", "true", "yes"),
+    )
+
+    profile_config = profile_config_from_env()
+    app.state.profiler = Profiler(profile_config) if profile_config else None
+    if app.state.profiler is not None:
+        app.add_middleware(ProfileMiddleware, profiler=app.state.profiler)
+
     app.state.persistence = persistence or choose_persistence()
+    # Engine timings are process-wide in metrics.REGISTRY; the rest is this app's
+    app.state.metrics = metrics.Registry()
+    app.add_middleware(
+        MetricsMiddleware,
+        latency=app.state.metrics.histogram(
+            "minesweeper_http_request_duration_seconds", "HTTP request latency.", ("route", "method", "status")
+        ),
+        in_progress=app.state.metrics.gauge("minesweeper_http_requests_in_progress", "HTTP requests being served."),
+    )
+    # Handlers are coroutines and await every storage call through this
+    app.state.store = TimedPersistence(
+        async_persistence(app.state.persistence),
+        app.state.metrics.histogram("minesweeper_persistence_call_seconds", "Persistence call latency, including threadpool wait.", ("method",)),
+    )
+    _register_collectors(app)
+
+    # Read once; get_user_id runs on every request
+    identity = app.state.identity = identity_config_from_env()
+    identity_log = IdentityLog(
+        app.state.metrics.counter("minesweeper_auth_requests", "Requests by how the user was identified.", ("path",)),
+        identity.log_interval,
+    )
+
+    @app.on_event("shutdown")
+    def _close_persistence():
+        # Drains the write-behind move log, if the backend has one
+        close = getattr(app.state.persistence, "close", None)
+        if close is not None:
+            close()
+        move_log = getattr(app.state.persistence, "move_log", None)
+        if move_log is not None:
+            logging.getLogger("uvicorn.error").info(f"[minesweeper] move log at shutdown {move_log.metrics()}")
 
     @app.on_event("startup")
     async def _log_persistence():
@@ -66,65 +519,49 @@ def create_app(persistence=None) -> FastAPI:
         logging.getLogger("uvicorn.error").info(
             f"[minesweeper] Persistence={klass} USE_INMEMORY={int(use_inmem)} FIRESTORE_EMULATOR_HOST={emulator or '-'} GOOGLE_CLOUD_PROJECT={project or '-'}"
         )
+        logging.getLogger("uvicorn.error").info(
+            f"[minesweeper] Identity trust_x_user_id={int(identity.trust_x_user_id)} allow_anon={int(identity.allow_anon)} "
+            f"default_user_id={identity.default_user_id}"
+        )
 
-    def get_user_id(req: Request) -> str:
-        # Detect Cloud Run to set safer defaults in production
-        is_cloud_run = bool(os.getenv("K_SERVICE") or os.getenv("K_REVISION") or os.getenv("K_CONFIGURATION"))
-        trust_x_user_id = os.getenv("TRUST_X_USER_ID", "0" if is_cloud_run else "1").lower() in ("1", "true", "yes")
-        allow_anon = os.getenv("ALLOW_ANON", "0" if is_cloud_run else "1").lower() in ("1", "true", "yes")
-        default_uid = os.getenv("DEFAULT_USER_ID", "local-user")
-        logger = logging.getLogger("uvicorn.error")
-
+    # async, so FastAPI runs it on the loop rather than handing it to a worker thread
+    async def get_user_id(req: Request) -> str:
+        headers = req.headers
         # 1) Prefer Google/IAP style headers when present (production)
         iap_email = (
-            req.headers.get("X-Goog-Authenticated-User-Email")
-            or req.headers.get("X-Authenticated-User-Email")
-            or req.headers.get("X-Forwarded-Email")
+            headers.get("X-Goog-Authenticated-User-Email")
+            or headers.get("X-Authenticated-User-Email")
+            or headers.get("X-Forwarded-Email")
         )
         if iap_email:
             # Format often: "accounts.google.com:email@example.com"
             if ":" in iap_email:
                 iap_email = iap_email.split(":", 1)[1]
-            logger.info(
-                f"[minesweeper] get_user_id via=iap_email user_id={iap_email} "
-                f"is_cloud_run={int(is_cloud_run)} trust_x_user_id={int(trust_x_user_id)} allow_anon={int(allow_anon)}"
-            )
+            identity_log.record("iap_email", iap_email)
             return iap_email
-        forwarded_user = req.headers.get("X-Forwarded-User")
+        forwarded_user = headers.get("X-Forwarded-User")
         if forwarded_user:
-            logger.info(
-                f"[minesweeper] get_user_id via=forwarded_user user_id={forwarded_user} "
-                f"is_cloud_run={int(is_cloud_run)} trust_x_user_id={int(trust_x_user_id)} allow_anon={int(allow_anon)}"
-            )
+            identity_log.record("forwarded_user", forwarded_user)
             return forwarded_user
 
         # 2) Only trust explicit header in dev or if explicitly enabled
-        uid = req.headers.get("X-User-Id")
-        if uid and trust_x_user_id:
-            logger.info(
-                f"[minesweeper] get_user_id via=x-user-id user_id={uid} "
-                f"is_cloud_run={int(is_cloud_run)} trust_x_user_id={int(trust_x_user_id)} allow_anon={int(allow_anon)}"
-            )
+        uid = headers.get("X-User-Id")
+        if uid and identity.trust_x_user_id:
+            identity_log.record("x-user-id", uid)
             return uid
 
         # 3) Dev fallback (only if explicitly allowed)
-        if allow_anon:
-            logger.info(
-                f"[minesweeper] get_user_id via=anon-fallback user_id={default_uid} "
-                f"is_cloud_run={int(is_cloud_run)} trust_x_user_id={int(trust_x_user_id)} allow_anon={int(allow_anon)}"
-            )
-            return default_uid
+        if identity.allow_anon:
+            identity_log.record("anon", identity.default_user_id)
+            return identity.default_user_id
 
-        logger.warning(
-            f"[minesweeper] get_user_id missing user id is_cloud_run={int(is_cloud_run)} "
-            f"trust_x_user_id={int(trust_x_user_id)} allow_anon={int(allow_anon)}"
-        )
+        identity_log.record("missing", None)
         raise HTTPException(status_code=401, detail="missing user id")
 
     @app.post(f"{API_BASE}/start")
-    def start_game(body: StartBody, user_id: str = Depends(get_user_id)):
+    async def start_game(body: StartBody, fmt: str = Depends(board_format), user_id: str = Depends(get_user_id)):
         try:
-            doc = app.state.persistence.start_game(
+            doc = await app.state.store.start_game(
                 user_id,
                 body.board_width,
                 body.board_height,
@@ -135,33 +572,39 @@ def create_app(persistence=None) -> FastAPI:
                 raise HTTPException(status_code=409, detail="active game exists")
             # Treat other ValueErrors as bad requests (validation/boundary errors)
             raise HTTPException(status_code=400, detail=str(e))
-        return app.state.persistence.to_client(doc) | {"game_id": user_id}
+        return app.state.store.to_client(doc, fmt) | {"game_id": user_id}
 
     @app.get(f"{API_BASE}/state")
-    def get_state(user_id: str = Depends(get_user_id)):
-        game = app.state.persistence.get_game(user_id)
+    async def get_state(fmt: str = Depends(board_format), user_id: str = Depends(get_user_id)):
+        game = await app.state.store.get_game(user_id)
         if not game:
             raise HTTPException(status_code=404, detail="no game")
-        return app.state.persistence.to_client(game) | {"game_id": user_id}
+        return app.state.store.to_client(game, fmt) | {"game_id": user_id}
 
     @app.post(f"{API_BASE}/reveal")
-    def reveal(body: MoveBody, user_id: str = Depends(get_user_id)):
-        game = app.state.persistence.get_game(user_id)
-        if not game:
-            raise HTTPException(status_code=404, detail="no game")
+    async def reveal(
+        body: MoveBody,
+        view: str = ViewParam,
+        fmt: str = Depends(board_format),
+        user_id: str = Depends(get_user_id),
+    ):
+        # the persistence call does the only read and raises KeyError when there is no game
         try:
-            game, _move = app.state.persistence.reveal(user_id, body.row, body.col)
+            game, _move = await app.state.store.reveal(user_id, body.row, body.col)
         except KeyError:
             raise HTTPException(status_code=404, detail="no game")
         except ValueError as e:
             # Capture certain engine errors as final end_result=error
             if str(e) == "insufficient_space_for_mines":
                 try:
-                    app.state.persistence.mark_error(user_id, str(e))
+                    await app.state.store.mark_error(user_id, str(e))
                 except Exception:
                     pass
             raise HTTPException(status_code=400, detail=str(e))
-        resp = app.state.persistence.to_client(game) | {"game_id": user_id}
+        if view == "delta":
+            resp = app.state.store.to_client_delta(game, _move) | {"game_id": user_id}
+        else:
+            resp = app.state.store.to_client(game, fmt) | {"game_id": user_id}
         if isinstance(_move, dict) and "row" in _move and "col" in _move:
             try:
                 resp["last_move"] = {
@@ -174,31 +617,142 @@ def create_app(persistence=None) -> FastAPI:
         return resp
 
     @app.post(f"{API_BASE}/flag")
-    def flag(body: MoveBody, user_id: str = Depends(get_user_id)):
-        game = app.state.persistence.get_game(user_id)
-        if not game:
+    async def flag(
+        body: MoveBody,
+        view: str = ViewParam,
+        fmt: str = Depends(board_format),
+        user_id: str = Depends(get_user_id),
+    ):
+        try:
+            game, _move = await app.state.store.flag(user_id, body.row, body.col)
+        except KeyError:
             raise HTTPException(status_code=404, detail="no game")
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if view == "delta":
+            return app.state.store.to_client_delta(game, _move) | {"game_id": user_id}
+        return app.state.store.to_client(game, fmt) | {"game_id": user_id}
+
+    @app.post(f"{API_BASE}/moves")
+    async def moves(
+        body: MovesBody,
+        view: str = ViewParam,
+        fmt: str = Depends(board_format),
+        user_id: str = Depends(get_user_id),
+    ):
         try:
-            game, _move = app.state.persistence.flag(user_id, body.row, body.col)
+            game, _moves = await app.state.store.apply_moves(user_id, [a.model_dump() for a in body.actions])
         except KeyError:
             raise HTTPException(status_code=404, detail="no game")
         except ValueError as e:
+            if str(e) == "insufficient_space_for_mines":
+                try:
+                    await app.state.store.mark_error(user_id, str(e))
+                except Exception:
+                    pass
             raise HTTPException(status_code=400, detail=str(e))
-        return app.state.persistence.to_client(game) | {"game_id": user_id}
+        if view == "delta":
+            changed: dict[int, str] = {}
+            for m in _moves:
+                for i, value in m["changed"]:
+                    changed[i] = value
+            last = _moves[-1] | {"changed": [[i, value] for i, value in changed.items()]}
+            resp = app.state.store.to_client_delta(game, last) | {"game_id": user_id}
+        else:
+            resp = app.state.store.to_client(game, fmt) | {"game_id": user_id}
+        resp["moves_applied"] = len(_moves)
+        last_move = next((m for m in reversed(_moves) if m["hit_mine"]), _moves[-1])
+        resp["last_move"] = {
+            "row": last_move["row"],
+            "col": last_move["col"],
+            "hit_mine": bool(last_move["hit_mine"]),
+        }
+        return resp
 
     @app.post(f"{API_BASE}/abandon")
-    def abandon(user_id: str = Depends(get_user_id)):
-        game = app.state.persistence.get_game(user_id)
-        if not game:
+    async def abandon(fmt: str = Depends(board_format), user_id: str = Depends(get_user_id)):
+        try:
+            game, _move = await app.state.store.abandon(user_id)
+        except KeyError:
             raise HTTPException(status_code=404, detail="no game")
-        game, _move = app.state.persistence.abandon(user_id)
-        return app.state.persistence.to_client(game) | {"game_id": user_id}
+        return app.state.store.to_client(game, fmt) | {"game_id": user_id}
+
+    @app.post(f"{API_BASE}/infinite/start")
+    async def start_infinite(body: InfiniteStartBody, user_id: str = Depends(get_user_id)):
+        try:
+            doc = await app.state.store.start_infinite_game(user_id, body.mines_per_chunk)
+        except ValueError as e:
+            if str(e) == "active_game_exists":
+                raise HTTPException(status_code=409, detail="active game exists")
+            raise HTTPException(status_code=400, detail=str(e))
+        return to_client_infinite(doc) | {"game_id": user_id}
+
+    @app.get(f"{API_BASE}/infinite/state")
+    async def get_infinite_state(
+        row: int = 0,
+        col: int = 0,
+        height: int = Query(32, ge=1, le=MAX_INFINITE_VIEW),
+        width: int = Query(32, ge=1, le=MAX_INFINITE_VIEW),
+        user_id: str = Depends(get_user_id),
+    ):
+        try:
+            game, rows = await app.state.store.infinite_view(user_id, row, col, height, width)
+        except KeyError:
+            raise HTTPException(status_code=404, detail="no game")
+        return to_client_infinite(game) | {"game_id": user_id, "row": row, "col": col, "rows": rows}
+
+    @app.post(f"{API_BASE}/infinite/reveal")
+    async def infinite_reveal(body: CellBody, user_id: str = Depends(get_user_id)):
+        try:
+            game, result = await app.state.store.infinite_reveal(user_id, body.row, body.col)
+        except KeyError:
+            raise HTTPException(status_code=404, detail="no game")
+        return to_client_infinite(game) | {
+            "game_id": user_id,
+            "changed": result["changed"],
+            "last_move": {"row": body.row, "col": body.col, "hit_mine": result["hit_mine"]},
+        }
+
+    @app.post(f"{API_BASE}/infinite/flag")
+    async def infinite_flag(body: CellBody, user_id: str = Depends(get_user_id)):
+        try:
+            game, result = await app.state.store.infinite_flag(user_id, body.row, body.col)
+        except KeyError:
+            raise HTTPException(status_code=404, detail="no game")
+        return to_client_infinite(game) | {"game_id": user_id, "changed": result["changed"]}
+
+    @app.post(f"{API_BASE}/infinite/abandon")
+    async def infinite_abandon(user_id: str = Depends(get_user_id)):
+        try:
+            game = await app.state.store.infinite_abandon(user_id)
+        except KeyError:
+            raise HTTPException(status_code=404, detail="no game")
+        return to_client_infinite(game) | {"game_id": user_id}
 
     @app.get(f"{API_BASE}/stats")
-    def get_stats(user_id: str = Depends(get_user_id)):
-        stats = app.state.persistence.get_stats(user_id)
+    async def get_stats(user_id: str = Depends(get_user_id)):
+        stats = await app.state.store.get_stats(user_id)
         return stats
 
+    @app.get("/metrics", include_in_schema=False)
+    async def get_metrics():
+        # Collectors may query the backend, so render off the event loop
+        body = await run_in_threadpool(lambda: metrics.REGISTRY.render() + app.state.metrics.render())
+        return Response(body, media_type=metrics.CONTENT_TYPE)
+
+    @app.get(f"{API_BASE}/debug/profile", include_in_schema=False)
+    async def get_profile():
+        if app.state.profiler is None:
+            raise HTTPException(status_code=404, detail="profiling disabled")
+        path = await run_in_threadpool(app.state.profiler.latest)
+        if path is None:
+            raise HTTPException(status_code=404, detail="no profile yet")
+        return FileResponse(path, media_type="text/plain", filename=os.path.basename(path))
+
+    @app.get(f"{API_BASE}/metrics/costs")
+    async def get_cost_metrics():
+        return app.state.costs.snapshot()
+
     # Static frontend
     frontend_dir = Path(__file__).resolve().parent.parent / "frontend"
     if frontend_dir.exists():
@@ -0,0 +1,77 @@
+"""Measure FirestorePersistence against the in-process fake Firestore client.
+
+    python benchmarks/firestore_fake.py --users 50 --moves 20 --threads 8 --latency-ms 5
+
+Every user plays ``--moves`` flags and reveals from ``--threads`` threads, with
+``--latency-ms`` added to each round trip. ``--hot`` makes all threads play the
+same user, so transactions contend and retry. Prints throughput and the
+Firestore work per move.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from minesweeper.fake_firestore import FakeFirestoreClient  # noqa: E402
+from minesweeper.move_log import MoveLogConfig  # noqa: E402
+from minesweeper.persistence import FirestorePersistence  # noqa: E402
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--moves", type=int, default=20)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    parser.add_argument("--abort-rate", type=float, default=0.0)
+    parser.add_argument("--hot", action="store_true", help="all threads play one user")
+    parser.add_argument("--packed-moves", action="store_true")
+    parser.add_argument("--write-behind", action="store_true")
+    args = parser.parse_args()
+
+    client = FakeFirestoreClient(latency=args.latency_ms / 1000, abort_rate=args.abort_rate, seed=0)
+    p = FirestorePersistence(
+        client=client,
+        packed_moves=args.packed_moves,
+        write_behind=MoveLogConfig() if args.write_behind else None,
+    )
+    users = ["hot"] if args.hot else [f"user-{i}" for i in range(args.users)]
+    for user in users:
+        p.start_game(user, 30, 16, 1, rng_seed=1)
+    client.reset_counters()
+
+    failed = [0]
+
+    def play(t: int) -> None:
+        for i in range(t, args.users, args.threads):
+            user = users[i % len(users)]
+            for m in range(args.moves):
+                row, col = divmod(i * args.moves + m, 30)
+                try:
+                    p.flag(user, row % 16, col)
+                except ValueError:
+                    failed[0] += 1
+
+    threads = [threading.Thread(target=play, args=(t,)) for t in range(args.threads)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    p.close()
+
+    moves = args.users * args.moves
+    counts = client.counters()
+    print(f"{moves} moves in {elapsed:.2f}s ({moves / elapsed:,.0f}/s), {failed[0]} failed after retries")
+    for name in ("round_trips", "reads", "writes", "commits", "aborts", "retries"):
+        print(f"  {name:12} {counts.get(name, 0):8} ({counts.get(name, 0) / moves:.2f}/move)")
+
+
+if __name__ == "__main__":
+    main()
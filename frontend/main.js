@@ -1,5 +1,7 @@
 const API_BASE = window.API_BASE || "/api/minesweeper";
 const IMG_BASE = "/assets/tiles";
+// Ask for boards as one row-major string instead of nested arrays
+const BOARD_MEDIA_TYPE = "application/vnd.minesweeper.flat+json";
 const _params = new URLSearchParams(window.location.search);
 const EXTERNAL_USER_ID = _params.get("x-user-id");
 const EXTERNAL_USER_NAME = _params.get("x-user-name");
@@ -29,6 +31,11 @@ const loadingEl = el("loading");
 const MAX_DIM = 40;
 
 let pendingRequests = 0;
+// Last full state rendered; move responses only carry the cells they changed.
+let current = null;
+// Clicks made while a move request is in flight are sent together via /moves.
+let moveInFlight = false;
+let queuedMoves = [];
 
 function setLoadingVisible(show) {
   if (!loadingEl) return;
@@ -68,6 +75,7 @@ async function api(path, method = "GET", body, showLoading = false) {
       method,
       headers: {
         "Content-Type": "application/json",
+        Accept: BOARD_MEDIA_TYPE,
         "X-User-Id": USER_ID,
       },
       body: body ? JSON.stringify(body) : undefined,
@@ -76,13 +84,59 @@ async function api(path, method = "GET", body, showLoading = false) {
       const txt = await res.text();
       throw new Error(`${res.status}: ${txt}`);
     }
-    return res.json();
+    return decodeBoard(await res.json());
   } finally {
     if (showLoading) endRequest();
   }
 }
 
+function decodeBoard(data) {
+  if (typeof data.board !== "string") return data;
+  const rows = [];
+  for (let r = 0; r < data.board_height; r++) {
+    rows.push(data.board.slice(r * data.board_width, (r + 1) * data.board_width).split(""));
+  }
+  return { ...data, board: rows };
+}
+
+function applyDelta(delta) {
+  if (!current || !delta.changed) return delta;
+  const board = current.board;
+  for (const [i, v] of delta.changed) {
+    board[Math.floor(i / delta.board_width)][i % delta.board_width] = v;
+  }
+  return { ...delta, board };
+}
+
+async function sendQueuedMoves() {
+  if (moveInFlight || queuedMoves.length === 0) return;
+  const actions = queuedMoves;
+  queuedMoves = [];
+  moveInFlight = true;
+  try {
+    let resp;
+    if (actions.length === 1) {
+      const { action, row, col } = actions[0];
+      resp = await api(`/${action}?view=delta`, "POST", { row, col });
+    } else {
+      resp = await api("/moves?view=delta", "POST", { actions });
+    }
+    render(applyDelta(resp));
+  } catch (e) {
+    console.error(e);
+  } finally {
+    moveInFlight = false;
+    sendQueuedMoves();
+  }
+}
+
+function queueMove(action, row, col) {
+  queuedMoves.push({ action, row, col });
+  sendQueuedMoves();
+}
+
 function render(data) {
+  current = data;
   const { board, status, num_mines, flags_total, board_width, board_height, moves_count } = data;
   statusText.textContent = status;
   movesCountEl.textContent = moves_count ?? 0;
@@ -123,22 +177,10 @@ function render(data) {
       t.style.backgroundImage = img ? `url('${IMG_BASE}/${img}')` : "";
 
       if (status === "active") {
-        t.addEventListener("click", async () => {
-          try {
-            const resp = await api("/reveal", "POST", { row: r, col: c });
-            render(resp);
-          } catch (e) {
-            console.error(e);
-          }
-        });
-        t.addEventListener("contextmenu", async (ev) => {
+        t.addEventListener("click", () => queueMove("reveal", r, c));
+        t.addEventListener("contextmenu", (ev) => {
           ev.preventDefault();
-          try {
-            const resp = await api("/flag", "POST", { row: r, col: c });
-            render(resp);
-          } catch (e) {
-            console.error(e);
-          }
+          queueMove("flag", r, c);
         });
       }
 
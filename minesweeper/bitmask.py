@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+import re
+from typing import Iterable, Iterator, Tuple
+
+# A mask is an immutable ``bytes`` bitset over row-major cell indices: cell ``i``
+# lives in bit ``i & 7`` of byte ``i >> 3``. Stored documents and the API keep
+# using strings of "0"/"1" characters; convert with ``from_str``/``to_str`` at
+# those edges only.
+
+_RUN = re.compile("1+")
+
+
+def nbytes(n: int) -> int:
+    return (n + 7) >> 3
+
+
+def empty(n: int) -> bytes:
+    return bytes(nbytes(n))
+
+
+def from_str(s: str) -> bytes:
+    n = len(s)
+    if n == 0:
+        return b""
+    return int(s[::-1], 2).to_bytes(nbytes(n), "little")
+
+
+def to_str(mask: bytes, n: int) -> str:
+    if n == 0:
+        return ""
+    return format(int.from_bytes(mask, "little"), f"0{n}b")[::-1]
+
+
+def test(mask: bytes | bytearray, i: int) -> bool:
+    return (mask[i >> 3] >> (i & 7)) & 1 == 1
+
+
+def set_bit(mask: bytearray, i: int) -> None:
+    mask[i >> 3] |= 1 << (i & 7)
+
+
+def with_bit(mask: bytes, i: int) -> bytes:
+    buf = bytearray(mask)
+    set_bit(buf, i)
+    return bytes(buf)
+
+
+def toggled(mask: bytes, i: int) -> bytes:
+    buf = bytearray(mask)
+    buf[i >> 3] ^= 1 << (i & 7)
+    return bytes(buf)
+
+
+def with_bits(mask: bytes, indices: Iterable[int]) -> bytes:
+    buf = bytearray(mask)
+    for i in indices:
+        buf[i >> 3] |= 1 << (i & 7)
+    return bytes(buf)
+
+
+def popcount(mask: bytes | bytearray) -> int:
+    return int.from_bytes(mask, "little").bit_count()
+
+
+def int_indices(value: int, base: int = 0) -> list[int]:
+    """Indices of the set bits of ``value``, offset by ``base``, ascending."""
+    bits = bin(value)[:1:-1]
+    out = []
+    i = bits.find("1")
+    while i != -1:
+        out.append(base + i)
+        i = bits.find("1", i + 1)
+    return out
+
+
+def iter_runs(mask: bytes, n: int) -> Iterator[Tuple[int, int]]:
+    """Yield ``(start, stop)`` for each run of consecutive set cells."""
+    for m in _RUN.finditer(to_str(mask, n)):
+        yield m.start(), m.end()
+
+
+def iter_set(mask: bytes, n: int) -> Iterator[int]:
+    for start, stop in iter_runs(mask, n):
+        yield from range(start, stop)
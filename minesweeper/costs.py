@@ -0,0 +1,358 @@
+"""Per-request accounting of Firestore document reads, writes and retries.
+
+The Firestore backends wrap their client in ``CountingClient``, which adds
+every document read, committed write and transaction retry to the ``Cost``
+of the operation in progress. ``tracking()`` starts one, usually per HTTP
+request; work done outside any, like the write-behind move log's flushes, is
+added to ``background``. Byte counts estimate Firestore's billed storage size
+of the documents read and of the fields written.
+"""
+from __future__ import annotations
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, fields
+from datetime import datetime
+from typing import Any, Dict, Iterator, Optional
+
+try:
+    from google.cloud.firestore_v1 import transforms  # type: ignore
+except Exception:  # pragma: no cover
+    transforms = None  # type: ignore
+
+COST_FIELDS = ("reads", "writes", "read_bytes", "write_bytes", "retries")
+
+
+@dataclass
+class Cost:
+    reads: int = 0
+    writes: int = 0
+    read_bytes: int = 0
+    write_bytes: int = 0
+    retries: int = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return {name: getattr(self, name) for name in COST_FIELDS}
+
+    def header(self) -> str:
+        return ", ".join(f"{name}={getattr(self, name)}" for name in COST_FIELDS)
+
+
+@dataclass(frozen=True)
+class CostBudget:
+    """Most documents a single request may read and write; ``None`` leaves that count unbounded."""
+
+    reads: Optional[int] = None
+    writes: Optional[int] = None
+
+    def exceeded(self, cost: Cost) -> list[str]:
+        """Names of the counts ``cost`` is over budget on."""
+        return [f.name for f in fields(self) if getattr(self, f.name) is not None and getattr(cost, f.name) > getattr(self, f.name)]
+
+
+class CostStats:
+    """Request costs by route: totals, the largest single request and budget overruns.
+
+    Not locked; requests are recorded from the event loop only.
+    """
+
+    def __init__(self, budgets: Optional[Dict[str, CostBudget]] = None) -> None:
+        self.budgets = budgets or {}
+        self._routes: Dict[str, Dict[str, Any]] = {}
+
+    def record(self, route: str, cost: Cost) -> list[str]:
+        """Add ``cost`` to ``route``'s totals; returns the counts it is over budget on."""
+        entry = self._routes.get(route)
+        if entry is None:
+            entry = self._routes[route] = {"requests": 0, "over_budget": 0, "total": Cost(), "max": Cost()}
+        entry["requests"] += 1
+        total, largest = entry["total"], entry["max"]
+        for name in COST_FIELDS:
+            value = getattr(cost, name)
+            setattr(total, name, getattr(total, name) + value)
+            if value > getattr(largest, name):
+                setattr(largest, name, value)
+        budget = self.budgets.get(route)
+        exceeded = budget.exceeded(cost) if budget is not None else []
+        if exceeded:
+            entry["over_budget"] += 1
+        return exceeded
+
+    def snapshot(self) -> Dict[str, Any]:
+        routes = {}
+        for route, entry in sorted(self._routes.items()):
+            budget = self.budgets.get(route)
+            routes[route] = {
+                "requests": entry["requests"],
+                "total": entry["total"].as_dict(),
+                "mean": {name: round(value / entry["requests"], 2) for name, value in entry["total"].as_dict().items()},
+                "max": entry["max"].as_dict(),
+                "budget": {f.name: getattr(budget, f.name) for f in fields(budget)} if budget else None,
+                "over_budget": entry["over_budget"],
+            }
+        return {"routes": routes, "background": background.as_dict()}
+
+
+# Only touched by the write-behind flusher thread and by work outside requests
+background = Cost()
+_current: ContextVar[Optional[Cost]] = ContextVar("persistence_cost", default=None)
+
+
+def current() -> Cost:
+    return _current.get() or background
+
+
+@contextmanager
+def tracking() -> Iterator[Cost]:
+    """Collect the cost of everything done inside the block, including in threads it hands work to."""
+    cost = Cost()
+    token = _current.set(cost)
+    try:
+        yield cost
+    finally:
+        _current.reset(token)
+
+
+def value_size(value: Any) -> int:
+    """Firestore storage size of a field value."""
+    if isinstance(value, str):
+        return len(value.encode("utf-8")) + 1
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if value is None or isinstance(value, bool):
+        return 1
+    if isinstance(value, (int, float, datetime)):
+        return 8
+    if isinstance(value, dict):
+        return map_size(value)
+    if isinstance(value, (list, tuple)):
+        return sum(value_size(v) for v in value)
+    if transforms is not None and isinstance(value, transforms.ArrayUnion):
+        return sum(value_size(v) for v in value.values)
+    # Increment, other transforms and sentinels
+    return 8
+
+
+def map_size(data: Dict[str, Any]) -> int:
+    return sum(len(key) + 1 + value_size(value) for key, value in data.items())
+
+
+def document_size(path: str, data: Optional[Dict[str, Any]]) -> int:
+    """Storage size of a document: its name, its fields and a fixed overhead."""
+    return sum(len(part) + 1 for part in path.split("/")) + 16 + map_size(data or {}) + 32
+
+
+def _read(snap) -> None:
+    cost = current()
+    cost.reads += 1
+    if snap.exists:
+        # _data rather than to_dict(), which deep-copies the document
+        cost.read_bytes += document_size(snap.reference.path, snap._data)
+
+
+def _raw(obj):
+    return obj._wrapped if isinstance(obj, _Counted) else obj
+
+
+class _Counted:
+    """Forwards everything it does not count to the wrapped client object."""
+
+    __slots__ = ("_wrapped", "_async")
+
+    def __init__(self, wrapped, is_async: bool) -> None:
+        self._wrapped = wrapped
+        self._async = is_async
+
+    def __getattr__(self, name: str):
+        return getattr(self._wrapped, name)
+
+    def _snapshots(self, snaps, empty_read: bool = True):
+        """Count ``snaps`` as they are consumed; a query that finds nothing still costs a read."""
+        if self._async:
+            return _counted_async(snaps, empty_read)
+        return _counted(snaps, empty_read)
+
+
+def _counted(snaps, empty_read: bool):
+    found = False
+    for snap in snaps:
+        found = True
+        _read(snap)
+        yield snap
+    if empty_read and not found:
+        current().reads += 1
+
+
+async def _counted_async(snaps, empty_read: bool):
+    found = False
+    async for snap in snaps:
+        found = True
+        _read(snap)
+        yield snap
+    if empty_read and not found:
+        current().reads += 1
+
+
+class CountingClient(_Counted):
+    """Firestore client, sync or async, that reports its document operations to ``current()``."""
+
+    __slots__ = ()
+
+    def collection(self, name: str) -> "_Collection":
+        return _Collection(self._wrapped.collection(name), self._async)
+
+    def document(self, path: str) -> "_Document":
+        return _Document(self._wrapped.document(path), self._async)
+
+    def get_all(self, references, transaction=None, **kwargs):
+        refs = [_raw(ref) for ref in references]
+        return self._snapshots(self._wrapped.get_all(refs, transaction=_raw(transaction), **kwargs), empty_read=False)
+
+    def transaction(self, **kwargs) -> "_Transaction":
+        return (_AsyncTransaction if self._async else _Transaction)(self._wrapped.transaction(**kwargs), self._async)
+
+    def batch(self) -> "_Batch":
+        return (_AsyncBatch if self._async else _Batch)(self._wrapped.batch(), self._async)
+
+
+class _Collection(_Counted):
+    __slots__ = ()
+
+    def document(self, document_id: Optional[str] = None) -> "_Document":
+        return _Document(self._wrapped.document(document_id), self._async)
+
+    def select(self, field_paths) -> "_Query":
+        return _Query(self._wrapped.select(field_paths), self._async)
+
+    def stream(self, transaction=None, **kwargs):
+        return self._snapshots(self._wrapped.stream(transaction=_raw(transaction), **kwargs))
+
+
+class _Query(_Counted):
+    __slots__ = ()
+
+    def stream(self, transaction=None, **kwargs):
+        return self._snapshots(self._wrapped.stream(transaction=_raw(transaction), **kwargs))
+
+
+class _Document(_Counted):
+    __slots__ = ()
+
+    def collection(self, name: str) -> _Collection:
+        return _Collection(self._wrapped.collection(name), self._async)
+
+    def get(self, transaction=None, **kwargs):
+        if self._async:
+            return self._get_async(transaction, **kwargs)
+        snap = self._wrapped.get(transaction=_raw(transaction), **kwargs)
+        _read(snap)
+        return snap
+
+    async def _get_async(self, transaction, **kwargs):
+        snap = await self._wrapped.get(transaction=_raw(transaction), **kwargs)
+        _read(snap)
+        return snap
+
+    def _written(self, result, data: Optional[Dict[str, Any]]):
+        """Count a write made outside a transaction or batch once ``result`` is done."""
+        if self._async:
+            return self._written_async(result, data)
+        cost = current()
+        cost.writes += 1
+        cost.write_bytes += document_size(self._wrapped.path, data)
+        return result
+
+    async def _written_async(self, result, data: Optional[Dict[str, Any]]):
+        result = await result
+        cost = current()
+        cost.writes += 1
+        cost.write_bytes += document_size(self._wrapped.path, data)
+        return result
+
+    def set(self, document_data, merge=False, **kwargs):
+        return self._written(self._wrapped.set(document_data, merge=merge, **kwargs), document_data)
+
+    def update(self, field_updates, **kwargs):
+        return self._written(self._wrapped.update(field_updates, **kwargs), field_updates)
+
+    def delete(self, **kwargs):
+        return self._written(self._wrapped.delete(**kwargs), None)
+
+
+class _Writes(_Counted):
+    """Buffered writes, counted once they commit."""
+
+    __slots__ = ("_writes", "_write_bytes")
+
+    def __init__(self, wrapped, is_async: bool) -> None:
+        super().__init__(wrapped, is_async)
+        self._writes = self._write_bytes = 0
+
+    def _buffer(self, reference, data: Optional[Dict[str, Any]]) -> None:
+        self._writes += 1
+        self._write_bytes += document_size(reference.path, data)
+
+    def _committed(self) -> None:
+        cost = current()
+        cost.writes += self._writes
+        cost.write_bytes += self._write_bytes
+        self._writes = self._write_bytes = 0
+
+    def set(self, reference, document_data, merge=False):
+        self._buffer(reference, document_data)
+        return self._wrapped.set(_raw(reference), document_data, merge=merge)
+
+    def update(self, reference, field_updates, option=None):
+        self._buffer(reference, field_updates)
+        return self._wrapped.update(_raw(reference), field_updates, option=option)
+
+    def delete(self, reference, option=None):
+        self._buffer(reference, None)
+        return self._wrapped.delete(_raw(reference), option=option)
+
+
+class _Transaction(_Writes):
+    """Driven by ``firestore.transactional``; retried attempts begin with a ``retry_id``."""
+
+    __slots__ = ()
+
+    def _clean_up(self) -> None:
+        self._writes = self._write_bytes = 0
+        self._wrapped._clean_up()
+
+    def _begin(self, retry_id=None):
+        if retry_id is not None:
+            current().retries += 1
+        return self._wrapped._begin(retry_id=retry_id)
+
+    def _commit(self):
+        result = self._wrapped._commit()
+        self._committed()
+        return result
+
+
+class _AsyncTransaction(_Transaction):
+    __slots__ = ()
+
+    async def _commit(self):  # type: ignore[override]
+        result = await self._wrapped._commit()
+        self._committed()
+        return result
+
+
+class _Batch(_Writes):
+    __slots__ = ()
+
+    def commit(self, **kwargs):
+        result = self._wrapped.commit(**kwargs)
+        self._committed()
+        return result
+
+
+class _AsyncBatch(_Batch):
+    __slots__ = ()
+
+    async def commit(self, **kwargs):  # type: ignore[override]
+        result = await self._wrapped.commit(**kwargs)
+        self._committed()
+        return result
@@ -0,0 +1,484 @@
+"""In-process stand-in for the Firestore clients, for tests and offline benchmarks.
+
+``FakeFirestoreClient`` and ``FakeAsyncFirestoreClient`` implement the part of
+``firestore.Client``/``AsyncClient`` the persistence backends use: collections,
+documents and subcollections, ``get``/``get_all``/``stream``/``select``,
+transactions driven by ``firestore.transactional``/``async_transactional``,
+write batches with update-time preconditions, and the ``Increment``,
+``ArrayUnion``, ``DELETE_FIELD`` and ``SERVER_TIMESTAMP`` transforms.
+
+Transactions are optimistic: commit fails with ``Aborted`` when a document the
+transaction read has changed since, and the decorator retries, as it does when
+Firestore aborts under contention. ``abort_rate`` injects extra aborts and
+``latency`` delays every round trip. ``counters()`` counts round trips, document
+reads and writes, commits, aborts and retries; ``track()`` collects the same
+counts for just the calls made inside it.
+"""
+from __future__ import annotations
+
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
+import asyncio
+import copy
+import random
+import threading
+import time
+
+try:
+    from google.api_core import exceptions as api_exceptions  # type: ignore
+    from google.cloud import firestore  # type: ignore
+    from google.cloud.firestore_v1 import transforms  # type: ignore
+except Exception:  # pragma: no cover
+    api_exceptions = None  # type: ignore
+    firestore = None  # type: ignore
+    transforms = None  # type: ignore
+
+Latency = Union[float, Callable[[str], float]]
+
+_EPOCH = datetime(2020, 1, 1, tzinfo=timezone.utc)
+# Counters of the innermost track() blocks active in this thread or task
+_tracking: ContextVar[Tuple[Counter, ...]] = ContextVar("fake_firestore_tracking", default=())
+
+
+@dataclass(frozen=True)
+class WritePrecondition:
+    last_update_time: Optional[datetime] = None
+    exists: Optional[bool] = None
+
+
+@dataclass
+class _Doc:
+    data: Dict[str, Any]
+    version: int
+    create_time: datetime
+    update_time: datetime
+
+
+class DocumentSnapshot:
+    def __init__(self, reference, doc: Optional[_Doc], fields: Optional[List[str]] = None) -> None:
+        self.reference = reference
+        self.id = reference.id
+        self.exists = doc is not None
+        self.create_time = doc.create_time if doc else None
+        self.update_time = doc.update_time if doc else None
+        data = doc.data if doc else None
+        if data is not None and fields is not None:
+            data = {k: v for k, v in data.items() if k in fields}
+        self._data = copy.deepcopy(data)
+
+    def to_dict(self) -> Optional[Dict[str, Any]]:
+        return copy.deepcopy(self._data)
+
+    def get(self, field: str) -> Any:
+        return (self._data or {}).get(field)
+
+
+def _apply_fields(target: Dict[str, Any], fields: Dict[str, Any], merge: bool, now: datetime) -> None:
+    for key, value in fields.items():
+        if value is firestore.DELETE_FIELD:
+            target.pop(key, None)
+        elif value is firestore.SERVER_TIMESTAMP:
+            target[key] = now
+        elif isinstance(value, transforms.Increment):
+            current = target.get(key)
+            target[key] = (current if isinstance(current, (int, float)) else 0) + value.value
+        elif isinstance(value, transforms.ArrayUnion):
+            current = list(target.get(key) or [])
+            current.extend(v for v in value.values if v not in current)
+            target[key] = current
+        elif merge and isinstance(value, dict):
+            nested = target.get(key)
+            if not isinstance(nested, dict):
+                nested = target[key] = {}
+            _apply_fields(nested, value, merge, now)
+        else:
+            target[key] = copy.deepcopy(value)
+
+
+class _Store:
+    """Documents by path plus the counters, shared by the sync and async clients."""
+
+    def __init__(self, latency: Latency, abort_rate: float, seed: Optional[int]) -> None:
+        self.latency = latency
+        self.abort_rate = abort_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        # collection path -> document id -> document
+        self._collections: Dict[str, Dict[str, _Doc]] = {}
+        self._version = 0
+        self._counters: Counter = Counter()
+        self._ids = 0
+
+    def delay(self, op: str) -> float:
+        return self.latency(op) if callable(self.latency) else self.latency
+
+    def count(self, **amounts: int) -> None:
+        with self._lock:
+            self._counters.update(amounts)
+        for counter in _tracking.get():
+            counter.update(amounts)
+
+    def counters(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counters)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+
+    def next_id(self) -> bytes:
+        with self._lock:
+            self._ids += 1
+            return self._ids.to_bytes(8, "big")
+
+    def dump(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {f"{c}/{i}": copy.deepcopy(d.data) for c, docs in self._collections.items() for i, d in docs.items()}
+
+    def lookup(self, path: str) -> Optional[_Doc]:
+        collection, _, doc_id = path.rpartition("/")
+        return self._collections.get(collection, {}).get(doc_id)
+
+    def read(self, path: str) -> Tuple[Optional[_Doc], int]:
+        with self._lock:
+            doc = self.lookup(path)
+            return doc, doc.version if doc else 0
+
+    def list(self, collection: str) -> List[Tuple[str, _Doc]]:
+        with self._lock:
+            docs = self._collections.get(collection, {})
+            return [(doc_id, docs[doc_id]) for doc_id in sorted(docs)]
+
+    def commit(self, writes: List[tuple], read_versions: Optional[Dict[str, int]] = None) -> None:
+        """Apply ``writes`` atomically; each is (op, path, data, merge, precondition)."""
+        with self._lock:
+            if read_versions is not None:
+                for path, version in read_versions.items():
+                    doc = self.lookup(path)
+                    if (doc.version if doc else 0) != version:
+                        self._counters["aborts"] += 1
+                        raise api_exceptions.Aborted(f"contention on {path}")
+                if writes and self.abort_rate and self._rng.random() < self.abort_rate:
+                    self._counters["aborts"] += 1
+                    raise api_exceptions.Aborted("injected abort")
+            for op, path, _, _, precondition in writes:
+                doc = self.lookup(path)
+                if op == "update" and doc is None:
+                    raise api_exceptions.NotFound(f"no document to update: {path}")
+                if precondition is not None:
+                    if precondition.exists is not None and precondition.exists != (doc is not None):
+                        raise api_exceptions.FailedPrecondition(f"exists precondition failed: {path}")
+                    if precondition.last_update_time is not None and (doc is None or doc.update_time != precondition.last_update_time):
+                        raise api_exceptions.FailedPrecondition(f"update time precondition failed: {path}")
+            self._version += 1
+            now = _EPOCH + timedelta(microseconds=self._version)
+            for op, path, data, merge, _ in writes:
+                collection, _, doc_id = path.rpartition("/")
+                docs = self._collections.setdefault(collection, {})
+                doc = docs.get(doc_id)
+                if op == "delete":
+                    docs.pop(doc_id, None)
+                    continue
+                if doc is None:
+                    doc = docs[doc_id] = _Doc({}, self._version, now, now)
+                elif op == "set" and not merge:
+                    doc.data = {}
+                _apply_fields(doc.data, data, merge or op == "update", now)
+                doc.version, doc.update_time = self._version, now
+            self._counters["writes"] += len(writes)
+        for counter in _tracking.get():
+            counter["writes"] += len(writes)
+
+
+class _Writes:
+    """Buffered writes of a transaction or batch."""
+
+    def __init__(self) -> None:
+        self._writes: List[tuple] = []
+
+    def set(self, reference, document_data: Dict[str, Any], merge: bool = False) -> None:
+        self._writes.append(("set", reference.path, copy.deepcopy(document_data), merge, None))
+
+    def update(self, reference, field_updates: Dict[str, Any], option: Optional[WritePrecondition] = None) -> None:
+        self._writes.append(("update", reference.path, copy.deepcopy(field_updates), True, option))
+
+    def delete(self, reference, option: Optional[WritePrecondition] = None) -> None:
+        self._writes.append(("delete", reference.path, None, False, option))
+
+
+class _Refs:
+    """Reference plumbing shared by document and collection references."""
+
+    def __init__(self, client, path: str) -> None:
+        self._client = client
+        self.path = path
+        self.id = path.rpartition("/")[2]
+
+
+class FakeCollectionReference(_Refs):
+    def document(self, document_id: Optional[str] = None) -> "FakeDocumentReference":
+        if document_id is None:
+            document_id = self._client.store.next_id().hex()
+        return self._client._document_class(self._client, f"{self.path}/{document_id}")
+
+    def select(self, field_paths) -> "FakeQuery":
+        return FakeQuery(self, list(field_paths))
+
+    def _snapshots(self, transaction=None, fields: Optional[List[str]] = None) -> List[DocumentSnapshot]:
+        store = self._client.store
+        listed = store.list(self.path)
+        store.count(queries=1, round_trips=1, reads=max(1, len(listed)))
+        if transaction is not None:
+            transaction._check_read()
+            for doc_id, doc in listed:
+                transaction._read_versions.setdefault(f"{self.path}/{doc_id}", doc.version)
+        return [DocumentSnapshot(self.document(doc_id), doc, fields) for doc_id, doc in listed]
+
+    def stream(self, transaction=None):
+        return self._client._iterate(lambda: self._snapshots(transaction), "stream")
+
+
+class FakeQuery:
+    def __init__(self, collection: FakeCollectionReference, fields: List[str]) -> None:
+        self._collection = collection
+        self._fields = fields
+
+    def stream(self, transaction=None):
+        return self._collection._client._iterate(lambda: self._collection._snapshots(transaction, self._fields), "stream")
+
+
+class FakeDocumentReference(_Refs):
+    def collection(self, name: str) -> FakeCollectionReference:
+        return FakeCollectionReference(self._client, f"{self.path}/{name}")
+
+    def _snapshot(self, transaction=None) -> DocumentSnapshot:
+        store = self._client.store
+        doc, version = store.read(self.path)
+        store.count(gets=1, round_trips=1, reads=1)
+        if transaction is not None:
+            transaction._check_read()
+            transaction._read_versions.setdefault(self.path, version)
+        return DocumentSnapshot(self, doc)
+
+    def _write(self, op: str, data: Optional[Dict[str, Any]], merge: bool = False) -> None:
+        store = self._client.store
+        store.count(commits=1, round_trips=1)
+        store.commit([(op, self.path, copy.deepcopy(data), merge, None)])
+
+    def get(self, transaction=None) -> DocumentSnapshot:
+        time.sleep(self._client.store.delay("get"))
+        return self._snapshot(transaction)
+
+    def set(self, document_data: Dict[str, Any], merge: bool = False) -> None:
+        time.sleep(self._client.store.delay("commit"))
+        self._write("set", document_data, merge)
+
+    def update(self, field_updates: Dict[str, Any]) -> None:
+        time.sleep(self._client.store.delay("commit"))
+        self._write("update", field_updates, True)
+
+    def delete(self) -> None:
+        time.sleep(self._client.store.delay("commit"))
+        self._write("delete", None)
+
+
+class FakeAsyncDocumentReference(FakeDocumentReference):
+    async def get(self, transaction=None) -> DocumentSnapshot:  # type: ignore[override]
+        await asyncio.sleep(self._client.store.delay("get"))
+        return self._snapshot(transaction)
+
+    async def set(self, document_data: Dict[str, Any], merge: bool = False) -> None:  # type: ignore[override]
+        await asyncio.sleep(self._client.store.delay("commit"))
+        self._write("set", document_data, merge)
+
+    async def update(self, field_updates: Dict[str, Any]) -> None:  # type: ignore[override]
+        await asyncio.sleep(self._client.store.delay("commit"))
+        self._write("update", field_updates, True)
+
+    async def delete(self) -> None:  # type: ignore[override]
+        await asyncio.sleep(self._client.store.delay("commit"))
+        self._write("delete", None)
+
+
+class FakeWriteBatch(_Writes):
+    def __init__(self, client) -> None:
+        super().__init__()
+        self._client = client
+
+    def _commit(self) -> None:
+        store = self._client.store
+        store.count(batch_commits=1, round_trips=1)
+        store.commit(self._writes)
+        self._writes = []
+
+    def commit(self) -> None:
+        time.sleep(self._client.store.delay("commit"))
+        self._commit()
+
+
+class FakeAsyncWriteBatch(FakeWriteBatch):
+    async def commit(self) -> None:  # type: ignore[override]
+        await asyncio.sleep(self._client.store.delay("commit"))
+        self._commit()
+
+
+class FakeTransaction(_Writes):
+    """Driven by ``firestore.transactional`` through the same private hooks as the real one."""
+
+    def __init__(self, client, max_attempts: int = 5, read_only: bool = False) -> None:
+        super().__init__()
+        self._client = client
+        self._max_attempts = max_attempts
+        self._read_only = read_only
+        self._id: Optional[bytes] = None
+        self._read_versions: Dict[str, int] = {}
+
+    @property
+    def in_progress(self) -> bool:
+        return self._id is not None
+
+    def _clean_up(self) -> None:
+        self._writes = []
+        self._read_versions = {}
+        self._id = None
+
+    def _check_read(self) -> None:
+        if self._writes:
+            raise firestore.ReadAfterWriteError("Attempted read after write in a transaction.")
+
+    def _begin_now(self, retry_id: Optional[bytes] = None) -> None:
+        if self.in_progress:
+            raise ValueError("transaction already in progress")
+        store = self._client.store
+        store.count(transactions=1, retries=int(retry_id is not None), round_trips=1)
+        self._id = store.next_id()
+
+    def _commit_now(self) -> None:
+        if not self.in_progress:
+            raise ValueError("no transaction in progress")
+        store = self._client.store
+        store.count(commits=1, round_trips=1)
+        try:
+            store.commit(self._writes, self._read_versions)
+        finally:
+            self._clean_up()
+
+    def _rollback_now(self) -> None:
+        if self.in_progress:
+            self._client.store.count(rollbacks=1, round_trips=1)
+        self._clean_up()
+
+    def _begin(self, retry_id: Optional[bytes] = None) -> None:
+        time.sleep(self._client.store.delay("begin"))
+        self._begin_now(retry_id)
+
+    def _commit(self) -> None:
+        time.sleep(self._client.store.delay("commit"))
+        self._commit_now()
+
+    def _rollback(self) -> None:
+        self._rollback_now()
+
+
+class FakeAsyncTransaction(FakeTransaction):
+    async def _begin(self, retry_id: Optional[bytes] = None) -> None:  # type: ignore[override]
+        await asyncio.sleep(self._client.store.delay("begin"))
+        self._begin_now(retry_id)
+
+    async def _commit(self) -> None:  # type: ignore[override]
+        await asyncio.sleep(self._client.store.delay("commit"))
+        self._commit_now()
+
+    async def _rollback(self) -> None:  # type: ignore[override]
+        self._rollback_now()
+
+
+class FakeFirestoreClient:
+    """Synchronous fake of ``firestore.Client``; see the module docstring."""
+
+    _document_class = FakeDocumentReference
+    _transaction_class = FakeTransaction
+    _batch_class = FakeWriteBatch
+
+    def __init__(self, latency: Latency = 0.0, abort_rate: float = 0.0, seed: Optional[int] = None, store: Optional[_Store] = None) -> None:
+        if firestore is None:
+            raise RuntimeError("google-cloud-firestore not available")
+        self.store = store if store is not None else _Store(latency, abort_rate, seed)
+
+    def collection(self, name: str) -> FakeCollectionReference:
+        return FakeCollectionReference(self, name)
+
+    def document(self, path: str) -> FakeDocumentReference:
+        return self._document_class(self, path)
+
+    def transaction(self, max_attempts: int = 5, read_only: bool = False) -> FakeTransaction:
+        return self._transaction_class(self, max_attempts=max_attempts, read_only=read_only)
+
+    def batch(self) -> FakeWriteBatch:
+        return self._batch_class(self)
+
+    def write_option(self, **kwargs) -> WritePrecondition:
+        return WritePrecondition(**kwargs)
+
+    def _get_all(self, references, transaction=None) -> List[DocumentSnapshot]:
+        references = list(references)
+        store = self.store
+        store.count(batch_gets=1, round_trips=1, reads=len(references))
+        if transaction is not None:
+            transaction._check_read()
+        snaps = []
+        for ref in references:
+            doc, version = store.read(ref.path)
+            if transaction is not None:
+                transaction._read_versions.setdefault(ref.path, version)
+            snaps.append(DocumentSnapshot(ref, doc))
+        return snaps
+
+    def get_all(self, references, transaction=None):
+        return self._iterate(lambda: self._get_all(references, transaction), "get_all")
+
+    def _iterate(self, fetch: Callable[[], List[DocumentSnapshot]], op: str) -> Iterator[DocumentSnapshot]:
+        time.sleep(self.store.delay(op))
+        return iter(fetch())
+
+    # Test and benchmark helpers, not part of the Firestore API
+
+    def counters(self) -> Dict[str, int]:
+        return self.store.counters()
+
+    def reset_counters(self) -> None:
+        self.store.reset()
+
+    @contextmanager
+    def track(self):
+        """Counter of the round trips, reads and writes made inside the block, by this thread or task."""
+        counter: Counter = Counter()
+        token = _tracking.set(_tracking.get() + (counter,))
+        try:
+            yield counter
+        finally:
+            _tracking.reset(token)
+
+    def dump(self) -> Dict[str, Dict[str, Any]]:
+        """Every stored document by path."""
+        return self.store.dump()
+
+
+class FakeAsyncFirestoreClient(FakeFirestoreClient):
+    """Asyncio fake of ``firestore.AsyncClient``; pass ``store`` to share documents with a sync fake."""
+
+    _document_class = FakeAsyncDocumentReference
+    _transaction_class = FakeAsyncTransaction
+    _batch_class = FakeAsyncWriteBatch
+
+    def _iterate(self, fetch: Callable[[], List[DocumentSnapshot]], op: str):  # type: ignore[override]
+        async def gen():
+            await asyncio.sleep(self.store.delay(op))
+            for snap in fetch():
+                yield snap
+
+        return gen()
@@ -2,9 +2,23 @@ from __future__ import annotations
 
 from dataclasses import dataclass, replace
 from typing import Tuple, List
+from array import array
+from collections.abc import Sequence
+from functools import lru_cache
+from itertools import chain
+import bisect
 import random
+import re
 from collections import deque
 
+try:
+    import numpy as np  # type: ignore
+except Exception:  # pragma: no cover
+    np = None  # type: ignore
+
+from . import bitmask
+from .metrics import ENGINE_SECONDS, timed
+
 
 @dataclass(frozen=True)
 class GameState:
@@ -12,12 +26,35 @@ class GameState:
     height: int
     num_mines: int
     mine_layout: str
-    revealed_mask: str
-    flag_mask: str
+    revealed_mask: bytes
+    flag_mask: bytes
     status: str
     moves_count: int
     mines_placed: bool
     rng_seed: int | None
+    # Running counters maintained by apply_reveal/apply_flag. Left as None they
+    # are recounted from the masks once, e.g. when loading a stored document.
+    revealed_count: int | None = None
+    flags_count: int | None = None
+    safe_left: int | None = None
+    # Index of the reveal that placed the mines; with rng_seed it determines mine_layout
+    first_click: int | None = None
+
+    def __post_init__(self) -> None:
+        if self.revealed_count is None:
+            object.__setattr__(self, "revealed_count", bitmask.popcount(self.revealed_mask))
+        if self.flags_count is None:
+            object.__setattr__(self, "flags_count", bitmask.popcount(self.flag_mask))
+        if self.safe_left is None:
+            revealed_mines = 0
+            if self.mines_placed:
+                revealed_mines = sum(1 for i in _mine_indices(self.mine_layout) if bitmask.test(self.revealed_mask, i))
+            safe_revealed = self.revealed_count - revealed_mines
+            object.__setattr__(self, "safe_left", self.cells - self.num_mines - safe_revealed)
+
+    @property
+    def cells(self) -> int:
+        return self.width * self.height
 
 
 def index(row: int, col: int, width: int) -> int:
@@ -28,43 +65,139 @@ def coords(idx: int, width: int) -> Tuple[int, int]:
     return divmod(idx, width)
 
 
-def _neighbors(r: int, c: int, w: int, h: int):
-    for nr in range(max(0, r - 1), min(h, r + 2)):
-        for nc in range(max(0, c - 1), min(w, c + 2)):
-            if nr == r and nc == c:
-                continue
-            yield nr, nc
+@dataclass(frozen=True)
+class NeighborTable:
+    """Row-major 8-neighbor indices of every cell, in CSR form.
+
+    The neighbors of cell ``i`` are ``neighbors[offsets[i]:offsets[i + 1]]``.
+    """
+
+    offsets: array
+    neighbors: array
+
+    def of(self, i: int) -> array:
+        return self.neighbors[self.offsets[i]:self.offsets[i + 1]]
+
+
+_NEIGHBOR_STEPS = [(dr, dc) for dr in (-1, 0, 1) for dc in (-1, 0, 1) if dr or dc]
+
+
+def _neighbor_table_numpy(width: int, height: int) -> NeighborTable:
+    rows, cols = np.divmod(np.arange(width * height, dtype=np.int64), width)
+    candidates = np.empty((width * height, 8), dtype=np.int64)
+    valid = np.empty((width * height, 8), dtype=bool)
+    for k, (dr, dc) in enumerate(_NEIGHBOR_STEPS):
+        nr, nc = rows + dr, cols + dc
+        valid[:, k] = (nr >= 0) & (nr < height) & (nc >= 0) & (nc < width)
+        candidates[:, k] = nr * width + nc
+    offsets = np.zeros(width * height + 1, dtype=np.uint32)
+    np.cumsum(valid.sum(axis=1), out=offsets[1:])
+    neighbors = candidates[valid].astype(np.uint32)
+    return NeighborTable(array("I", offsets.tobytes()), array("I", neighbors.tobytes()))
+
+
+@lru_cache(maxsize=16)
+def neighbor_table(width: int, height: int) -> NeighborTable:
+    if np is not None:
+        return _neighbor_table_numpy(width, height)
+    offsets = array("I", [0])
+    neighbors = array("I")
+    for r in range(height):
+        rows = range(max(0, r - 1), min(height, r + 2))
+        for c in range(width):
+            cols = range(max(0, c - 1), min(width, c + 2))
+            neighbors.extend([nr * width + nc for nr in rows for nc in cols if nr != r or nc != c])
+            offsets.append(len(neighbors))
+    return NeighborTable(offsets, neighbors)
 
 
 def _excluded_indices(row: int, col: int, width: int, height: int):
-    ex = {index(row, col, width)}
-    for nr, nc in _neighbors(row, col, width, height):
-        ex.add(index(nr, nc, width))
-    return ex
+    i = index(row, col, width)
+    return {i, *neighbor_table(width, height).of(i)}
+
+
+class _CellsExcept(Sequence):
+    """Ascending cell indices ``0..n-1`` minus ``excluded``, without building the list.
+
+    Behaves exactly like ``[i for i in range(n) if i not in excluded]`` for
+    ``random.Random.sample``, so mine placement for a given seed is unchanged.
+    """
+
+    def __init__(self, n: int, excluded: set[int]) -> None:
+        self._n = n
+        self._excluded = sorted(i for i in excluded if 0 <= i < n)
 
+    def __len__(self) -> int:
+        return self._n - len(self._excluded)
 
+    def __getitem__(self, j: int) -> int:  # type: ignore[override]
+        if j < 0:
+            j += len(self)
+        if not 0 <= j < len(self):
+            raise IndexError(j)
+        # the j-th kept index is j shifted past every excluded index at or below it
+        k = 0
+        while True:
+            shifted = j + k
+            k2 = bisect.bisect_right(self._excluded, shifted)
+            if k2 == k:
+                return shifted
+            k = k2
+
+    def __iter__(self):
+        bounds = [-1, *self._excluded, self._n]
+        return chain.from_iterable(range(a + 1, b) for a, b in zip(bounds, bounds[1:]))
+
+
+def _layout_from_mines_numpy(width: int, height: int, mines: list[int]) -> str:
+    grid = np.zeros(height * width, dtype=np.uint8)
+    grid[mines] = 1
+    grid = grid.reshape(height, width)
+    padded = np.pad(grid, 1)
+    counts = np.zeros((height, width), dtype=np.uint8)
+    for dr in (0, 1, 2):
+        for dc in (0, 1, 2):
+            if dr == 1 and dc == 1:
+                continue
+            counts += padded[dr:dr + height, dc:dc + width]
+    codes = counts + ord("0")
+    codes[grid == 1] = ord("M")
+    return codes.tobytes().decode("ascii")
+
+
+def _layout_from_mines_python(width: int, height: int, mines: list[int]) -> str:
+    cells = bytearray(b"0" * (width * height))
+    table = neighbor_table(width, height)
+    for m in mines:
+        for j in table.of(m):
+            cells[j] += 1
+    for m in mines:
+        cells[m] = ord("M")
+    return cells.decode("ascii")
+
+
+@timed(ENGINE_SECONDS, "_build_layout_with_mines")
 def _build_layout_with_mines(width: int, height: int, num_mines: int, excluded: set[int], rng_seed: int | None):
     n = width * height
-    available = [i for i in range(n) if i not in excluded]
+    available = _CellsExcept(n, excluded)
     if num_mines > len(available):
         raise ValueError("insufficient_space_for_mines")
     rng = random.Random(rng_seed)
-    mines = set(rng.sample(available, num_mines))
-    nums = [0] * n
-    for i in range(n):
-        if i in mines:
-            continue
-        r, c = coords(i, width)
-        cnt = 0
-        for nr in range(max(0, r - 1), min(height, r + 2)):
-            for nc in range(max(0, c - 1), min(width, c + 2)):
-                if nr == r and nc == c:
-                    continue
-                if index(nr, nc, width) in mines:
-                    cnt += 1
-        nums[i] = cnt
-    layout = ["M" if i in mines else str(nums[i]) for i in range(n)]
-    return "".join(layout)
+    mines = rng.sample(available, num_mines)
+    if np is not None:
+        return _layout_from_mines_numpy(width, height, mines)
+    return _layout_from_mines_python(width, height, mines)
+
+
+@lru_cache(maxsize=1024)
+def derived_layout(width: int, height: int, num_mines: int, rng_seed: int, first_click: int) -> str:
+    """Regenerate the layout placed by the first reveal at ``first_click``.
+
+    Placement is deterministic for a given seed, so stored games may keep only
+    the seed and the first click; the cache spares active games a rebuild per move.
+    """
+    row, col = coords(first_click, width)
+    return _build_layout_with_mines(width, height, num_mines, _excluded_indices(row, col, width, height), rng_seed)
 
 
 def _min_safe_zone_size(width: int, height: int) -> int:
@@ -81,137 +214,279 @@ def generate_new_game(width: int, height: int, num_mines: int, rng_seed: int | N
     if num_mines > max_mines:
         raise ValueError("too_many_mines_for_board")
     layout = "0" * n
-    revealed = "0" * n
-    flags = "0" * n
+    revealed = bitmask.empty(n)
+    flags = bitmask.empty(n)
     return GameState(width, height, num_mines, layout, revealed, flags, "active", 0, False, rng_seed)
 
 
-def _count(mask: str) -> int:
-    return mask.count("1")
+def _mine_indices(mine_layout: str):
+    i = mine_layout.find("M")
+    while i != -1:
+        yield i
+        i = mine_layout.find("M", i + 1)
 
 
-def is_win(mine_layout: str, revealed_mask: str) -> bool:
-    if len(mine_layout) != len(revealed_mask):
+def is_win(mine_layout: str, revealed_mask: bytes) -> bool:
+    n = len(mine_layout)
+    if len(revealed_mask) != bitmask.nbytes(n):
         return False
-    for i, ch in enumerate(mine_layout):
-        if ch != "M" and revealed_mask[i] != "1":
-            return False
-    return True
+    mines = 0
+    revealed_mines = 0
+    for i in _mine_indices(mine_layout):
+        mines += 1
+        if bitmask.test(revealed_mask, i):
+            revealed_mines += 1
+    return bitmask.popcount(revealed_mask) - revealed_mines == n - mines
+
+
+def _result(s: GameState, hit_mine: bool = False, cleared: int = 0, changed: List[List] | None = None):
+    # ``changed`` lists [index, client value] for every cell whose to_client_view
+    # value differs from before the move.
+    return {
+        "hit_mine": hit_mine,
+        "cleared_cells": cleared,
+        "status_after": s.status,
+        "revealed_total": s.revealed_count,
+        "flags_total": s.flags_count,
+        "changed": changed if changed is not None else [],
+    }
+
+
+_ZERO_RUN = re.compile("0+")
+
 
+@dataclass(frozen=True)
+class ZeroRegions:
+    """Connected zero areas of a placed layout, each with its numbered border.
+
+    ``labels[i]`` is ``region + 1`` for a zero cell and 0 otherwise. Each entry
+    of ``regions`` is ``(lo, zeros, opened)``: bitmasks of the region's zero
+    cells and of everything revealing one of them opens, clipped to the bytes
+    ``lo:lo + len(zeros)`` of a full board mask.
+    """
+
+    labels: array
+    regions: List[Tuple[int, bytes, bytes]]
+
+
+@lru_cache(maxsize=128)
+def zero_regions(width: int, height: int, mine_layout: str) -> ZeroRegions:
+    # Label row runs of "0" and union runs that touch across rows (8-connected)
+    runs: List[Tuple[int, int, int]] = []
+    parent: List[int] = []
+
+    def find(x: int) -> int:
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    prev: List[int] = []
+    for r in range(height):
+        cur: List[int] = []
+        k = 0
+        for m in _ZERO_RUN.finditer(mine_layout, r * width, (r + 1) * width):
+            a, b = m.start() - r * width, m.end() - r * width
+            rid = len(runs)
+            runs.append((r, a, b))
+            parent.append(rid)
+            while k < len(prev) and runs[prev[k]][2] < a:
+                k += 1
+            j = k
+            while j < len(prev) and runs[prev[j]][1] <= b:
+                ra, rb = find(rid), find(prev[j])
+                if ra != rb:
+                    parent[ra] = rb
+                j += 1
+            cur.append(rid)
+        prev = cur
+
+    members: dict[int, List[Tuple[int, int, int]]] = {}
+    for rid, run in enumerate(runs):
+        members.setdefault(find(rid), []).append(run)
+
+    typecode = "H" if len(members) < 0xFFFF else "I"
+    labels = array(typecode, [0]) * (width * height)
+    regions: List[Tuple[int, bytes, bytes]] = []
+    for label, region_runs in enumerate(members.values(), start=1):
+        top = max(0, region_runs[0][0] - 1)
+        bottom = min(height, region_runs[-1][0] + 2)
+        # Build both masks row by row as width-bit ints, then stack the rows
+        zero_rows: dict[int, int] = {}
+        open_rows: dict[int, int] = {}
+        for r, a, b in region_runs:
+            labels[r * width + a:r * width + b] = array(typecode, [label]) * (b - a)
+            zero_rows[r] = zero_rows.get(r, 0) | ((1 << b) - (1 << a))
+            span = (1 << min(width, b + 1)) - (1 << max(0, a - 1))
+            for nr in range(max(0, r - 1), min(height, r + 2)):
+                open_rows[nr] = open_rows.get(nr, 0) | span
+        lo = (top * width) >> 3
+        size = bitmask.nbytes(bottom * width) - lo
+        shift = top * width - (lo << 3)
+        zeros = opened = 0
+        for r in range(bottom - 1, top - 1, -1):
+            zeros = (zeros << width) | zero_rows.get(r, 0)
+            opened = (opened << width) | open_rows.get(r, 0)
+        regions.append((lo, (zeros << shift).to_bytes(size, "little"), (opened << shift).to_bytes(size, "little")))
+    return ZeroRegions(labels, regions)
+
+
+def _open_zero_region(s: GameState, rev: bytearray, i: int) -> List[int] | None:
+    """Reveal the precomputed region around zero cell ``i`` in ``rev``.
+
+    Returns the newly revealed cell indices, or None when a flag sits on one of
+    the region's zero cells; that flag splits the area, so the caller falls back
+    to a flood fill.
+    """
+    regions = zero_regions(s.width, s.height, s.mine_layout)
+    lo, zeros, opened = regions.regions[regions.labels[i] - 1]
+    hi = lo + len(zeros)
+    flags = int.from_bytes(s.flag_mask[lo:hi], "little")
+    if int.from_bytes(zeros, "little") & flags:
+        return None
+    before = int.from_bytes(rev[lo:hi], "little")
+    new = int.from_bytes(opened, "little") & ~before & ~flags
+    rev[lo:hi] = (before | new).to_bytes(hi - lo, "little")
+    return bitmask.int_indices(new, lo << 3)
+
+
+def _flood_fill(s: GameState, rev: bytearray, row: int, col: int) -> List[int]:
+    ml = s.mine_layout
+    flags = s.flag_mask
+    table = neighbor_table(s.width, s.height)
+    opened: List[int] = []
+    q = deque()
+    q.append(index(row, col, s.width))
+    while q:
+        ii = q.popleft()
+        if bitmask.test(rev, ii) or bitmask.test(flags, ii):
+            continue
+        bitmask.set_bit(rev, ii)
+        opened.append(ii)
+        if ml[ii] == "0":
+            for jj in table.of(ii):
+                if not bitmask.test(rev, jj) and not bitmask.test(flags, jj):
+                    q.append(jj)
+    return opened
 
+
+@timed(ENGINE_SECONDS, "apply_reveal")
 def apply_reveal(s: GameState, row: int, col: int):
     if s.status != "active":
-        return s, {
-            "hit_mine": False,
-            "cleared_cells": 0,
-            "status_after": s.status,
-            "revealed_total": _count(s.revealed_mask),
-            "flags_total": _count(s.flag_mask),
-        }
+        return s, _result(s)
     if not (0 <= row < s.height and 0 <= col < s.width):
         raise ValueError("out of bounds")
     i = index(row, col, s.width)
-    if s.revealed_mask[i] == "1" or s.flag_mask[i] == "1":
-        return s, {
-            "hit_mine": False,
-            "cleared_cells": 0,
-            "status_after": s.status,
-            "revealed_total": _count(s.revealed_mask),
-            "flags_total": _count(s.flag_mask),
-        }
+    if bitmask.test(s.revealed_mask, i) or bitmask.test(s.flag_mask, i):
+        return s, _result(s)
     if not s.mines_placed:
         excluded = _excluded_indices(row, col, s.width, s.height)
         layout = _build_layout_with_mines(s.width, s.height, s.num_mines, excluded, s.rng_seed)
-        s = replace(s, mine_layout=layout, mines_placed=True)
+        s = replace(s, mine_layout=layout, mines_placed=True, first_click=i)
     ml = s.mine_layout
-    rev = list(s.revealed_mask)
-    cleared = 0
     if ml[i] == "M":
-        if rev[i] != "1":
-            rev[i] = "1"
-            cleared = 1
-        new_rev = "".join(rev)
-        new_status = "lost"
-        ns = replace(s, revealed_mask=new_rev, status=new_status, moves_count=s.moves_count + 1)
-        return ns, {
-            "hit_mine": True,
-            "cleared_cells": cleared,
-            "status_after": new_status,
-            "revealed_total": _count(new_rev),
-            "flags_total": _count(s.flag_mask),
-        }
-    q = deque()
-    q.append((row, col))
-    while q:
-        r, c = q.popleft()
-        ii = index(r, c, s.width)
-        if rev[ii] == "1" or s.flag_mask[ii] == "1":
+        new_rev = bitmask.with_bit(s.revealed_mask, i)
+        ns = replace(
+            s,
+            revealed_mask=new_rev,
+            status="lost",
+            moves_count=s.moves_count + 1,
+            revealed_count=s.revealed_count + 1,
+        )
+        changed = [[j, "M"] for j in _mine_indices(ml)]
+        return ns, _result(ns, hit_mine=True, cleared=1, changed=changed)
+    rev = bytearray(s.revealed_mask)
+    opened = _open_zero_region(s, rev, i) if ml[i] == "0" else None
+    if opened is None:
+        opened = _flood_fill(s, rev, row, col)
+    cleared = len(opened)
+    changed = [[j, ml[j]] for j in opened]
+    safe_left = s.safe_left - cleared
+    new_status = "won" if safe_left == 0 else "active"
+    if new_status == "won":
+        changed.extend([j, "M"] for j in _mine_indices(ml))
+    ns = replace(
+        s,
+        revealed_mask=bytes(rev),
+        status=new_status,
+        moves_count=s.moves_count + 1,
+        revealed_count=s.revealed_count + cleared,
+        safe_left=safe_left,
+    )
+    return ns, _result(ns, cleared=cleared, changed=changed)
+
+
+def apply_chord(s: GameState, row: int, col: int):
+    """Reveal every unflagged hidden neighbor of a revealed number whose flags are all placed.
+
+    Counts as a single move; does nothing unless the number of flagged neighbors
+    equals the cell's number.
+    """
+    if s.status != "active":
+        return s, _result(s)
+    if not (0 <= row < s.height and 0 <= col < s.width):
+        raise ValueError("out of bounds")
+    i = index(row, col, s.width)
+    ch = s.mine_layout[i]
+    if not bitmask.test(s.revealed_mask, i) or ch in "0M":
+        return s, _result(s)
+    neighbors = neighbor_table(s.width, s.height).of(i)
+    if sum(1 for j in neighbors if bitmask.test(s.flag_mask, j)) != int(ch):
+        return s, _result(s)
+    moves_before = s.moves_count
+    hit_mine = False
+    cleared = 0
+    changed: List[List] = []
+    for j in neighbors:
+        if bitmask.test(s.revealed_mask, j) or bitmask.test(s.flag_mask, j):
             continue
-        rev[ii] = "1"
-        cleared += 1
-        if ml[ii] == "0":
-            for nr, nc in _neighbors(r, c, s.width, s.height):
-                jj = index(nr, nc, s.width)
-                if rev[jj] != "1" and s.flag_mask[jj] != "1":
-                    q.append((nr, nc))
-    new_rev = "".join(rev)
-    new_status = "won" if is_win(ml, new_rev) else "active"
-    ns = replace(s, revealed_mask=new_rev, status=new_status, moves_count=s.moves_count + 1)
-    return ns, {
-        "hit_mine": False,
-        "cleared_cells": cleared,
-        "status_after": new_status,
-        "revealed_total": _count(new_rev),
-        "flags_total": _count(s.flag_mask),
-    }
+        s, res = apply_reveal(s, *coords(j, s.width))
+        hit_mine = hit_mine or res["hit_mine"]
+        cleared += res["cleared_cells"]
+        changed.extend(res["changed"])
+        if s.status != "active":
+            break
+    if cleared == 0:
+        return s, _result(s)
+    s = replace(s, moves_count=moves_before + 1)
+    return s, _result(s, hit_mine=hit_mine, cleared=cleared, changed=changed)
 
 
 def apply_flag(s: GameState, row: int, col: int):
     if s.status != "active":
-        return s, {
-            "hit_mine": False,
-            "cleared_cells": 0,
-            "status_after": s.status,
-            "revealed_total": _count(s.revealed_mask),
-            "flags_total": _count(s.flag_mask),
-        }
+        return s, _result(s)
     if not (0 <= row < s.height and 0 <= col < s.width):
         raise ValueError("out of bounds")
     i = index(row, col, s.width)
-    if s.revealed_mask[i] == "1":
-        return s, {
-            "hit_mine": False,
-            "cleared_cells": 0,
-            "status_after": s.status,
-            "revealed_total": _count(s.revealed_mask),
-            "flags_total": _count(s.flag_mask),
-        }
-    flags = list(s.flag_mask)
-    flags[i] = "0" if flags[i] == "1" else "1"
-    new_flags = "".join(flags)
-    ns = replace(s, flag_mask=new_flags)
-    return ns, {
-        "hit_mine": False,
-        "cleared_cells": 0,
-        "status_after": ns.status,
-        "revealed_total": _count(s.revealed_mask),
-        "flags_total": _count(new_flags),
-    }
+    if bitmask.test(s.revealed_mask, i):
+        return s, _result(s)
+    was_flagged = bitmask.test(s.flag_mask, i)
+    ns = replace(
+        s,
+        flag_mask=bitmask.toggled(s.flag_mask, i),
+        flags_count=s.flags_count + (-1 if was_flagged else 1),
+    )
+    return ns, _result(ns, changed=[[i, "H" if was_flagged else "F"]])
+
+
+@timed(ENGINE_SECONDS, "to_client_string")
+def to_client_string(s: GameState) -> str:
+    """The client board as one row-major string, one character per cell."""
+    n = s.cells
+    cells = bytearray(b"H" * n)
+    for start, stop in bitmask.iter_runs(s.flag_mask, n):
+        cells[start:stop] = b"F" * (stop - start)
+    layout = s.mine_layout.encode("ascii")
+    for start, stop in bitmask.iter_runs(s.revealed_mask, n):
+        cells[start:stop] = layout[start:stop]
+    if s.status != "active":
+        for i in _mine_indices(s.mine_layout):
+            cells[i] = ord("M")
+    return cells.decode("ascii")
 
 
+@timed(ENGINE_SECONDS, "to_client_view")
 def to_client_view(s: GameState) -> List[List[str]]:
-    board: List[List[str]] = []
-    for r in range(s.height):
-        row: List[str] = []
-        for c in range(s.width):
-            i = index(r, c, s.width)
-            ch = s.mine_layout[i]
-            if s.status != "active" and ch == "M":
-                cell = "M"
-            elif s.revealed_mask[i] == "1":
-                cell = ch
-            else:
-                cell = "F" if s.flag_mask[i] == "1" else "H"
-            row.append(cell)
-        board.append(row)
-    return board
+    flat = to_client_string(s)
+    w = s.width
+    return [list(flat[r * w:(r + 1) * w]) for r in range(s.height)]
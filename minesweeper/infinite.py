@@ -0,0 +1,197 @@
+from __future__ import annotations
+
+from collections import deque
+from dataclasses import dataclass, replace
+from functools import lru_cache
+from typing import Callable, Dict, FrozenSet, List, Optional, Set, Tuple
+import random
+
+from . import bitmask
+
+# Unbounded boards are split into CHUNK x CHUNK squares. Mines of a chunk are a
+# pure function of (rng_seed, mines_per_chunk, origin, chunk coordinates), so
+# only chunks the player revealed or flagged in ever need to be stored.
+CHUNK = 16
+CHUNK_CELLS = CHUNK * CHUNK
+# Cap on cells opened by one reveal; low densities can percolate without end.
+MAX_OPEN_PER_MOVE = 10_000
+
+Chunk = Tuple[int, int]
+ChunkLoader = Callable[[int, int], Optional[Tuple[bytes, bytes]]]
+
+
+@dataclass(frozen=True)
+class InfiniteGameState:
+    rng_seed: int
+    mines_per_chunk: int
+    # First revealed cell; its 3x3 neighborhood never holds a mine
+    origin: Tuple[int, int] | None
+    status: str
+    moves_count: int
+    revealed_count: int
+    flags_count: int
+
+
+def chunk_of(row: int, col: int) -> Chunk:
+    return row // CHUNK, col // CHUNK
+
+
+def _local(row: int, col: int) -> int:
+    return (row % CHUNK) * CHUNK + (col % CHUNK)
+
+
+@lru_cache(maxsize=4096)
+def _chunk_mines(rng_seed: int, mines_per_chunk: int, origin: Tuple[int, int] | None, crow: int, ccol: int) -> FrozenSet[int]:
+    rng = random.Random(f"{rng_seed}:{crow}:{ccol}")
+    mines = set(rng.sample(range(CHUNK_CELLS), mines_per_chunk))
+    if origin is not None:
+        orow, ocol = origin
+        for r in range(orow - 1, orow + 2):
+            for c in range(ocol - 1, ocol + 2):
+                if chunk_of(r, c) == (crow, ccol):
+                    mines.discard(_local(r, c))
+    return frozenset(mines)
+
+
+@lru_cache(maxsize=4096)
+def chunk_layout(rng_seed: int, mines_per_chunk: int, origin: Tuple[int, int] | None, crow: int, ccol: int) -> str:
+    """The chunk's cells as "0".."8"/"M", row-major, like ``GameState.mine_layout``."""
+    cells = bytearray(b"0" * CHUNK_CELLS)
+    top, left = crow * CHUNK, ccol * CHUNK
+    for dr in (-1, 0, 1):
+        for dc in (-1, 0, 1):
+            for m in _chunk_mines(rng_seed, mines_per_chunk, origin, crow + dr, ccol + dc):
+                mr = (crow + dr) * CHUNK + m // CHUNK
+                mc = (ccol + dc) * CHUNK + m % CHUNK
+                for r in range(max(top, mr - 1), min(top + CHUNK, mr + 2)):
+                    for c in range(max(left, mc - 1), min(left + CHUNK, mc + 2)):
+                        if (r, c) != (mr, mc):
+                            cells[(r - top) * CHUNK + (c - left)] += 1
+    for m in _chunk_mines(rng_seed, mines_per_chunk, origin, crow, ccol):
+        cells[m] = ord("M")
+    return cells.decode("ascii")
+
+
+class ChunkMasks:
+    """Revealed and flag bitmasks of one chunk, loaded lazily and tracked for writing."""
+
+    def __init__(self, load: ChunkLoader) -> None:
+        self._load = load
+        self.chunks: Dict[Chunk, Tuple[bytearray, bytearray]] = {}
+        self.dirty: Set[Chunk] = set()
+
+    def get(self, chunk: Chunk) -> Tuple[bytearray, bytearray]:
+        masks = self.chunks.get(chunk)
+        if masks is None:
+            stored = self._load(*chunk)
+            if stored is None:
+                stored = (bitmask.empty(CHUNK_CELLS), bitmask.empty(CHUNK_CELLS))
+            masks = (bytearray(stored[0]), bytearray(stored[1]))
+            self.chunks[chunk] = masks
+        return masks
+
+    def changed_chunks(self) -> Dict[Chunk, Tuple[bytes, bytes]]:
+        """Masks of every chunk modified since loading."""
+        return {c: (bytes(self.chunks[c][0]), bytes(self.chunks[c][1])) for c in self.dirty}
+
+
+def new_game(mines_per_chunk: int, rng_seed: int | None = None) -> InfiniteGameState:
+    if not 1 <= mines_per_chunk <= CHUNK_CELLS - 9:
+        raise ValueError("invalid mine count")
+    if rng_seed is None:
+        rng_seed = random.SystemRandom().randrange(1 << 62)
+    return InfiniteGameState(rng_seed, mines_per_chunk, None, "active", 0, 0, 0)
+
+
+def _layout_at(s: InfiniteGameState, row: int, col: int) -> str:
+    crow, ccol = chunk_of(row, col)
+    return chunk_layout(s.rng_seed, s.mines_per_chunk, s.origin, crow, ccol)[_local(row, col)]
+
+
+def may_cascade(s: InfiniteGameState, row: int, col: int) -> bool:
+    """Whether revealing (row, col) can open cells around it, known before any chunk is read.
+
+    True for the first reveal, which places the origin, and for a zero cell.
+    """
+    return s.status == "active" and (s.origin is None or _layout_at(s, row, col) == "0")
+
+
+def _result(s: InfiniteGameState, hit_mine: bool = False, cleared: int = 0, changed: List[List] | None = None):
+    # ``changed`` lists [row, col, client value] for every cell the move changed
+    return {
+        "hit_mine": hit_mine,
+        "cleared_cells": cleared,
+        "status_after": s.status,
+        "revealed_total": s.revealed_count,
+        "flags_total": s.flags_count,
+        "changed": changed if changed is not None else [],
+    }
+
+
+def apply_reveal(s: InfiniteGameState, masks: ChunkMasks, row: int, col: int):
+    if s.status != "active":
+        return s, _result(s)
+    rev, flags = masks.get(chunk_of(row, col))
+    i = _local(row, col)
+    if bitmask.test(rev, i) or bitmask.test(flags, i):
+        return s, _result(s)
+    if s.origin is None:
+        s = replace(s, origin=(row, col))
+    if _layout_at(s, row, col) == "M":
+        bitmask.set_bit(rev, i)
+        masks.dirty.add(chunk_of(row, col))
+        ns = replace(s, status="lost", moves_count=s.moves_count + 1, revealed_count=s.revealed_count + 1)
+        return ns, _result(ns, hit_mine=True, cleared=1, changed=[[row, col, "M"]])
+    changed: List[List] = []
+    q = deque([(row, col)])
+    while q and len(changed) < MAX_OPEN_PER_MOVE:
+        r, c = q.popleft()
+        chunk = chunk_of(r, c)
+        rev, flags = masks.get(chunk)
+        j = _local(r, c)
+        if bitmask.test(rev, j) or bitmask.test(flags, j):
+            continue
+        bitmask.set_bit(rev, j)
+        masks.dirty.add(chunk)
+        value = _layout_at(s, r, c)
+        changed.append([r, c, value])
+        if value == "0":
+            for nr in (r - 1, r, r + 1):
+                for nc in (c - 1, c, c + 1):
+                    if (nr, nc) != (r, c):
+                        q.append((nr, nc))
+    ns = replace(s, moves_count=s.moves_count + 1, revealed_count=s.revealed_count + len(changed))
+    return ns, _result(ns, cleared=len(changed), changed=changed)
+
+
+def apply_flag(s: InfiniteGameState, masks: ChunkMasks, row: int, col: int):
+    if s.status != "active":
+        return s, _result(s)
+    chunk = chunk_of(row, col)
+    rev, flags = masks.get(chunk)
+    i = _local(row, col)
+    if bitmask.test(rev, i):
+        return s, _result(s)
+    was_flagged = bitmask.test(flags, i)
+    flags[i >> 3] ^= 1 << (i & 7)
+    masks.dirty.add(chunk)
+    ns = replace(s, flags_count=s.flags_count + (-1 if was_flagged else 1))
+    return ns, _result(ns, changed=[[row, col, "H" if was_flagged else "F"]])
+
+
+def view(s: InfiniteGameState, masks: ChunkMasks, row: int, col: int, height: int, width: int) -> List[str]:
+    """Client rows of the window with top-left cell (row, col), one character per cell."""
+    rows: List[str] = []
+    for r in range(row, row + height):
+        out = []
+        for c in range(col, col + width):
+            rev, flags = masks.get(chunk_of(r, c))
+            i = _local(r, c)
+            if s.status != "active" and s.origin is not None and _layout_at(s, r, c) == "M":
+                out.append("M")
+            elif bitmask.test(rev, i):
+                out.append(_layout_at(s, r, c))
+            else:
+                out.append("F" if bitmask.test(flags, i) else "H")
+        rows.append("".join(out))
+    return rows
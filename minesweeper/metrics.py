@@ -0,0 +1,238 @@
+"""Counters, gauges and histograms in the Prometheus text exposition format.
+
+Recording is a lock and a few additions, cheap enough for the move path;
+label lookups can be hoisted out of hot code by keeping the child from
+``labels()``. Values that already live elsewhere, like per-route persistence
+costs or the number of active games, are read at scrape time by collectors
+instead of being mirrored on every request.
+"""
+from __future__ import annotations
+
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+import functools
+import math
+import threading
+import time
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; requests and storage calls
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Seconds; in-process engine work
+ENGINE_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.1)
+
+# (metric name suffix, label values, value); collectors yield these at scrape time
+Sample = Tuple[str, Tuple[str, ...], float]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)) + "}"
+
+
+class _Family:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values: str):
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} takes labels {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(values, self._child())
+        return child
+
+    def _child(self):
+        raise NotImplementedError
+
+    def samples(self) -> Iterable[Sample]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, values, value in self.samples():
+            names = self.labelnames + (("le",) if suffix == "_bucket" else ())
+            lines.append(f"{self.name}{suffix}{_labels(names, values)} {_format_value(value)}")
+        return lines
+
+
+class _Value:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self) -> None:
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class Counter(_Family):
+    kind = "counter"
+
+    def _child(self) -> _Value:
+        return _Value()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def samples(self) -> Iterable[Sample]:
+        for values, child in list(self._children.items()):
+            yield "_total", values, child.value
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.labels().dec(amount)
+
+    def samples(self) -> Iterable[Sample]:
+        for values, child in list(self._children.items()):
+            yield "", values, child.value
+
+
+class _Observations:
+    __slots__ = ("buckets", "counts", "sum", "_lock")
+
+    def __init__(self, buckets: Tuple[float, ...]) -> None:
+        self.buckets = buckets
+        # Per bucket, not cumulative; the last one is +Inf
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+
+class Histogram(_Family):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> None:
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _child(self) -> _Observations:
+        return _Observations(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def samples(self) -> Iterable[Sample]:
+        for values, child in list(self._children.items()):
+            with child._lock:
+                counts, total = list(child.counts), child.sum
+            running = 0
+            for bound, n in zip(self.buckets + (math.inf,), counts):
+                running += n
+                yield "_bucket", values + (_format_value(bound),), running
+            yield "_sum", values, total
+            yield "_count", values, running
+
+
+class Collected(_Family):
+    """A family whose samples come from ``collect()`` at scrape time."""
+
+    def __init__(self, name: str, help: str, kind: str, labelnames: Sequence[str], collect: Callable[[], Iterable[Sample]]) -> None:
+        super().__init__(name, help, labelnames)
+        self.kind = kind
+        self._collect = collect
+
+    def samples(self) -> Iterable[Sample]:
+        return self._collect()
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._families: Dict[str, _Family] = {}
+        self._lock = threading.Lock()
+
+    def register(self, family: _Family) -> _Family:
+        with self._lock:
+            self._families[family.name] = family
+        return family
+
+    def unregister(self, name: str) -> None:
+        with self._lock:
+            self._families.pop(name, None)
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help, labelnames))  # type: ignore[return-value]
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, help, labelnames))  # type: ignore[return-value]
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, buckets))  # type: ignore[return-value]
+
+    def collected(self, name: str, help: str, kind: str, labelnames: Sequence[str], collect: Callable[[], Iterable[Sample]]) -> Collected:
+        return self.register(Collected(name, help, kind, labelnames, collect))  # type: ignore[return-value]
+
+    def render(self) -> str:
+        with self._lock:
+            families = sorted(self._families.values(), key=lambda f: f.name)
+        lines: List[str] = []
+        for family in families:
+            lines.extend(family.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+ENGINE_SECONDS = REGISTRY.histogram(
+    "minesweeper_engine_seconds",
+    "Time spent in game engine functions.",
+    ("function",),
+    buckets=ENGINE_BUCKETS,
+)
+
+
+def timed(histogram: Histogram, *labels: str):
+    """Decorator observing each call's duration in ``histogram`` under ``labels``."""
+    child = histogram.labels(*labels)
+
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                child.observe(time.perf_counter() - start)
+
+        return wrapper
+
+    return decorate
@@ -0,0 +1,120 @@
+"""Rewrite stored game documents into the compact board encoding.
+
+    python -m minesweeper.migrate_boards [--workers 8] [--batch-size 200] [--dry-run]
+
+Safe to run while the service is live. Each document is written with a
+precondition on the update time it was read at. When a batch fails because a
+player moved in the meantime, its documents are migrated one by one in
+transactions instead. Documents already in ``BOARD_ENCODING`` are skipped, so
+an interrupted run can simply be started again.
+"""
+from __future__ import annotations
+
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Dict, Iterator, List
+import argparse
+import logging
+import os
+
+try:
+    from google.api_core import exceptions as api_exceptions  # type: ignore
+    from google.cloud import firestore  # type: ignore
+except Exception:  # pragma: no cover
+    api_exceptions = None  # type: ignore
+    firestore = None  # type: ignore
+
+from .move_log import MAX_BATCH_WRITES
+from .persistence import BOARD_ENCODING, BOARD_FIELDS, encode_board_fields
+
+GAMES_COLLECTION = "minesweeperGames"
+
+logger = logging.getLogger(__name__)
+
+
+def _pending(client, batch_size: int, counts: Dict[str, int]) -> Iterator[List[Any]]:
+    """Snapshots of documents still in the old encoding, ``batch_size`` at a time."""
+    query = client.collection(GAMES_COLLECTION).select(list(BOARD_FIELDS) + ["board_encoding"])
+    batch: List[Any] = []
+    for snap in query.stream():
+        counts["scanned"] += 1
+        if (snap.to_dict() or {}).get("board_encoding") == BOARD_ENCODING:
+            counts["skipped"] += 1
+            continue
+        batch.append(snap)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _board_update(data: Dict[str, Any]) -> Dict[str, Any]:
+    return encode_board_fields({name: data.get(name) for name in BOARD_FIELDS})
+
+
+def _migrate_one(client, ref) -> bool:
+    @firestore.transactional  # type: ignore
+    def _tx(tx):
+        snap = ref.get(transaction=tx)
+        data = snap.to_dict() if snap.exists else None
+        if not data or data.get("board_encoding") == BOARD_ENCODING:
+            return False
+        tx.update(ref, _board_update(data))
+        return True
+
+    return _tx(client.transaction())
+
+
+def _migrate_batch(client, snaps: List[Any]) -> Dict[str, int]:
+    batch = client.batch()
+    for snap in snaps:
+        # Fails the batch if the game was written after it was read
+        batch.update(snap.reference, _board_update(snap.to_dict() or {}), option=client.write_option(last_update_time=snap.update_time))
+    try:
+        batch.commit()
+        return {"migrated": len(snaps), "retried": 0}
+    except (api_exceptions.FailedPrecondition, api_exceptions.NotFound):
+        migrated = sum(_migrate_one(client, snap.reference) for snap in snaps)
+        return {"migrated": migrated, "retried": len(snaps)}
+
+
+def migrate(client, workers: int = 8, batch_size: int = 200, dry_run: bool = False) -> Dict[str, int]:
+    """Convert every game document to ``BOARD_ENCODING``; returns counts of what was done."""
+    if not 1 <= batch_size <= MAX_BATCH_WRITES:
+        raise ValueError("invalid batch size")
+    counts = {"scanned": 0, "skipped": 0, "migrated": 0, "retried": 0}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        in_flight: set[Future] = set()
+        for snaps in _pending(client, batch_size, counts):
+            if dry_run:
+                counts["migrated"] += len(snaps)
+                continue
+            # Bounded, so the scan does not run arbitrarily far ahead of the writers
+            if len(in_flight) >= 2 * workers:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    for key, n in future.result().items():
+                        counts[key] += n
+            in_flight.add(pool.submit(_migrate_batch, client, snaps))
+        for future in in_flight:
+            for key, n in future.result().items():
+                counts[key] += n
+    logger.info("board migration %s", counts)
+    return counts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Rewrite game documents into the compact board encoding.")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--dry-run", action="store_true", help="count documents to migrate without writing")
+    args = parser.parse_args()
+    if firestore is None:
+        raise SystemExit("google-cloud-firestore not available")
+    logging.basicConfig(level=logging.INFO)
+    client = firestore.Client(project=os.environ.get("GOOGLE_CLOUD_PROJECT"))
+    print(migrate(client, workers=args.workers, batch_size=args.batch_size, dry_run=args.dry_run))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+from __future__ import annotations
+
+from collections import deque
+from collections.abc import Mapping
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional, Tuple
+import logging
+import threading
+import time
+
+# Firestore rejects write batches larger than this
+MAX_BATCH_WRITES = 500
+# Packed log entries per chunk document; ~60 bytes each keeps chunks far below 1 MiB
+MOVES_PER_CHUNK = 256
+# Flushes tried on close before the remaining records are given up, with a
+# doubling pause between them starting at CLOSE_RETRY_DELAY seconds
+CLOSE_FLUSH_ATTEMPTS = 3
+CLOSE_RETRY_DELAY = 0.1
+
+# (user_id, payload); the payload is whatever the backend's commit function expects
+MoveRecord = Tuple[str, Any]
+CommitFn = Callable[[List[MoveRecord]], None]
+# (log index, move); the index is None for one-document-per-move logs
+MoveEntry = Tuple[Optional[int], Dict[str, Any]]
+
+logger = logging.getLogger(__name__)
+
+# Packed form of a move: one comma-separated string per move, fields in this order.
+# Actions and statuses become single letters, booleans 0/1, timestamps epoch
+# milliseconds; None is the empty string. The log index comes first so entries
+# stay unique for ArrayUnion and can be put back in order.
+_FIELDS = (
+    "seq",
+    "action",
+    "row",
+    "col",
+    "hit_mine",
+    "cleared_cells",
+    "flags_total",
+    "revealed_total",
+    "status_after",
+    "timestamp",
+    "ms_since_game_start",
+    "ms_since_prev_move",
+    "error_reason",
+)
+_ACTIONS = {"reveal": "r", "flag": "f", "chord": "c", "abandon": "a", "error": "e"}
+_STATUSES = {"active": "a", "won": "w", "lost": "l", "abandoned": "x", "error": "e"}
+_ACTION_NAMES = {v: k for k, v in _ACTIONS.items()}
+_STATUS_NAMES = {v: k for k, v in _STATUSES.items()}
+
+
+def pack_move(index: int, move: Dict[str, Any]) -> str:
+    ts = move.get("timestamp")
+    values = {
+        **move,
+        "action": _ACTIONS[move["action"]],
+        "hit_mine": int(bool(move.get("hit_mine"))),
+        "status_after": _STATUSES[move["status_after"]],
+        "timestamp": int(ts.timestamp() * 1000) if ts is not None else None,
+        "error_reason": (move.get("error_reason") or "").replace(",", ";"),
+    }
+    return ",".join([str(index)] + ["" if values.get(f) is None else str(values[f]) for f in _FIELDS])
+
+
+def unpack_move(packed: str) -> Tuple[int, Dict[str, Any]]:
+    index, *raw = packed.split(",")
+    values = dict(zip(_FIELDS, raw))
+    move: Dict[str, Any] = {}
+    for field in _FIELDS:
+        v = values[field]
+        if field == "action":
+            move[field] = _ACTION_NAMES[v]
+        elif field == "status_after":
+            move[field] = _STATUS_NAMES[v]
+        elif field == "hit_mine":
+            move[field] = v == "1"
+        elif field == "timestamp":
+            move[field] = datetime.fromtimestamp(int(v) / 1000, tz=timezone.utc) if v else None
+        elif field == "error_reason":
+            if v:
+                move[field] = v
+        else:
+            move[field] = int(v) if v else None
+    return int(index), move
+
+
+class CompactMove(Mapping):
+    """A move record in slots instead of a per-move dict, for in-memory logs.
+
+    Reads like the dict it was made from (``move["seq"]``, ``dict(move)``), in
+    well under half the memory.
+    """
+
+    __slots__ = _FIELDS
+
+    def __init__(self, move: Dict[str, Any]) -> None:
+        for field in _FIELDS:
+            setattr(self, field, move.get(field))
+
+    @classmethod
+    def from_tuple(cls, values: Tuple[Any, ...]) -> "CompactMove":
+        move = cls.__new__(cls)
+        # Spelled out rather than a setattr loop: recovery builds millions of these. Same order as _FIELDS.
+        (
+            move.seq,
+            move.action,
+            move.row,
+            move.col,
+            move.hit_mine,
+            move.cleared_cells,
+            move.flags_total,
+            move.revealed_total,
+            move.status_after,
+            move.timestamp,
+            move.ms_since_game_start,
+            move.ms_since_prev_move,
+            move.error_reason,
+        ) = values
+        return move
+
+    def astuple(self) -> Tuple[Any, ...]:
+        """Field values in ``_FIELDS`` order; ``from_tuple`` restores the move."""
+        return tuple(getattr(self, field) for field in _FIELDS)
+
+    def _present(self):
+        # error_reason only exists on error moves, as in the dicts
+        return _FIELDS if self.error_reason is not None else _FIELDS[:-1]
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self._present():
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __iter__(self):
+        return iter(self._present())
+
+    def __len__(self) -> int:
+        return len(self._present())
+
+    def __repr__(self) -> str:
+        return f"CompactMove({dict(self)!r})"
+
+
+def expand_chunks(chunks: Iterable[Iterable[str]]) -> List[Dict[str, Any]]:
+    """Move dicts of a packed log, in log order, from the ``moves`` arrays of its chunks."""
+    entries = [unpack_move(packed) for chunk in chunks for packed in chunk]
+    entries.sort(key=lambda e: e[0])
+    return [move for _, move in entries]
+
+
+@dataclass(frozen=True)
+class MoveLogConfig:
+    flush_interval: float = 1.0
+    flush_size: int = 200
+    max_buffer: int = 10_000
+
+
+class WriteBehindMoveLog:
+    """Bounded buffer of committed move records, written out in batches off the request path.
+
+    Callers hand over a user's move records only after the game update that
+    produced them has committed. A daemon thread calls ``commit`` with up to
+    ``flush_size`` records every ``flush_interval`` seconds, or sooner once that
+    many are waiting. When the buffer is full new records are dropped and
+    counted; a failed commit puts its records back at the front.
+    """
+
+    def __init__(self, commit: CommitFn, config: MoveLogConfig = MoveLogConfig(), clock: Callable[[], float] = time.monotonic) -> None:
+        if not 1 <= config.flush_size <= MAX_BATCH_WRITES:
+            raise ValueError("invalid flush size")
+        self._commit = commit
+        self.config = config
+        self._clock = clock
+        self._buffer: Deque[Tuple[float, str, Any]] = deque()
+        self._lock = threading.Lock()
+        # Serializes flushes so batches reach storage in enqueue order
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.flushed_total = 0
+        self.dropped_total = 0
+        self.flush_errors = 0
+        self.last_flush_lag: Optional[float] = None
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="move-log-flush", daemon=True)
+            self._thread.start()
+
+    def extend(self, user_id: str, moves: Iterable[Any]) -> None:
+        now = self._clock()
+        with self._lock:
+            for move in moves:
+                if len(self._buffer) >= self.config.max_buffer:
+                    self.dropped_total += 1
+                    continue
+                self._buffer.append((now, user_id, move))
+            full = len(self._buffer) >= self.config.flush_size
+        if full:
+            self._wake.set()
+
+    def flush(self) -> int:
+        """Write out everything buffered so far; returns the number of records written."""
+        written = 0
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    items = [self._buffer.popleft() for _ in range(min(self.config.flush_size, len(self._buffer)))]
+                if not items:
+                    return written
+                try:
+                    self._commit([(user_id, move) for _, user_id, move in items])
+                except Exception:
+                    self.flush_errors += 1
+                    logger.exception("move log flush failed; %d records requeued", len(items))
+                    with self._lock:
+                        self._buffer.extendleft(reversed(items))
+                    return written
+                written += len(items)
+                self.flushed_total += len(items)
+                self.last_flush_lag = self._clock() - items[0][0]
+
+    def close(self) -> None:
+        """Stop the flush thread and write out what is left, retrying failed flushes a few times."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        for attempt in range(CLOSE_FLUSH_ATTEMPTS):
+            if attempt:
+                time.sleep(CLOSE_RETRY_DELAY * 2 ** (attempt - 1))
+            self.flush()
+            with self._lock:
+                if not self._buffer:
+                    return
+        with self._lock:
+            abandoned = len(self._buffer)
+            self._buffer.clear()
+        self.dropped_total += abandoned
+        logger.error("move log closed with %d records abandoned after %d failed flushes", abandoned, CLOSE_FLUSH_ATTEMPTS)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            depth = len(self._buffer)
+            oldest = self._buffer[0][0] if self._buffer else None
+        return {
+            "depth": depth,
+            "lag_seconds": self._clock() - oldest if oldest is not None else 0.0,
+            "last_flush_lag_seconds": self.last_flush_lag,
+            "flushed_total": self.flushed_total,
+            "dropped_total": self.dropped_total,
+            "flush_errors": self.flush_errors,
+        }
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(self.config.flush_interval)
+            self._wake.clear()
+            self.flush()
@@ -1,23 +1,121 @@
 from __future__ import annotations
 
-from datetime import datetime, timezone
-from typing import Any, Dict, Optional, Tuple
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Deque, Dict, Optional, Tuple
+import contextlib
+import functools
+import gc
 import os
+import sys
+import random
+import sqlite3
+import logging
+import threading
+import time
 
 try:
     from google.cloud import firestore  # type: ignore
 except Exception:  # pragma: no cover
     firestore = None  # type: ignore
 
+from . import bitmask
+from . import infinite
+from . import move_log
+from .costs import CountingClient
+from .journal import Journal, JournalConfig
+from .move_log import CompactMove, MoveEntry, MoveLogConfig, MoveRecord, WriteBehindMoveLog
 from .game_engine import (
     GameState,
     generate_new_game,
     apply_reveal as engine_reveal,
     apply_flag as engine_flag,
+    apply_chord as engine_chord,
+    derived_layout,
+    to_client_string,
     to_client_view,
 )
 
 
+logger = logging.getLogger(__name__)
+
+# Per-user lock stripes of InMemoryPersistence; users sharing a stripe serialize
+LOCK_STRIPES = 64
+# CompactMove with its unshared values (timestamp, large ints); small ints and action strings are shared
+_COMPACT_MOVE_BYTES = 240
+# /stats answers may be this many seconds stale for other processes' writes
+STATS_CACHE_TTL = 5.0
+STATS_CACHE_SIZE = 4096
+# Fields of a game document, in the order of journal records and SQLite columns
+_GAME_COLUMNS = (
+    "status",
+    "created_at",
+    "updated_at",
+    "finished_at",
+    "board_width",
+    "board_height",
+    "num_mines",
+    "moves_count",
+    "mine_layout",
+    "revealed_mask",
+    "flag_mask",
+    "mines_placed",
+    "rng_seed",
+    "first_click",
+    "first_reveal_at",
+    "result_time_ms",
+    "final_score",
+    "end_result",
+)
+# Encoding of the board fields of a game document. 1 (or no ``board_encoding``):
+# masks as "0"/"1" strings and mine_layout as "0".."8"/"M" characters. 2: masks
+# as bitmask bytes and mine_layout as 4-bit codes, two cells per byte.
+BOARD_ENCODING = 2
+BOARD_FIELDS = ("revealed_mask", "flag_mask", "mine_layout")
+_LAYOUT_CHARS = "012345678M??????"
+_LAYOUT_CODES = bytes.maketrans(b"012345678M", bytes(range(10)))
+# Two cells per byte, low nibble first
+_LAYOUT_PAIRS = [_LAYOUT_CHARS[b & 15] + _LAYOUT_CHARS[b >> 4] for b in range(256)]
+_SUMMARY_FIELDS = ("board_width", "board_height", "num_mines", "played", "wins", "losses", "aborts")
+
+
+def _approx_size(value: Any) -> int:
+    """Rough retained size of a document: containers plus their keys and leaf values."""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(sys.getsizeof(k) + _approx_size(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(_approx_size(v) for v in value)
+    return size
+
+
+def _user_locked(method):
+    """Run an ``InMemoryPersistence`` method under the lock stripe of its ``user_id``."""
+
+    @functools.wraps(method)
+    def wrapper(self, user_id: str, *args, **kwargs):
+        with self._user_lock(user_id):
+            result = method(self, user_id, *args, **kwargs)
+        # Outside the stripe: eviction takes other users' stripes one at a time
+        self._touched(user_id)
+        return result
+
+    return wrapper
+
+
+@dataclass(frozen=True)
+class MemoryLimits:
+    """Retention bounds for ``InMemoryPersistence``; None leaves that dimension unbounded."""
+
+    # Users with any stored data; least recently used are evicted first, finished games before active ones
+    max_users: Optional[int] = None
+    # Seconds a won/lost/abandoned game is kept after it finished
+    finished_ttl: Optional[float] = None
+    # Most recent moves kept per game
+    max_moves_per_game: Optional[int] = None
+
+
 def _now() -> datetime:
     return datetime.now(timezone.utc)
 
@@ -26,41 +124,702 @@ def _seq_id(n: int) -> str:
     return f"{n:06d}"
 
 
+def pack_layout(layout: str) -> bytes:
+    codes = layout.encode("ascii").translate(_LAYOUT_CODES)
+    if len(codes) % 2:
+        codes += b"\0"
+    return bytes(lo | hi << 4 for lo, hi in zip(codes[0::2], codes[1::2]))
+
+
+@functools.lru_cache(maxsize=1024)
+def unpack_layout(packed: bytes, cells: int) -> str:
+    return "".join([_LAYOUT_PAIRS[b] for b in packed])[:cells]
+
+
+def encode_board_fields(fields: Dict[str, Any]) -> Dict[str, Any]:
+    """``fields`` with the board fields it holds in the compact encoding; either encoding is accepted."""
+    out = dict(fields)
+    for name in ("revealed_mask", "flag_mask"):
+        if isinstance(out.get(name), str):
+            out[name] = bitmask.from_str(out[name])
+    if isinstance(out.get("mine_layout"), str):
+        out["mine_layout"] = pack_layout(out["mine_layout"])
+    out["board_encoding"] = BOARD_ENCODING
+    return out
+
+
+def _mask(value: str | bytes) -> bytes:
+    return value if isinstance(value, bytes) else bitmask.from_str(value)
+
+
+def _mine_layout(doc: Dict[str, Any]) -> str:
+    layout = doc.get("mine_layout")
+    width, height = doc["board_width"], doc["board_height"]
+    if isinstance(layout, bytes):
+        return unpack_layout(layout, width * height)
+    if layout:
+        return layout
+    # Derived-layout documents keep only rng_seed and first_click
+    if doc.get("mines_placed"):
+        return derived_layout(width, height, doc["num_mines"], doc["rng_seed"], doc["first_click"])
+    return "0" * (width * height)
+
+
 def _to_state(doc: Dict[str, Any]) -> GameState:
     return GameState(
         width=doc["board_width"],
         height=doc["board_height"],
         num_mines=doc["num_mines"],
-        mine_layout=doc["mine_layout"],
-        revealed_mask=doc["revealed_mask"],
-        flag_mask=doc["flag_mask"],
+        mine_layout=_mine_layout(doc),
+        revealed_mask=_mask(doc["revealed_mask"]),
+        flag_mask=_mask(doc["flag_mask"]),
         status=doc["status"],
         moves_count=doc.get("moves_count", 0),
         mines_placed=doc.get("mines_placed", False),
         rng_seed=doc.get("rng_seed"),
+        first_click=doc.get("first_click"),
+    )
+
+
+def _derives_layout(doc: Dict[str, Any]) -> bool:
+    """Whether ``doc`` regenerates its layout from rng_seed instead of storing it.
+
+    Decided by how the game was started, not by the running instance: a game
+    started with a stored (placeholder) layout or without a seed must store
+    the layout its first reveal places.
+    """
+    return doc.get("mine_layout") is None and doc.get("rng_seed") is not None
+
+
+def _placement_update(state: GameState, derive_layout: bool) -> Dict[str, Any]:
+    """Fields to store once the first reveal has placed the mines."""
+    if derive_layout:
+        return {"mines_placed": True, "first_click": state.first_click}
+    return {"mines_placed": True, "mine_layout": state.mine_layout, "first_click": state.first_click}
+
+
+def _log_key(game: Dict[str, Any]) -> str:
+    created = game.get("created_at")
+    return str(int(created.timestamp() * 1000)) if created else "0"
+
+
+def _client_delta(game: Dict[str, Any], move: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "status": game["status"],
+        "changed": move.get("changed", []),
+        "board_width": game["board_width"],
+        "board_height": game["board_height"],
+        "moves_count": game.get("moves_count", 0),
+        "flags_total": move["flags_total"],
+        "revealed_total": move["revealed_total"],
+        "num_mines": game["num_mines"],
+        "end_result": game.get("end_result"),
+    }
+
+
+_ENGINE_ACTIONS = {
+    "reveal": engine_reveal,
+    "flag": engine_flag,
+    "chord": engine_chord,
+}
+
+
+def _apply_actions(
+    game: Dict[str, Any],
+    actions: list[Dict[str, Any]],
+    now: datetime,
+    last_ts: Optional[datetime],
+    derive_layout: bool = False,
+) -> Tuple[Dict[str, Any], list[Dict[str, Any]], Optional[str]]:
+    """Run a batch of reveal/flag/chord actions against a game document in memory.
+
+    Returns ``(update, moves, outcome)``: the fields to write back to the game
+    document, one move record per action (each still carrying its transient
+    ``changed`` cells), and the stats outcome if the batch finished the game.
+    """
+    s = _to_state(game)
+    placed_before = s.mines_placed
+    first_reveal_at = game.get("first_reveal_at")
+    update: Dict[str, Any] = {}
+    moves: list[Dict[str, Any]] = []
+    outcome: Optional[str] = None
+    for action in actions:
+        kind = action["action"]
+        row, col = int(action["row"]), int(action["col"])
+        moves_before = s.moves_count
+        s, result = _ENGINE_ACTIONS[kind](s, row, col)
+        if first_reveal_at is None and kind != "flag" and result["cleared_cells"] > 0:
+            first_reveal_at = now
+            update["first_reveal_at"] = now
+        if s.status in ("won", "lost") and not game.get("finished_at") and outcome is None:
+            update["finished_at"] = now
+            update["result_time_ms"] = int((now - first_reveal_at).total_seconds() * 1000) if first_reveal_at else None
+            update["end_result"] = "win" if s.status == "won" else "lose"
+            outcome = "win" if s.status == "won" else "loss"
+        moves.append(
+            {
+                "seq": moves_before + 1,
+                "action": kind,
+                "row": row,
+                "col": col,
+                "timestamp": now,
+                "hit_mine": result["hit_mine"],
+                "cleared_cells": result["cleared_cells"],
+                "flags_total": result["flags_total"],
+                "revealed_total": result["revealed_total"],
+                "status_after": result["status_after"],
+                "ms_since_game_start": int((now - first_reveal_at).total_seconds() * 1000) if first_reveal_at else None,
+                "ms_since_prev_move": int((now - last_ts).total_seconds() * 1000) if last_ts else None,
+                "changed": result["changed"],
+            }
+        )
+        last_ts = now
+    update.update(
+        {
+            "revealed_mask": bitmask.to_str(s.revealed_mask, s.cells),
+            "flag_mask": bitmask.to_str(s.flag_mask, s.cells),
+            "status": s.status,
+            "moves_count": s.moves_count,
+            "updated_at": now,
+        }
+    )
+    if s.mines_placed and not placed_before:
+        update.update(_placement_update(s, derive_layout))
+    return update, moves, outcome
+
+
+def _move_record(move: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for k, v in move.items() if k != "changed"}
+
+
+def _new_infinite_doc(state: infinite.InfiniteGameState, now: datetime) -> Dict[str, Any]:
+    return {
+        "mode": "infinite",
+        "status": state.status,
+        "created_at": now,
+        "updated_at": now,
+        "finished_at": None,
+        "mines_per_chunk": state.mines_per_chunk,
+        "rng_seed": state.rng_seed,
+        "origin": None,
+        "moves_count": 0,
+        "revealed_total": 0,
+        "flags_total": 0,
+        "end_result": None,
+    }
+
+
+def _to_infinite_state(doc: Dict[str, Any]) -> infinite.InfiniteGameState:
+    origin = doc.get("origin")
+    return infinite.InfiniteGameState(
+        rng_seed=doc["rng_seed"],
+        mines_per_chunk=doc["mines_per_chunk"],
+        origin=(int(origin[0]), int(origin[1])) if origin is not None else None,
+        status=doc["status"],
+        moves_count=doc.get("moves_count", 0),
+        revealed_count=doc.get("revealed_total", 0),
+        flags_count=doc.get("flags_total", 0),
     )
 
 
-def _count_flags(mask: str) -> int:
-    return mask.count("1")
+def _apply_infinite_action(
+    game: Dict[str, Any],
+    load_chunk: infinite.ChunkLoader,
+    action: str,
+    row: int,
+    col: int,
+    now: datetime,
+) -> Tuple[Dict[str, Any], Dict[str, Any], Dict[infinite.Chunk, Tuple[bytes, bytes]]]:
+    """Apply one infinite-board move; returns (doc update, engine result, chunks to write)."""
+    s = _to_infinite_state(game)
+    masks = infinite.ChunkMasks(load_chunk)
+    fn = infinite.apply_reveal if action == "reveal" else infinite.apply_flag
+    ns, result = fn(s, masks, row, col)
+    update: Dict[str, Any] = {
+        "status": ns.status,
+        "moves_count": ns.moves_count,
+        "revealed_total": ns.revealed_count,
+        "flags_total": ns.flags_count,
+        "updated_at": now,
+    }
+    if ns.origin is not None and s.origin is None:
+        update["origin"] = list(ns.origin)
+    if ns.status == "lost" and not game.get("finished_at"):
+        update["finished_at"] = now
+        update["end_result"] = "lose"
+    return update, result, masks.changed_chunks()
+
+
+def _chunk_id(chunk: infinite.Chunk) -> str:
+    return f"{chunk[0]}_{chunk[1]}"
+
 
+def _chunk_is_empty(masks: Tuple[bytes, bytes]) -> bool:
+    return not any(masks[0]) and not any(masks[1])
 
-def _count_revealed(mask: str) -> int:
-    return mask.count("1")
+
+def _view_chunks(row: int, col: int, height: int, width: int) -> list[infinite.Chunk]:
+    top, left = infinite.chunk_of(row, col)
+    bottom, right = infinite.chunk_of(row + height - 1, col + width - 1)
+    return [(cr, cc) for cr in range(top, bottom + 1) for cc in range(left, right + 1)]
+
+
+def _chunk_ring(crow: int, ccol: int) -> list[infinite.Chunk]:
+    return [(crow + dr, ccol + dc) for dr in (-1, 0, 1) for dc in (-1, 0, 1)]
+
+
+def _prefetch_chunks(game: Dict[str, Any], action: str, row: int, col: int) -> list[infinite.Chunk]:
+    """Chunks an infinite move reads up front, in one round trip.
+
+    Only a reveal that can open a zero region reaches past the clicked chunk;
+    missing documents are billed as reads, so the others read just that chunk.
+    """
+    chunk = infinite.chunk_of(row, col)
+    if action == "reveal" and infinite.may_cascade(_to_infinite_state(game), row, col):
+        return _chunk_ring(*chunk)
+    return [chunk]
+
+
+def to_client_infinite(game: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "mode": "infinite",
+        "status": game["status"],
+        "mines_per_chunk": game["mines_per_chunk"],
+        "chunk_size": infinite.CHUNK,
+        "moves_count": game.get("moves_count", 0),
+        "flags_total": game.get("flags_total", 0),
+        "revealed_total": game.get("revealed_total", 0),
+        "end_result": game.get("end_result"),
+    }
+
+
+def _stats_response(data: Dict[str, Any], options: list[Dict[str, Any]]) -> Dict[str, Any]:
+    played = int(data.get("played", 0) or 0)
+    wins = int(data.get("wins", 0) or 0)
+    losses = int(data.get("losses", 0) or 0)
+    aborts = int(data.get("aborts", 0) or 0)
+    denom = wins + losses + aborts
+    win_pct = float(wins) / denom if denom > 0 else 0.0
+    by_option_list: list[Dict[str, Any]] = []
+    for opt in options:
+        width = int(opt.get("board_width", 0) or 0)
+        height = int(opt.get("board_height", 0) or 0)
+        num_mines = int(opt.get("num_mines", 0) or 0)
+        o_played = int(opt.get("played", 0) or 0)
+        o_wins = int(opt.get("wins", 0) or 0)
+        o_losses = int(opt.get("losses", 0) or 0)
+        o_aborts = int(opt.get("aborts", 0) or 0)
+        o_denom = o_wins + o_losses + o_aborts
+        o_win_pct = float(o_wins) / o_denom if o_denom > 0 else 0.0
+        by_option_list.append(
+            {
+                "key": f"{width}x{height}x{num_mines}",
+                "board_width": width,
+                "board_height": height,
+                "num_mines": num_mines,
+                "played": o_played,
+                "wins": o_wins,
+                "losses": o_losses,
+                "aborts": o_aborts,
+                "winPct": o_win_pct,
+            }
+        )
+    return {
+        "totals": {
+            "played": played,
+            "wins": wins,
+            "losses": losses,
+            "aborts": aborts,
+            "winPct": win_pct,
+        },
+        "byOption": by_option_list,
+    }
+
+
+_MASK_FIELDS = ("revealed_mask", "flag_mask")
+
+
+def _pack_game(game: Dict[str, Any]) -> tuple:
+    # Journal and snapshot form: values in _GAME_COLUMNS order, masks as bitmask bytes
+    packed = game | {"revealed_mask": bitmask.from_str(game["revealed_mask"]), "flag_mask": bitmask.from_str(game["flag_mask"])}
+    return tuple(packed.get(col) for col in _GAME_COLUMNS)
+
+
+def _unpack_game(packed: tuple) -> Dict[str, Any]:
+    game = dict(zip(_GAME_COLUMNS, packed))
+    cells = game["board_width"] * game["board_height"]
+    game["revealed_mask"] = bitmask.to_str(game["revealed_mask"], cells)
+    game["flag_mask"] = bitmask.to_str(game["flag_mask"], cells)
+    return game
+
+
+def _pack_fields(fields: Dict[str, Any]) -> Dict[str, Any]:
+    # Journal form of some game fields, masks as bitmask bytes like _pack_game
+    return {k: bitmask.from_str(v) if k in _MASK_FIELDS else v for k, v in fields.items()}
+
+
+def _unpack_fields(fields: Dict[str, Any], cells: int) -> Dict[str, Any]:
+    return {k: bitmask.to_str(v, cells) if k in _MASK_FIELDS else v for k, v in fields.items()}
+
+
+def _count_set(mask: str | bytes) -> int:
+    return bitmask.popcount(mask) if isinstance(mask, bytes) else mask.count("1")
 
 
 class InMemoryPersistence:
-    """Simple in-memory persistence for tests and local dev."""
+    """Simple in-memory persistence for tests and local dev.
+
+    Handlers call in from several threads. Every public method holds its
+    user's lock stripe, so one user's updates are serialized while other users
+    proceed, and returns copies of game documents rather than the stored dicts.
+    Moves are kept as ``CompactMove`` records; ``limits`` bounds what is kept.
+    With ``journal`` every mutation is also appended to an on-disk journal,
+    compacted into a snapshot every ``snapshot_every`` records and on ``close``;
+    a new instance on the same directory starts from snapshot plus journal.
+    """
 
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        lock_stripes: int = LOCK_STRIPES,
+        limits: MemoryLimits = MemoryLimits(),
+        journal: Optional[JournalConfig] = None,
+    ) -> None:
+        self._locks = [threading.RLock() for _ in range(lock_stripes)]
+        self.limits = limits
+        # Recency of users, oldest first, split by whether their classic game is active
+        # so eviction pops from the front; guarded by _lru_lock, never held with a stripe
+        self._lru_finished: OrderedDict[str, None] = OrderedDict()
+        self._lru_active: OrderedDict[str, None] = OrderedDict()
+        self._lru_lock = threading.Lock()
+        self._next_sweep = 0.0
+        self.evicted_users = 0
+        self.evicted_games = 0
         self.games: Dict[str, Dict[str, Any]] = {}
-        self.moves: Dict[str, list[Dict[str, Any]]] = {}
+        self.moves: Dict[str, Deque[CompactMove]] = {}
         self.stats_totals: Dict[str, Dict[str, Any]] = {}
         self.stats_by_option: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self.infinite_games: Dict[str, Dict[str, Any]] = {}
+        # Only chunks holding a revealed or flagged cell are kept
+        self.infinite_chunks: Dict[str, Dict[infinite.Chunk, Tuple[bytes, bytes]]] = {}
+        self.journal: Optional[Journal] = None
+        self._snapshot_lock = threading.Lock()
+        if journal is not None:
+            self._recover(Journal(journal))
+
+    def _user_lock(self, user_id: str) -> threading.RLock:
+        return self._locks[hash(user_id) % len(self._locks)]
+
+    def _new_move_log(self) -> Deque[CompactMove]:
+        return deque(maxlen=self.limits.max_moves_per_game)
 
     def _ensure_user(self, user_id: str) -> None:
         if user_id not in self.moves:
-            self.moves[user_id] = []
+            self.moves[user_id] = self._new_move_log()
+
+    def _has_data(self, user_id: str) -> bool:
+        return user_id in self.games or user_id in self.infinite_games or user_id in self.stats_totals
+
+    def _touched(self, user_id: str) -> None:
+        if self.journal is not None and self.journal.due():
+            self._snapshot_if_due()
+        limits = self.limits
+        if limits.max_users is None and limits.finished_ttl is None:
+            return
+        with self._lru_lock:
+            if self._has_data(user_id):
+                self._lru_use(user_id)
+            over = limits.max_users is not None and len(self._lru_finished) + len(self._lru_active) > limits.max_users
+            sweep = limits.finished_ttl is not None and time.monotonic() >= self._next_sweep
+            if sweep:
+                self._next_sweep = time.monotonic() + min(limits.finished_ttl, 60.0)
+        if sweep:
+            self.sweep()
+        if over:
+            self._evict_users(keep=user_id)
+
+    def _lru_use(self, user_id: str) -> None:
+        # Caller holds _lru_lock
+        if (self.games.get(user_id) or {}).get("status") == "active":
+            self._lru_finished.pop(user_id, None)
+            lru = self._lru_active
+        else:
+            self._lru_active.pop(user_id, None)
+            lru = self._lru_finished
+        lru[user_id] = None
+        lru.move_to_end(user_id)
+
+    def _lru_victim(self, keep: str) -> Optional[str]:
+        # Finished games go first, then the least recently used of the rest.
+        # ``keep`` was just used, so this looks at most one user past the front.
+        for lru in (self._lru_finished, self._lru_active):
+            for user_id in lru:
+                if user_id != keep:
+                    return user_id
+        return None
+
+    def _evict_users(self, keep: str) -> None:
+        with self._lru_lock:
+            excess = len(self._lru_finished) + len(self._lru_active) - (self.limits.max_users or 0)
+        for _ in range(excess):
+            with self._lru_lock:
+                victim = self._lru_victim(keep)
+            if victim is None:
+                return
+            self.evict_user(victim)
+
+    def evict_user(self, user_id: str) -> None:
+        """Drop everything stored for ``user_id``: games, moves, chunks and stats."""
+        with self._user_lock(user_id):
+            for store in (self.games, self.moves, self.infinite_games, self.infinite_chunks, self.stats_totals, self.stats_by_option):
+                store.pop(user_id, None)
+            self._journal(("evict", user_id, None))
+        with self._lru_lock:
+            if user_id in self._lru_finished or user_id in self._lru_active:
+                self._lru_finished.pop(user_id, None)
+                self._lru_active.pop(user_id, None)
+                self.evicted_users += 1
+
+    def sweep(self) -> int:
+        """Evict games that finished more than ``finished_ttl`` seconds ago; returns how many."""
+        ttl = self.limits.finished_ttl
+        if ttl is None:
+            return 0
+        cutoff = _now().timestamp() - ttl
+        evicted = 0
+        for user_id in list(self.games):
+            with self._user_lock(user_id):
+                game = self.games.get(user_id)
+                finished_at = game.get("finished_at") if game else None
+                if finished_at is None or game.get("status") == "active" or finished_at.timestamp() > cutoff:
+                    continue
+                del self.games[user_id]
+                self.moves.pop(user_id, None)
+                self._journal(("evict", user_id, "game"))
+                evicted += 1
+        for user_id in list(self.infinite_games):
+            with self._user_lock(user_id):
+                game = self.infinite_games.get(user_id)
+                finished_at = game.get("finished_at") if game else None
+                if finished_at is None or finished_at.timestamp() > cutoff:
+                    continue
+                del self.infinite_games[user_id]
+                self.infinite_chunks.pop(user_id, None)
+                self._journal(("evict", user_id, "infinite"))
+                evicted += 1
+        self.evicted_games += evicted
+        return evicted
+
+    def memory_usage(self) -> Dict[str, Any]:
+        """Counts of what is held, with a rough byte estimate, plus eviction totals."""
+        move_records = sum(len(m) for m in list(self.moves.values()))
+        chunks = sum(len(c) for c in list(self.infinite_chunks.values()))
+        game_bytes = sum(_approx_size(g) for g in list(self.games.values()) + list(self.infinite_games.values()))
+        move_bytes = move_records * _COMPACT_MOVE_BYTES
+        chunk_bytes = chunks * (2 * bitmask.nbytes(infinite.CHUNK_CELLS) + 200)
+        stats_bytes = sum(_approx_size(o) for o in list(self.stats_by_option.values())) + 400 * len(self.stats_totals)
+        return {
+            "users": len(set(self.games) | set(self.infinite_games) | set(self.stats_totals)),
+            "games": len(self.games),
+            "infinite_games": len(self.infinite_games),
+            "move_records": move_records,
+            "infinite_chunks": chunks,
+            "approx_bytes": game_bytes + move_bytes + chunk_bytes + stats_bytes,
+            "evicted_users": self.evicted_users,
+            "evicted_games": self.evicted_games,
+            "limits": {
+                "max_users": self.limits.max_users,
+                "finished_ttl": self.limits.finished_ttl,
+                "max_moves_per_game": self.limits.max_moves_per_game,
+            },
+        }
+
+    def active_games(self) -> Dict[str, int]:
+        """Games in progress, by kind; scans every game."""
+        return {
+            "classic": sum(1 for g in list(self.games.values()) if g.get("status") == "active"),
+            "infinite": sum(1 for g in list(self.infinite_games.values()) if g.get("status") == "active"),
+        }
+
+    def _journal(self, record: tuple) -> None:
+        if self.journal is not None:
+            self.journal.append(record)
+
+    def _journal_game(self, user_id: str, moves: list[CompactMove], before: Optional[Dict[str, Any]] = None) -> None:
+        """Journal ``moves`` with the whole game, or with only the fields changed since ``before``."""
+        if self.journal is None:
+            return
+        game = self.games[user_id]
+        if before is None:
+            self.journal.append(("game", user_id, _pack_game(game), [m.astuple() for m in moves], True))
+        else:
+            # Values are replaced, never mutated, so identity tells what changed
+            changed = {k: v for k, v in game.items() if before.get(k) is not v}
+            self.journal.append(("game_update", user_id, _pack_fields(changed), [m.astuple() for m in moves]))
+
+    def _replay(self, record: tuple) -> None:
+        kind, user_id = record[0], record[1]
+        if kind == "game":
+            _, _, game, moves, reset = record
+            self.games[user_id] = _unpack_game(game)
+            if reset:
+                self.moves[user_id] = self._new_move_log()
+            self._ensure_user(user_id)
+            self.moves[user_id].extend(CompactMove.from_tuple(m) for m in moves)
+        elif kind == "game_update":
+            _, _, fields, moves = record
+            game = self.games[user_id]
+            game.update(_unpack_fields(fields, game["board_width"] * game["board_height"]))
+            self._ensure_user(user_id)
+            self.moves[user_id].extend(CompactMove.from_tuple(m) for m in moves)
+        elif kind == "stats":
+            _, _, totals, key, option = record
+            self.stats_totals[user_id] = totals
+            self.stats_by_option.setdefault(user_id, {})[key] = option
+        elif kind == "infinite":
+            _, _, game, chunks, reset = record
+            self.infinite_games[user_id] = game
+            stored = self.infinite_chunks.setdefault(user_id, {})
+            if reset:
+                stored.clear()
+            for chunk, masks in chunks.items():
+                if masks is None:
+                    stored.pop(chunk, None)
+                else:
+                    stored[chunk] = masks
+        elif kind == "evict":
+            part = record[2]
+            stores = {
+                None: (self.games, self.moves, self.infinite_games, self.infinite_chunks, self.stats_totals, self.stats_by_option),
+                "game": (self.games, self.moves),
+                "infinite": (self.infinite_games, self.infinite_chunks),
+            }[part]
+            for store in stores:
+                store.pop(user_id, None)
+        elif kind == "user":
+            _, _, game, moves, totals, options, infinite_game, chunks = record
+            if game is not None:
+                self.games[user_id] = _unpack_game(game)
+                self.moves[user_id] = self._new_move_log()
+                self.moves[user_id].extend(CompactMove.from_tuple(m) for m in moves)
+            if totals is not None:
+                self.stats_totals[user_id] = totals
+                self.stats_by_option[user_id] = options
+            if infinite_game is not None:
+                self.infinite_games[user_id] = infinite_game
+                self.infinite_chunks[user_id] = chunks
+        else:
+            raise ValueError(f"unknown journal record {kind!r}")
+
+    def _recover(self, journal: Journal) -> None:
+        # Replay only allocates; cyclic GC passes over the growing heap would dominate it
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            for record in journal.recover():
+                self._replay(record)
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+        if self.limits.max_users is not None or self.limits.finished_ttl is not None:
+            users = set(self.games) | set(self.infinite_games) | set(self.stats_totals)
+            for user_id in sorted(users):
+                self._lru_use(user_id)
+        self.journal = journal
+
+    def _snapshot_state(self) -> list[tuple]:
+        # Shallow copies: documents and stats are updated in place, the values in them never are
+        state = []
+        for user_id in set(self.games) | set(self.infinite_games) | set(self.stats_totals):
+            game = self.games.get(user_id)
+            totals = self.stats_totals.get(user_id)
+            options = self.stats_by_option.get(user_id)
+            infinite_game = self.infinite_games.get(user_id)
+            chunks = self.infinite_chunks.get(user_id)
+            state.append(
+                (
+                    user_id,
+                    dict(game) if game is not None else None,
+                    tuple(self.moves.get(user_id, ())),
+                    dict(totals) if totals is not None else None,
+                    {key: dict(option) for key, option in options.items()} if options is not None else None,
+                    dict(infinite_game) if infinite_game is not None else None,
+                    dict(chunks) if chunks is not None else None,
+                )
+            )
+        return state
+
+    @staticmethod
+    def _snapshot_records(state: list[tuple]):
+        for user_id, game, moves, totals, options, infinite_game, chunks in state:
+            yield (
+                "user",
+                user_id,
+                _pack_game(game) if game is not None else None,
+                [m.astuple() for m in moves],
+                totals,
+                options,
+                infinite_game,
+                chunks,
+            )
+
+    def _rotate(self) -> Tuple[int, list[tuple]]:
+        """Start the next journal generation; returns it with a copy of the state its snapshot holds."""
+        # Every stripe is held, so the copy matches the journal exactly; serializing it happens outside.
+        # The copy only allocates, and GC passes over the heap would double the pause.
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            with contextlib.ExitStack() as stack:
+                for lock in self._locks:
+                    stack.enter_context(lock)
+                return self.journal.rotate(), self._snapshot_state()
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+
+    def _write_snapshot_in_background(self, journal: Journal, generation: int, state: list[tuple]) -> None:
+        try:
+            journal.write_snapshot(generation, self._snapshot_records(state))
+        except Exception:
+            # The journals since the last good snapshot are kept, so recovery still has everything
+            logger.exception("journal snapshot %d failed", generation)
+        finally:
+            self._snapshot_lock.release()
+
+    def _snapshot_if_due(self) -> None:
+        # One snapshot at a time. The request that finds one due only copies the state;
+        # a background thread pickles and fsyncs it, holding _snapshot_lock until done.
+        if not self._snapshot_lock.acquire(blocking=False):
+            return
+        try:
+            if not self.journal.due():
+                self._snapshot_lock.release()
+                return
+            generation, state = self._rotate()
+        except BaseException:
+            self._snapshot_lock.release()
+            raise
+        threading.Thread(
+            target=self._write_snapshot_in_background,
+            args=(self.journal, generation, state),
+            name="journal-snapshot",
+            daemon=True,
+        ).start()
+
+    def snapshot(self) -> None:
+        """Compact the journal into a new snapshot now, after any snapshot already being written."""
+        if self.journal is None:
+            raise RuntimeError("journal not enabled")
+        with self._snapshot_lock:
+            generation, state = self._rotate()
+            self.journal.write_snapshot(generation, self._snapshot_records(state))
+
+    def close(self) -> None:
+        """Snapshot and close the journal, so the next start replays nothing."""
+        if self.journal is not None:
+            self.snapshot()
+            self.journal.close()
+            self.journal = None
 
     def _stats_key(self, width: int, height: int, num_mines: int) -> str:
         return f"{width}x{height}x{num_mines}"
@@ -102,10 +861,20 @@ class InMemoryPersistence:
         elif outcome == "abort":
             totals["aborts"] = int(totals.get("aborts", 0)) + 1
             option["aborts"] = int(option.get("aborts", 0)) + 1
+        self._journal(("stats", user_id, dict(totals), key, dict(option)))
 
+    @_user_locked
     def get_game(self, user_id: str) -> Optional[Dict[str, Any]]:
-        return self.games.get(user_id)
+        game = self.games.get(user_id)
+        return dict(game) if game is not None else None
+
+    @_user_locked
+    def get_moves(self, user_id: str) -> list[Dict[str, Any]]:
+        if user_id not in self.games:
+            raise KeyError("game_not_found")
+        return [dict(m) for m in self.moves.get(user_id, ())]
 
+    @_user_locked
     def start_game(
         self,
         user_id: str,
@@ -130,27 +899,34 @@ class InMemoryPersistence:
             "num_mines": num_mines,
             "moves_count": 0,
             "mine_layout": state.mine_layout,
-            "revealed_mask": state.revealed_mask,
-            "flag_mask": state.flag_mask,
+            "revealed_mask": bitmask.to_str(state.revealed_mask, state.cells),
+            "flag_mask": bitmask.to_str(state.flag_mask, state.cells),
             "mines_placed": state.mines_placed,
             "rng_seed": state.rng_seed,
+            "first_click": None,
             "first_reveal_at": None,
             "result_time_ms": None,
             "final_score": None,
             "end_result": None,
         }
         self.games[user_id] = doc
-        self.moves[user_id] = []
-        return doc
+        self.moves[user_id] = self._new_move_log()
+        self._journal_game(user_id, [])
+        return dict(doc)
 
-    def _append_move(self, user_id: str, game: Dict[str, Any], move: Dict[str, Any]) -> None:
+    def _append_moves(self, user_id: str, moves: list[Dict[str, Any]], before: Dict[str, Any]) -> None:
+        """Log ``moves`` for the game, which was ``before`` until this call's changes."""
         self._ensure_user(user_id)
-        self.moves[user_id].append(move)
+        compact = [CompactMove(m) for m in moves]
+        self.moves[user_id].extend(compact)
+        self._journal_game(user_id, compact, before)
 
+    @_user_locked
     def reveal(self, user_id: str, row: int, col: int) -> Tuple[Dict[str, Any], Dict[str, Any]]:
         game = self.games.get(user_id)
         if not game:
             raise KeyError("game_not_found")
+        before = dict(game)
         if game["status"] != "active":
             # still log a no-op move
             now = _now()
@@ -163,24 +939,24 @@ class InMemoryPersistence:
                 "timestamp": now,
                 "hit_mine": False,
                 "cleared_cells": 0,
-                "flags_total": _count_flags(game["flag_mask"]),
-                "revealed_total": _count_revealed(game["revealed_mask"]),
+                "flags_total": _count_set(game["flag_mask"]),
+                "revealed_total": _count_set(game["revealed_mask"]),
                 "status_after": game["status"],
                 "ms_since_game_start": int((now - (game.get("first_reveal_at") or game["created_at"])).total_seconds() * 1000) if game.get("first_reveal_at") else None,
                 "ms_since_prev_move": int((now - last_ts).total_seconds() * 1000) if last_ts else None,
             }
-            self._append_move(user_id, game, move)
             game["updated_at"] = now
-            return game, move
+            self._append_moves(user_id, [move], before)
+            return dict(game), move | {"changed": []}
 
         s = _to_state(game)
         new_state, result = engine_reveal(s, row, col)
         now = _now()
         # update doc
-        game["revealed_mask"] = new_state.revealed_mask
+        game["revealed_mask"] = bitmask.to_str(new_state.revealed_mask, new_state.cells)
         game["status"] = new_state.status
-        game["mine_layout"] = new_state.mine_layout
-        game["mines_placed"] = new_state.mines_placed
+        if new_state.mines_placed and not s.mines_placed:
+            game.update(_placement_update(new_state, _derives_layout(game)))
         game["moves_count"] = new_state.moves_count
         game["updated_at"] = now
         if game.get("first_reveal_at") is None and result.get("cleared_cells", 0) > 0:
@@ -211,13 +987,31 @@ class InMemoryPersistence:
             "ms_since_game_start": int((now - (game.get("first_reveal_at") or now)).total_seconds() * 1000) if game.get("first_reveal_at") else None,
             "ms_since_prev_move": int((now - last_ts).total_seconds() * 1000) if last_ts else None,
         }
-        self._append_move(user_id, game, move)
-        return game, move
+        self._append_moves(user_id, [move], before)
+        # changed cells go back to the caller only; they are not part of the move record
+        return dict(game), move | {"changed": result["changed"]}
+
+    @_user_locked
+    def apply_moves(self, user_id: str, actions: list[Dict[str, Any]]) -> Tuple[Dict[str, Any], list[Dict[str, Any]]]:
+        game = self.games.get(user_id)
+        if not game:
+            raise KeyError("game_not_found")
+        before = dict(game)
+        now = _now()
+        last_ts = self.moves[user_id][-1]["timestamp"] if self.moves.get(user_id) else game["created_at"]
+        update, moves, outcome = _apply_actions(game, actions, now, last_ts, _derives_layout(game))
+        game.update(update)
+        self._append_moves(user_id, [_move_record(m) for m in moves], before)
+        if outcome:
+            self._update_stats(user_id, game, outcome)
+        return dict(game), moves
 
+    @_user_locked
     def mark_error(self, user_id: str, reason: str) -> Dict[str, Any]:
         game = self.games.get(user_id)
         if not game:
             raise KeyError("game_not_found")
+        before = dict(game)
         now = _now()
         game["status"] = "error"
         game["updated_at"] = now
@@ -233,24 +1027,26 @@ class InMemoryPersistence:
             "timestamp": now,
             "hit_mine": False,
             "cleared_cells": 0,
-            "flags_total": _count_flags(game["flag_mask"]),
-            "revealed_total": _count_revealed(game["revealed_mask"]),
+            "flags_total": _count_set(game["flag_mask"]),
+            "revealed_total": _count_set(game["revealed_mask"]),
             "status_after": game["status"],
             "ms_since_game_start": int((now - (game.get("first_reveal_at") or now)).total_seconds() * 1000) if game.get("first_reveal_at") else None,
             "ms_since_prev_move": int((now - last_ts).total_seconds() * 1000) if last_ts else None,
             "error_reason": reason,
         }
-        self._append_move(user_id, game, move)
-        return game
+        self._append_moves(user_id, [move], before)
+        return dict(game)
 
+    @_user_locked
     def flag(self, user_id: str, row: int, col: int) -> Tuple[Dict[str, Any], Dict[str, Any]]:
         game = self.games.get(user_id)
         if not game:
             raise KeyError("game_not_found")
+        before = dict(game)
         s = _to_state(game)
         new_state, result = engine_flag(s, row, col)
         now = _now()
-        game["flag_mask"] = new_state.flag_mask
+        game["flag_mask"] = bitmask.to_str(new_state.flag_mask, new_state.cells)
         game["status"] = new_state.status
         game["moves_count"] = new_state.moves_count
         game["updated_at"] = now
@@ -270,13 +1066,16 @@ class InMemoryPersistence:
             "ms_since_game_start": int((now - (game.get("first_reveal_at") or now)).total_seconds() * 1000) if game.get("first_reveal_at") else None,
             "ms_since_prev_move": int((now - last_ts).total_seconds() * 1000) if last_ts else None,
         }
-        self._append_move(user_id, game, move)
-        return game, move
+        self._append_moves(user_id, [move], before)
+        # changed cells go back to the caller only; they are not part of the move record
+        return dict(game), move | {"changed": result["changed"]}
 
+    @_user_locked
     def abandon(self, user_id: str) -> Tuple[Dict[str, Any], Dict[str, Any]]:
         game = self.games.get(user_id)
         if not game:
             raise KeyError("game_not_found")
+        before = dict(game)
         now = _now()
         game["status"] = "abandoned"
         game["updated_at"] = now
@@ -295,15 +1094,16 @@ class InMemoryPersistence:
             "timestamp": now,
             "hit_mine": False,
             "cleared_cells": 0,
-            "flags_total": _count_flags(game["flag_mask"]),
-            "revealed_total": _count_revealed(game["revealed_mask"]),
+            "flags_total": _count_set(game["flag_mask"]),
+            "revealed_total": _count_set(game["revealed_mask"]),
             "status_after": game["status"],
             "ms_since_game_start": int((now - (game.get("first_reveal_at") or now)).total_seconds() * 1000) if game.get("first_reveal_at") else None,
             "ms_since_prev_move": int((now - last_ts).total_seconds() * 1000) if last_ts else None,
         }
-        self._append_move(user_id, game, move)
-        return game, move
+        self._append_moves(user_id, [move], before)
+        return dict(game), move
 
+    @_user_locked
     def get_stats(self, user_id: str) -> Dict[str, Any]:
         totals = self.stats_totals.get(user_id)
         if totals is None:
@@ -347,35 +1147,104 @@ class InMemoryPersistence:
             "byOption": by_option_list,
         }
 
-    def to_client(self, game: Dict[str, Any]) -> Dict[str, Any]:
+    def to_client(self, game: Dict[str, Any], board_format: str = "rows") -> Dict[str, Any]:
         s = _to_state(game)
-        board = to_client_view(s)
+        board = to_client_string(s) if board_format == "flat" else to_client_view(s)
         return {
             "status": game["status"],
             "board": board,
+            "board_format": board_format,
             "board_width": game["board_width"],
             "board_height": game["board_height"],
             "moves_count": game.get("moves_count", 0),
-            "flags_total": _count_flags(game["flag_mask"]),
-            "revealed_total": _count_revealed(game["revealed_mask"]),
+            "flags_total": s.flags_count,
+            "revealed_total": s.revealed_count,
             "num_mines": game["num_mines"],
             "end_result": game.get("end_result"),
         }
 
+    def to_client_delta(self, game: Dict[str, Any], move: Dict[str, Any]) -> Dict[str, Any]:
+        """Counters plus only the cells changed by ``move``, for ``?view=delta``."""
+        return _client_delta(game, move)
 
-class FirestorePersistence:
-    """Firestore-backed persistence using Native mode.
+    @_user_locked
+    def get_infinite_game(self, user_id: str) -> Optional[Dict[str, Any]]:
+        game = self.infinite_games.get(user_id)
+        return dict(game) if game is not None else None
 
-    Uses FIRESTORE_EMULATOR_HOST if present; otherwise connects to production.
+    @_user_locked
+    def start_infinite_game(self, user_id: str, mines_per_chunk: int, rng_seed: Optional[int] = None) -> Dict[str, Any]:
+        existing = self.infinite_games.get(user_id)
+        if existing and existing.get("status") == "active":
+            raise ValueError("active_game_exists")
+        state = infinite.new_game(mines_per_chunk, rng_seed=rng_seed)
+        doc = _new_infinite_doc(state, _now())
+        self.infinite_games[user_id] = doc
+        self.infinite_chunks[user_id] = {}
+        self._journal(("infinite", user_id, dict(doc), {}, True))
+        return dict(doc)
+
+    def _infinite_move(self, user_id: str, action: str, row: int, col: int) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        game = self.infinite_games.get(user_id)
+        if not game:
+            raise KeyError("game_not_found")
+        chunks = self.infinite_chunks.setdefault(user_id, {})
+        update, result, changed = _apply_infinite_action(game, lambda cr, cc: chunks.get((cr, cc)), action, row, col, _now())
+        game.update(update)
+        for chunk, masks in changed.items():
+            if _chunk_is_empty(masks):
+                chunks.pop(chunk, None)
+            else:
+                chunks[chunk] = masks
+        self._journal(("infinite", user_id, dict(game), {c: None if _chunk_is_empty(m) else m for c, m in changed.items()}, False))
+        return dict(game), result
+
+    @_user_locked
+    def infinite_reveal(self, user_id: str, row: int, col: int) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        return self._infinite_move(user_id, "reveal", row, col)
+
+    @_user_locked
+    def infinite_flag(self, user_id: str, row: int, col: int) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        return self._infinite_move(user_id, "flag", row, col)
+
+    @_user_locked
+    def infinite_abandon(self, user_id: str) -> Dict[str, Any]:
+        game = self.infinite_games.get(user_id)
+        if not game:
+            raise KeyError("game_not_found")
+        now = _now()
+        game["status"] = "abandoned"
+        game["updated_at"] = now
+        if not game.get("finished_at"):
+            game["finished_at"] = now
+        game["end_result"] = "abort"
+        self._journal(("infinite", user_id, dict(game), {}, False))
+        return dict(game)
+
+    @_user_locked
+    def infinite_view(self, user_id: str, row: int, col: int, height: int, width: int) -> Tuple[Dict[str, Any], list[str]]:
+        game = self.infinite_games.get(user_id)
+        if not game:
+            raise KeyError("game_not_found")
+        chunks = self.infinite_chunks.get(user_id, {})
+        masks = infinite.ChunkMasks(lambda cr, cc: chunks.get((cr, cc)))
+        return dict(game), infinite.view(_to_infinite_state(game), masks, row, col, height, width)
+
+
+class _FirestoreDocs:
+    """Document layout and in-transaction writes shared by the Firestore backends.
+
+    The sync and async clients differ only in how documents are read; writes on
+    either kind of transaction are buffered calls, so every ``*_in_tx`` helper
+    takes the already-read game document and works for both.
     """
 
-    def __init__(self, client: Optional[Any] = None) -> None:
-        if client is not None:
-            self.client = client
-        else:
-            if firestore is None:
-                raise RuntimeError("google-cloud-firestore not available")
-            self.client = firestore.Client(project=os.environ.get("GOOGLE_CLOUD_PROJECT"))
+    client: Any
+    derive_layout: bool
+    packed_moves: bool
+    compact_boards: bool
+    stats_cache_ttl: float
+    _stats_cache: Dict[str, Tuple[float, Dict[str, Any]]]
 
     def _game_ref(self, user_id: str):
         return self.client.collection("minesweeperGames").document(user_id)
@@ -408,14 +1277,12 @@ class FirestorePersistence:
             totals_update["losses"] = firestore.Increment(1)
         elif outcome == "abort":
             totals_update["aborts"] = firestore.Increment(1)
-        tx.set(sref, totals_update, merge=True)
         oref = self._stats_option_ref(user_id, key)
         option_update: Dict[str, Any] = {
             "board_width": width,
             "board_height": height,
             "num_mines": num_mines,
             "played": firestore.Increment(1),
-            "updated_at": now,
         }
         if outcome == "win":
             option_update["wins"] = firestore.Increment(1)
@@ -423,330 +1290,1326 @@ class FirestorePersistence:
             option_update["losses"] = firestore.Increment(1)
         elif outcome == "abort":
             option_update["aborts"] = firestore.Increment(1)
-        tx.set(oref, option_update, merge=True)
+        # The summary map mirrors byOption so /stats reads one document; byOption
+        # stays the source for backfilling summaries of older stats documents.
+        totals_update["summary"] = {key: dict(option_update)}
+        tx.set(sref, totals_update, merge=True)
+        tx.set(oref, option_update | {"updated_at": now}, merge=True)
 
-    def get_game(self, user_id: str) -> Optional[Dict[str, Any]]:
-        doc = self._game_ref(user_id).get()
-        if not doc.exists:
-            return None
-        data = doc.to_dict()
-        return data
+    def _committed(self, user_id: str, result):
+        """Return a committed move's ``result``, first dropping cached /stats if it may have finished the game."""
+        # Not in the transaction body: a /stats read before the commit lands would cache the old counts
+        if result[0].get("status") != "active":
+            self._stats_cache.pop(user_id, None)
+        return result
 
-    def start_game(
-        self,
-        user_id: str,
-        width: int,
-        height: int,
-        num_mines: int,
-        rng_seed: Optional[int] = None,
-    ) -> Dict[str, Any]:
-        @firestore.transactional
-        def _tx(tx):  # type: ignore
-            gref = self._game_ref(user_id)
-            snap = gref.get(transaction=tx)
-            if snap.exists:
-                data = snap.to_dict()
-                if data and data.get("status") == "active":
-                    raise ValueError("active_game_exists")
-            state = generate_new_game(width, height, num_mines, rng_seed=rng_seed)
-            now = _now()
-            doc = {
-                "status": state.status,
-                "created_at": now,
-                "updated_at": now,
-                "finished_at": None,
-                "board_width": width,
-                "board_height": height,
-                "num_mines": num_mines,
-                "moves_count": 0,
-                "mine_layout": state.mine_layout,
-                "revealed_mask": state.revealed_mask,
-                "flag_mask": state.flag_mask,
-                "mines_placed": state.mines_placed,
-                "rng_seed": state.rng_seed,
-                "first_reveal_at": None,
-                "result_time_ms": None,
-                "final_score": None,
-                "end_result": None,
-            }
-            tx.set(gref, doc)
-            # Optionally clear moves: Firestore doesn't support list, so delete all docs in subcollection lazily in client if needed.
-            return doc
+    def _cached_stats(self, user_id: str) -> Optional[Dict[str, Any]]:
+        hit = self._stats_cache.get(user_id)
+        if hit is not None and hit[0] > time.monotonic():
+            return hit[1]
+        return None
 
-        return _tx(self.client.transaction())
+    def _cache_stats(self, user_id: str, stats: Dict[str, Any]) -> None:
+        if self.stats_cache_ttl <= 0:
+            return
+        if len(self._stats_cache) >= STATS_CACHE_SIZE:
+            # Drop the oldest entry; dicts keep insertion order
+            self._stats_cache.pop(next(iter(self._stats_cache)), None)
+        self._stats_cache[user_id] = (time.monotonic() + self.stats_cache_ttl, stats)
 
-    def mark_error(self, user_id: str, reason: str) -> Dict[str, Any]:
-        if firestore is None:
-            raise RuntimeError("google-cloud-firestore not available")
+    def _summary_complete(self, data: Dict[str, Any]) -> bool:
+        # Every game counted in the totals since the summary map existed is in it too, so a
+        # document created since then has a summary whose games add up to the totals
+        if data.get("summary_complete"):
+            return True
+        summary = data.get("summary") or {}
+        return sum(int(opt.get("played", 0) or 0) for opt in summary.values()) == int(data.get("played", 0) or 0)
 
-        @firestore.transactional  # type: ignore
-        def _tx(tx):
-            gref = self._game_ref(user_id)
-            snap = gref.get(transaction=tx)
-            if not snap.exists:
-                raise KeyError("game_not_found")
-            game = snap.to_dict()
-            assert game is not None
-            now = _now()
-            update = {
-                "status": "error",
-                "updated_at": now,
-                "end_result": "error",
-            }
-            if not game.get("finished_at"):
-                update["finished_at"] = now
-            tx.update(gref, update)
-            moves_count = int(game.get("moves_count", 0)) + 1
-            last_ts = game.get("updated_at") or game.get("created_at")
-            move = {
-                "seq": moves_count,
-                "action": "error",
-                "row": None,
-                "col": None,
-                "timestamp": now,
-                "hit_mine": False,
-                "cleared_cells": 0,
-                "flags_total": _count_flags(game["flag_mask"]),
-                "revealed_total": _count_revealed(game["revealed_mask"]),
-                "status_after": "error",
-                "ms_since_game_start": int((now - (game.get("first_reveal_at") or now)).total_seconds() * 1000) if game.get("first_reveal_at") else None,
-                "ms_since_prev_move": int((now - last_ts).total_seconds() * 1000) if last_ts else None,
-                "error_reason": reason,
-            }
-            self._write_move(tx, user_id, game, move)
-            merged = dict(game)
-            merged.update(update)
-            merged["moves_count"] = moves_count
-            return merged
+    def _summary_options(self, data: Dict[str, Any]) -> list[Dict[str, Any]]:
+        summary = data.get("summary") or {}
+        return [summary[key] for key in sorted(summary)]
 
-        return _tx(self.client.transaction())
+    def _summary_from_options(self, options: list[Dict[str, Any]]) -> Dict[str, Any]:
+        summary: Dict[str, Any] = {}
+        for opt in options:
+            key = self._stats_key(int(opt.get("board_width", 0) or 0), int(opt.get("board_height", 0) or 0), int(opt.get("num_mines", 0) or 0))
+            summary[key] = {k: opt[k] for k in _SUMMARY_FIELDS if k in opt}
+        return summary
 
-    def _write_move(self, tx, user_id: str, game: Dict[str, Any], move: Dict[str, Any]) -> None:
-        seq = int(move["seq"])
-        mref = self._moves_ref(user_id).document(_seq_id(seq))
-        tx.set(mref, move)
+    def _backfill_in_tx(self, tx, sref, data: Dict[str, Any], options: list[Dict[str, Any]]) -> Dict[str, Any]:
+        # Replaces whatever partial summary newer writes already added to a legacy document
+        summary = self._summary_from_options(options)
+        tx.update(sref, {"summary": summary, "summary_complete": True})
+        return data | {"summary": summary, "summary_complete": True}
 
-    def reveal(self, user_id: str, row: int, col: int) -> Tuple[Dict[str, Any], Dict[str, Any]]:
-        if firestore is None:
-            raise RuntimeError("google-cloud-firestore not available")
+    def _move_chunk_ref(self, user_id: str, game: Dict[str, Any], chunk: int):
+        # Keyed by game as well: a new game restarts the log at index 0
+        return self._game_ref(user_id).collection("moveChunks").document(f"{_log_key(game)}_{_seq_id(chunk)}")
 
-        @firestore.transactional  # type: ignore
-        def _tx(tx):
-            gref = self._game_ref(user_id)
-            snap = gref.get(transaction=tx)
-            if not snap.exists:
-                raise KeyError("game_not_found")
-            game = snap.to_dict()
-            assert game is not None
-            s = _to_state(game)
-            new_state, result = engine_reveal(s, row, col)
-            now = _now()
-            update: Dict[str, Any] = {
-                "revealed_mask": new_state.revealed_mask,
-                "status": new_state.status,
-                "updated_at": now,
-                "moves_count": new_state.moves_count,
-            }
-            if game.get("first_reveal_at") is None and result.get("cleared_cells", 0) > 0:
-                update["first_reveal_at"] = now
-            finishing_now = False
-            if new_state.status in ("won", "lost") and not game.get("finished_at"):
-                finishing_now = True
-                update["finished_at"] = now
-                if game.get("first_reveal_at"):
-                    update["result_time_ms"] = int((now - game["first_reveal_at"]).total_seconds() * 1000)
-                update["end_result"] = "win" if new_state.status == "won" else "lose"
-            # reflect mines placement changes
-            update["mine_layout"] = new_state.mine_layout
-            update["mines_placed"] = new_state.mines_placed
-
-            tx.update(gref, update)
-
-            # Build move doc (use action sequence independent of engine moves_count)
-            moves_count = int(game.get("moves_count", 0)) + 1
-            last_ts = game.get("updated_at") or game.get("created_at")
-            move = {
-                "seq": moves_count,
-                "action": "reveal",
-                "row": row,
-                "col": col,
-                "timestamp": now,
-                "hit_mine": result["hit_mine"],
-                "cleared_cells": result["cleared_cells"],
-                "flags_total": result["flags_total"],
-                "revealed_total": result["revealed_total"],
-                "status_after": result["status_after"],
-                "ms_since_game_start": int((now - (game.get("first_reveal_at") or now)).total_seconds() * 1000) if game.get("first_reveal_at") else None,
-                "ms_since_prev_move": int((now - last_ts).total_seconds() * 1000) if last_ts else None,
-            }
-            self._write_move(tx, user_id, game, move)
-            # Compose in-memory view for response
-            merged = dict(game)
-            merged.update(update)
-            merged["moves_count"] = new_state.moves_count
-            if finishing_now:
-                outcome = "win" if new_state.status == "won" else "loss"
-                self._update_stats_tx(tx, user_id, merged, outcome, now)
-            return merged, move
+    def _write_game(self, tx, user_id: str, game: Dict[str, Any], update: Dict[str, Any], moves: list[Dict[str, Any]]) -> None:
+        """Apply ``update`` to the game document and log ``moves``; adds ``move_log_len`` to ``update`` for packed logs."""
+        entries: list[MoveEntry]
+        if game.get("move_log_format") == "packed":
+            start = int(game.get("move_log_len", 0) or 0)
+            update["move_log_len"] = start + len(moves)
+            entries = list(enumerate(moves, start))
+        else:
+            entries = [(None, move) for move in moves]
+        tx.update(self._game_ref(user_id), self._stored(game, update))
+        self._log_moves(tx, user_id, game, entries)
 
-        return _tx(self.client.transaction())
+    def _stored(self, game: Dict[str, Any], fields: Dict[str, Any]) -> Dict[str, Any]:
+        """``fields`` as written to ``game``'s document: compact board fields once the game uses them."""
+        if not (self.compact_boards or game.get("board_encoding") == BOARD_ENCODING):
+            return fields
+        if game.get("board_encoding") != BOARD_ENCODING:
+            # The first compact write converts the whole board, so a document never mixes encodings
+            fields = {name: game.get(name) for name in BOARD_FIELDS} | fields
+        return encode_board_fields(fields)
 
-    def flag(self, user_id: str, row: int, col: int) -> Tuple[Dict[str, Any], Dict[str, Any]]:
-        if firestore is None:
-            raise RuntimeError("google-cloud-firestore not available")
+    def _log_moves(self, tx, user_id: str, game: Dict[str, Any], entries: list[MoveEntry]) -> None:
+        self._write_move_entries(tx, user_id, game, entries)
 
-        @firestore.transactional  # type: ignore
-        def _tx(tx):
-            gref = self._game_ref(user_id)
-            snap = gref.get(transaction=tx)
-            if not snap.exists:
-                raise KeyError("game_not_found")
-            game = snap.to_dict()
-            assert game is not None
-            s = _to_state(game)
-            new_state, result = engine_flag(s, row, col)
-            now = _now()
-            update: Dict[str, Any] = {
-                "flag_mask": new_state.flag_mask,
-                "status": new_state.status,
-                "updated_at": now,
-                "moves_count": new_state.moves_count,
-            }
-            tx.update(gref, update)
-            moves_count = int(game.get("moves_count", 0)) + 1
-            last_ts = game.get("updated_at") or game.get("created_at")
-            move = {
-                "seq": moves_count,
-                "action": "flag",
-                "row": row,
-                "col": col,
-                "timestamp": now,
-                "hit_mine": False,
-                "cleared_cells": 0,
-                "flags_total": result["flags_total"],
-                "revealed_total": result["revealed_total"],
-                "status_after": result["status_after"],
-                "ms_since_game_start": int((now - (game.get("first_reveal_at") or now)).total_seconds() * 1000) if game.get("first_reveal_at") else None,
-                "ms_since_prev_move": int((now - last_ts).total_seconds() * 1000) if last_ts else None,
-            }
-            self._write_move(tx, user_id, game, move)
-            merged = dict(game)
-            merged.update(update)
-            merged["moves_count"] = new_state.moves_count
-            return merged, move
+    def _write_move_entries(self, writer, user_id: str, game: Dict[str, Any], entries: list[MoveEntry]) -> None:
+        """Queue the writes for ``entries`` on a transaction or write batch."""
+        if game.get("move_log_format") == "packed":
+            chunks: Dict[int, list[str]] = {}
+            for index, move in entries:
+                chunks.setdefault(index // move_log.MOVES_PER_CHUNK, []).append(move_log.pack_move(index, move))
+            for chunk, packed in chunks.items():
+                writer.set(self._move_chunk_ref(user_id, game, chunk), {"moves": firestore.ArrayUnion(packed)}, merge=True)
+            return
+        # Flags do not advance seq, so later actions may reuse a move id; keep the last one like separate requests would
+        for move in {int(m["seq"]): m for _, m in entries}.values():
+            writer.set(self._moves_ref(user_id).document(_seq_id(int(move["seq"]))), move)
 
-        return _tx(self.client.transaction())
+    def _move_chunk_count(self, game: Dict[str, Any]) -> int:
+        return -(-int(game.get("move_log_len", 0) or 0) // move_log.MOVES_PER_CHUNK)
+
+    def _start_in_tx(
+        self,
+        tx,
+        user_id: str,
+        existing: Optional[Dict[str, Any]],
+        width: int,
+        height: int,
+        num_mines: int,
+        rng_seed: Optional[int],
+    ) -> Dict[str, Any]:
+        if existing and existing.get("status") == "active":
+            raise ValueError("active_game_exists")
+        seed = rng_seed
+        if seed is None and self.derive_layout:
+            seed = random.SystemRandom().randrange(1 << 62)
+        state = generate_new_game(width, height, num_mines, rng_seed=seed)
+        now = _now()
+        doc = {
+            "status": state.status,
+            "created_at": now,
+            "updated_at": now,
+            "finished_at": None,
+            "board_width": width,
+            "board_height": height,
+            "num_mines": num_mines,
+            "moves_count": 0,
+            "mine_layout": None if self.derive_layout else state.mine_layout,
+            "revealed_mask": bitmask.to_str(state.revealed_mask, state.cells),
+            "flag_mask": bitmask.to_str(state.flag_mask, state.cells),
+            "mines_placed": state.mines_placed,
+            "rng_seed": state.rng_seed,
+            "first_click": None,
+            "move_log_format": "packed" if self.packed_moves else "docs",
+            "move_log_len": 0,
+            "first_reveal_at": None,
+            "result_time_ms": None,
+            "final_score": None,
+            "end_result": None,
+        }
+        if self.compact_boards:
+            doc = encode_board_fields(doc)
+        tx.set(self._game_ref(user_id), doc)
+        # Optionally clear moves: Firestore doesn't support list, so delete all docs in subcollection lazily in client if needed.
+        return doc
+
+    def _error_in_tx(self, tx, user_id: str, game: Dict[str, Any], reason: str) -> Dict[str, Any]:
+        now = _now()
+        update = {
+            "status": "error",
+            "updated_at": now,
+            "end_result": "error",
+        }
+        if not game.get("finished_at"):
+            update["finished_at"] = now
+        moves_count = int(game.get("moves_count", 0)) + 1
+        last_ts = game.get("updated_at") or game.get("created_at")
+        move = {
+            "seq": moves_count,
+            "action": "error",
+            "row": None,
+            "col": None,
+            "timestamp": now,
+            "hit_mine": False,
+            "cleared_cells": 0,
+            "flags_total": _count_set(game["flag_mask"]),
+            "revealed_total": _count_set(game["revealed_mask"]),
+            "status_after": "error",
+            "ms_since_game_start": int((now - (game.get("first_reveal_at") or now)).total_seconds() * 1000) if game.get("first_reveal_at") else None,
+            "ms_since_prev_move": int((now - last_ts).total_seconds() * 1000) if last_ts else None,
+            "error_reason": reason,
+        }
+        self._write_game(tx, user_id, game, update, [move])
+        merged = dict(game)
+        merged.update(update)
+        merged["moves_count"] = moves_count
+        return merged
+
+    def _reveal_in_tx(self, tx, user_id: str, game: Dict[str, Any], row: int, col: int) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        s = _to_state(game)
+        new_state, result = engine_reveal(s, row, col)
+        now = _now()
+        update: Dict[str, Any] = {
+            "revealed_mask": bitmask.to_str(new_state.revealed_mask, new_state.cells),
+            "status": new_state.status,
+            "updated_at": now,
+            "moves_count": new_state.moves_count,
+        }
+        if game.get("first_reveal_at") is None and result.get("cleared_cells", 0) > 0:
+            update["first_reveal_at"] = now
+        finishing_now = False
+        if new_state.status in ("won", "lost") and not game.get("finished_at"):
+            finishing_now = True
+            update["finished_at"] = now
+            if game.get("first_reveal_at"):
+                update["result_time_ms"] = int((now - game["first_reveal_at"]).total_seconds() * 1000)
+            update["end_result"] = "win" if new_state.status == "won" else "lose"
+        # the layout only changes when this reveal placed the mines
+        if new_state.mines_placed and not s.mines_placed:
+            update.update(_placement_update(new_state, _derives_layout(game)))
+
+        # Build move doc (use action sequence independent of engine moves_count)
+        moves_count = int(game.get("moves_count", 0)) + 1
+        last_ts = game.get("updated_at") or game.get("created_at")
+        move = {
+            "seq": moves_count,
+            "action": "reveal",
+            "row": row,
+            "col": col,
+            "timestamp": now,
+            "hit_mine": result["hit_mine"],
+            "cleared_cells": result["cleared_cells"],
+            "flags_total": result["flags_total"],
+            "revealed_total": result["revealed_total"],
+            "status_after": result["status_after"],
+            "ms_since_game_start": int((now - (game.get("first_reveal_at") or now)).total_seconds() * 1000) if game.get("first_reveal_at") else None,
+            "ms_since_prev_move": int((now - last_ts).total_seconds() * 1000) if last_ts else None,
+        }
+        self._write_game(tx, user_id, game, update, [move])
+        # Compose in-memory view for response
+        merged = dict(game)
+        merged.update(update)
+        merged["moves_count"] = new_state.moves_count
+        if finishing_now:
+            outcome = "win" if new_state.status == "won" else "loss"
+            self._update_stats_tx(tx, user_id, merged, outcome, now)
+        return merged, move | {"changed": result["changed"]}
+
+    def _moves_in_tx(self, tx, user_id: str, game: Dict[str, Any], actions: list[Dict[str, Any]]) -> Tuple[Dict[str, Any], list[Dict[str, Any]]]:
+        now = _now()
+        last_ts = game.get("updated_at") or game.get("created_at")
+        update, moves, outcome = _apply_actions(game, actions, now, last_ts, _derives_layout(game))
+        self._write_game(tx, user_id, game, update, [_move_record(m) for m in moves])
+        merged = dict(game)
+        merged.update(update)
+        if outcome:
+            self._update_stats_tx(tx, user_id, merged, outcome, now)
+        return merged, moves
+
+    def _flag_in_tx(self, tx, user_id: str, game: Dict[str, Any], row: int, col: int) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        s = _to_state(game)
+        new_state, result = engine_flag(s, row, col)
+        now = _now()
+        update: Dict[str, Any] = {
+            "flag_mask": bitmask.to_str(new_state.flag_mask, new_state.cells),
+            "status": new_state.status,
+            "updated_at": now,
+            "moves_count": new_state.moves_count,
+        }
+        moves_count = int(game.get("moves_count", 0)) + 1
+        last_ts = game.get("updated_at") or game.get("created_at")
+        move = {
+            "seq": moves_count,
+            "action": "flag",
+            "row": row,
+            "col": col,
+            "timestamp": now,
+            "hit_mine": False,
+            "cleared_cells": 0,
+            "flags_total": result["flags_total"],
+            "revealed_total": result["revealed_total"],
+            "status_after": result["status_after"],
+            "ms_since_game_start": int((now - (game.get("first_reveal_at") or now)).total_seconds() * 1000) if game.get("first_reveal_at") else None,
+            "ms_since_prev_move": int((now - last_ts).total_seconds() * 1000) if last_ts else None,
+        }
+        self._write_game(tx, user_id, game, update, [move])
+        merged = dict(game)
+        merged.update(update)
+        merged["moves_count"] = new_state.moves_count
+        return merged, move | {"changed": result["changed"]}
+
+    def _abandon_in_tx(self, tx, user_id: str, game: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        now = _now()
+        update = {
+            "status": "abandoned",
+            "updated_at": now,
+        }
+        finishing_now = not game.get("finished_at")
+        if finishing_now:
+            update["finished_at"] = now
+        update["end_result"] = "abort"
+        moves_count = int(game.get("moves_count", 0)) + 1
+        last_ts = game.get("updated_at") or game.get("created_at")
+        move = {
+            "seq": moves_count,
+            "action": "abandon",
+            "row": None,
+            "col": None,
+            "timestamp": now,
+            "hit_mine": False,
+            "cleared_cells": 0,
+            "flags_total": _count_set(game["flag_mask"]),
+            "revealed_total": _count_set(game["revealed_mask"]),
+            "status_after": "abandoned",
+            "ms_since_game_start": int((now - (game.get("first_reveal_at") or now)).total_seconds() * 1000) if game.get("first_reveal_at") else None,
+            "ms_since_prev_move": int((now - last_ts).total_seconds() * 1000) if last_ts else None,
+        }
+        self._write_game(tx, user_id, game, update, [move])
+        merged = dict(game)
+        merged.update(update)
+        merged["moves_count"] = moves_count
+        if finishing_now:
+            self._update_stats_tx(tx, user_id, merged, "abort", now)
+        return merged, move
+
+    def to_client(self, game: Dict[str, Any], board_format: str = "rows") -> Dict[str, Any]:
+        s = _to_state(game)
+        board = to_client_string(s) if board_format == "flat" else to_client_view(s)
+        return {
+            "status": game["status"],
+            "board": board,
+            "board_format": board_format,
+            "board_width": game["board_width"],
+            "board_height": game["board_height"],
+            "moves_count": game.get("moves_count", 0),
+            "flags_total": s.flags_count,
+            "revealed_total": s.revealed_count,
+            "num_mines": game["num_mines"],
+            "end_result": game.get("end_result"),
+        }
+
+    def to_client_delta(self, game: Dict[str, Any], move: Dict[str, Any]) -> Dict[str, Any]:
+        """Counters plus only the cells changed by ``move``, for ``?view=delta``."""
+        return _client_delta(game, move)
+
+    def _infinite_ref(self, user_id: str):
+        return self.client.collection("minesweeperInfiniteGames").document(user_id)
+
+    def _chunk_ref(self, user_id: str, chunk: infinite.Chunk):
+        return self._infinite_ref(user_id).collection("chunks").document(_chunk_id(chunk))
+
+    def _chunk_from_snap(self, snap) -> Tuple[bytes, bytes]:
+        data = snap.to_dict() or {}
+        return data.get("revealed", b""), data.get("flags", b"")
+
+    def _start_infinite_in_tx(
+        self, tx, user_id: str, existing: Optional[Dict[str, Any]], mines_per_chunk: int, rng_seed: Optional[int]
+    ) -> Dict[str, Any]:
+        if existing and existing.get("status") == "active":
+            raise ValueError("active_game_exists")
+        state = infinite.new_game(mines_per_chunk, rng_seed=rng_seed)
+        doc = _new_infinite_doc(state, _now())
+        tx.set(self._infinite_ref(user_id), doc)
+        # Chunks of an earlier game are never read again: a new rng_seed makes them unreachable
+        return doc
+
+    def _write_infinite_move(
+        self,
+        tx,
+        user_id: str,
+        game: Dict[str, Any],
+        update: Dict[str, Any],
+        changed: Dict[infinite.Chunk, Tuple[bytes, bytes]],
+        now: datetime,
+    ) -> Dict[str, Any]:
+        tx.update(self._infinite_ref(user_id), update)
+        for chunk, masks in changed.items():
+            cref = self._chunk_ref(user_id, chunk)
+            if _chunk_is_empty(masks):
+                tx.delete(cref)
+            else:
+                tx.set(cref, {"revealed": masks[0], "flags": masks[1], "updated_at": now})
+        merged = dict(game)
+        merged.update(update)
+        return merged
+
+    def _abandon_infinite_in_tx(self, tx, user_id: str, game: Dict[str, Any]) -> Dict[str, Any]:
+        now = _now()
+        update = {"status": "abandoned", "updated_at": now, "end_result": "abort"}
+        if not game.get("finished_at"):
+            update["finished_at"] = now
+        tx.update(self._infinite_ref(user_id), update)
+        merged = dict(game)
+        merged.update(update)
+        return merged
+
+
+class FirestorePersistence(_FirestoreDocs):
+    """Firestore-backed persistence using Native mode.
+
+    Uses FIRESTORE_EMULATOR_HOST if present; otherwise connects to production.
+    With ``derive_layout`` every game gets an rng_seed and documents store only
+    the first-click index; mine_layout is regenerated on read instead of stored.
+    With ``write_behind`` move records leave the transaction: they are queued
+    once it commits and written in batches by a ``WriteBehindMoveLog``.
+    With ``packed_moves`` new games log moves as packed strings appended to
+    ``moveChunks`` documents instead of one ``moves`` document per move.
+    ``get_stats`` answers from the stats document's summary map, cached for
+    ``stats_cache_ttl`` seconds per process.
+    With ``compact_boards`` new games, and older games on their next write,
+    store masks and layout in the compact ``BOARD_ENCODING``.
+    """
+
+    def __init__(
+        self,
+        client: Optional[Any] = None,
+        derive_layout: bool = False,
+        write_behind: Optional[MoveLogConfig] = None,
+        packed_moves: bool = False,
+        stats_cache_ttl: float = STATS_CACHE_TTL,
+        compact_boards: bool = False,
+    ) -> None:
+        self.derive_layout = derive_layout
+        self.packed_moves = packed_moves
+        self.compact_boards = compact_boards
+        self.stats_cache_ttl = stats_cache_ttl
+        self._stats_cache = {}
+        if client is None:
+            if firestore is None:
+                raise RuntimeError("google-cloud-firestore not available")
+            client = firestore.Client(project=os.environ.get("GOOGLE_CLOUD_PROJECT"))
+        self.client = CountingClient(client, is_async=False)
+        self.move_log: Optional[WriteBehindMoveLog] = None
+        self._local = threading.local()
+        if write_behind is not None:
+            self.move_log = WriteBehindMoveLog(self._commit_moves, write_behind)
+            self.move_log.start()
+
+    def close(self) -> None:
+        if self.move_log is not None:
+            self.move_log.close()
+
+    def _commit_moves(self, records: list[MoveRecord]) -> None:
+        # Each record is (user_id, (log, index, move)); runs of one game's log share its writes
+        batch = self.client.batch()
+        group: list[MoveEntry] = []
+        for i, (user_id, (log, index, move)) in enumerate(records):
+            group.append((index, move))
+            nxt = records[i + 1] if i + 1 < len(records) else None
+            if nxt is None or nxt[0] != user_id or nxt[1][0] != log:
+                self._write_move_entries(batch, user_id, log, group)
+                group = []
+        batch.commit()
+
+    def _log_moves(self, tx, user_id: str, game: Dict[str, Any], entries: list[MoveEntry]) -> None:
+        if self.move_log is None:
+            super()._log_moves(tx, user_id, game, entries)
+        else:
+            # Just what _write_move_entries needs to find the log again
+            log = {"move_log_format": game.get("move_log_format"), "created_at": game.get("created_at")}
+            self._local.moves.extend((log, index, move) for index, move in entries)
+
+    def _transact(self, user_id: str, body):
+        """Run ``body(tx)`` in a transaction, then queue its move records for write-behind."""
+        if firestore is None:
+            raise RuntimeError("google-cloud-firestore not available")
+
+        @firestore.transactional  # type: ignore
+        def _tx(tx):
+            # A retried attempt starts over, so only the committed attempt's moves survive
+            self._local.moves = []
+            return body(tx)
+
+        result = _tx(self.client.transaction())
+        if self.move_log is not None:
+            self.move_log.extend(user_id, self._local.moves)
+        return result
+
+    def _read_game(self, tx, user_id: str) -> Dict[str, Any]:
+        snap = self._game_ref(user_id).get(transaction=tx)
+        if not snap.exists:
+            raise KeyError("game_not_found")
+        game = snap.to_dict()
+        assert game is not None
+        return game
+
+    def get_game(self, user_id: str) -> Optional[Dict[str, Any]]:
+        doc = self._game_ref(user_id).get()
+        if not doc.exists:
+            return None
+        data = doc.to_dict()
+        return data
+
+    def get_moves(self, user_id: str) -> list[Dict[str, Any]]:
+        """Move records of the current game, oldest first, in either log format."""
+        game = self.get_game(user_id)
+        if not game:
+            raise KeyError("game_not_found")
+        if game.get("move_log_format") == "packed":
+            refs = [self._move_chunk_ref(user_id, game, c) for c in range(self._move_chunk_count(game))]
+            snaps = self.client.get_all(refs) if refs else []
+            return move_log.expand_chunks((snap.to_dict() or {}).get("moves", []) for snap in snaps if snap.exists)
+        moves = (snap.to_dict() for snap in self._moves_ref(user_id).stream())
+        # Move documents of earlier games are never deleted
+        return [m for m in moves if m and m["timestamp"] >= game["created_at"]]
+
+    def start_game(
+        self,
+        user_id: str,
+        width: int,
+        height: int,
+        num_mines: int,
+        rng_seed: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        def body(tx):
+            snap = self._game_ref(user_id).get(transaction=tx)
+            existing = snap.to_dict() if snap.exists else None
+            return self._start_in_tx(tx, user_id, existing, width, height, num_mines, rng_seed)
+
+        return self._transact(user_id, body)
+
+    def mark_error(self, user_id: str, reason: str) -> Dict[str, Any]:
+        return self._transact(user_id, lambda tx: self._error_in_tx(tx, user_id, self._read_game(tx, user_id), reason))
+
+    def reveal(self, user_id: str, row: int, col: int) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        return self._committed(user_id, self._transact(user_id, lambda tx: self._reveal_in_tx(tx, user_id, self._read_game(tx, user_id), row, col)))
+
+    def apply_moves(self, user_id: str, actions: list[Dict[str, Any]]) -> Tuple[Dict[str, Any], list[Dict[str, Any]]]:
+        """Apply a batch of actions and persist the result in one transaction."""
+        return self._committed(user_id, self._transact(user_id, lambda tx: self._moves_in_tx(tx, user_id, self._read_game(tx, user_id), actions)))
+
+    def flag(self, user_id: str, row: int, col: int) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        return self._transact(user_id, lambda tx: self._flag_in_tx(tx, user_id, self._read_game(tx, user_id), row, col))
 
     def abandon(self, user_id: str) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        return self._committed(user_id, self._transact(user_id, lambda tx: self._abandon_in_tx(tx, user_id, self._read_game(tx, user_id))))
+
+    def get_stats(self, user_id: str) -> Dict[str, Any]:
+        cached = self._cached_stats(user_id)
+        if cached is not None:
+            return cached
+        sref = self._stats_ref(user_id)
+        snap = sref.get()
+        data = (snap.to_dict() or {}) if snap.exists else {}
+        if snap.exists and not self._summary_complete(data):
+            data = self._backfill_summary(user_id)
+        stats = _stats_response(data, self._summary_options(data))
+        self._cache_stats(user_id, stats)
+        return stats
+
+    def _backfill_summary(self, user_id: str) -> Dict[str, Any]:
+        """Build the summary map of a stats document written before it existed."""
+        sref = self._stats_ref(user_id)
+
+        @firestore.transactional  # type: ignore
+        def _tx(tx):
+            data = sref.get(transaction=tx).to_dict() or {}
+            if self._summary_complete(data):
+                return data
+            options = [snap.to_dict() or {} for snap in sref.collection("byOption").stream(transaction=tx)]
+            return self._backfill_in_tx(tx, sref, data, options)
+
+        return _tx(self.client.transaction())
+
+    def _read_chunks(self, user_id: str, chunks: list[infinite.Chunk], transaction=None) -> Dict[infinite.Chunk, Tuple[bytes, bytes]]:
+        refs = [self._chunk_ref(user_id, c) for c in chunks]
+        by_path = {ref.path: c for ref, c in zip(refs, chunks)}
+        found: Dict[infinite.Chunk, Tuple[bytes, bytes]] = {}
+        for snap in self.client.get_all(refs, transaction=transaction):
+            if snap.exists:
+                found[by_path[snap.reference.path]] = self._chunk_from_snap(snap)
+        return found
+
+    def _read_infinite_game(self, tx, user_id: str) -> Dict[str, Any]:
+        snap = self._infinite_ref(user_id).get(transaction=tx)
+        if not snap.exists:
+            raise KeyError("game_not_found")
+        game = snap.to_dict()
+        assert game is not None
+        return game
+
+    def get_infinite_game(self, user_id: str) -> Optional[Dict[str, Any]]:
+        doc = self._infinite_ref(user_id).get()
+        if not doc.exists:
+            return None
+        return doc.to_dict()
+
+    def start_infinite_game(self, user_id: str, mines_per_chunk: int, rng_seed: Optional[int] = None) -> Dict[str, Any]:
         if firestore is None:
             raise RuntimeError("google-cloud-firestore not available")
 
         @firestore.transactional  # type: ignore
         def _tx(tx):
-            gref = self._game_ref(user_id)
-            snap = gref.get(transaction=tx)
-            if not snap.exists:
-                raise KeyError("game_not_found")
-            game = snap.to_dict()
-            assert game is not None
+            snap = self._infinite_ref(user_id).get(transaction=tx)
+            existing = snap.to_dict() if snap.exists else None
+            return self._start_infinite_in_tx(tx, user_id, existing, mines_per_chunk, rng_seed)
+
+        return _tx(self.client.transaction())
+
+    def _infinite_move(self, user_id: str, action: str, row: int, col: int) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        if firestore is None:
+            raise RuntimeError("google-cloud-firestore not available")
+
+        @firestore.transactional  # type: ignore
+        def _tx(tx):
+            game = self._read_infinite_game(tx, user_id)
+            # A flood fill reaching past the prefetched chunks loads the rest one by one
+            prefetch = _prefetch_chunks(game, action, row, col)
+            loaded = self._read_chunks(user_id, prefetch, transaction=tx)
+            fetched = set(prefetch)
+
+            def load(cr: int, cc: int):
+                if (cr, cc) not in fetched:
+                    fetched.add((cr, cc))
+                    loaded.update(self._read_chunks(user_id, [(cr, cc)], transaction=tx))
+                return loaded.get((cr, cc))
+
+            now = _now()
+            update, result, changed = _apply_infinite_action(game, load, action, row, col, now)
+            return self._write_infinite_move(tx, user_id, game, update, changed, now), result
+
+        return _tx(self.client.transaction())
+
+    def infinite_reveal(self, user_id: str, row: int, col: int) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        return self._infinite_move(user_id, "reveal", row, col)
+
+    def infinite_flag(self, user_id: str, row: int, col: int) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        return self._infinite_move(user_id, "flag", row, col)
+
+    def infinite_abandon(self, user_id: str) -> Dict[str, Any]:
+        if firestore is None:
+            raise RuntimeError("google-cloud-firestore not available")
+
+        @firestore.transactional  # type: ignore
+        def _tx(tx):
+            return self._abandon_infinite_in_tx(tx, user_id, self._read_infinite_game(tx, user_id))
+
+        return _tx(self.client.transaction())
+
+    def infinite_view(self, user_id: str, row: int, col: int, height: int, width: int) -> Tuple[Dict[str, Any], list[str]]:
+        game = self.get_infinite_game(user_id)
+        if not game:
+            raise KeyError("game_not_found")
+        loaded = self._read_chunks(user_id, _view_chunks(row, col, height, width))
+        masks = infinite.ChunkMasks(lambda cr, cc: loaded.get((cr, cc)))
+        return game, infinite.view(_to_infinite_state(game), masks, row, col, height, width)
+
+
+class _ChunkNotLoaded(Exception):
+    def __init__(self, chunk: infinite.Chunk) -> None:
+        super().__init__(chunk)
+        self.chunk = chunk
+
+
+class AsyncFirestorePersistence(_FirestoreDocs):
+    """Firestore persistence on the asyncio client.
+
+    Same documents and transactions as ``FirestorePersistence``, but reads are
+    awaited, so a request waiting on Firestore holds no worker thread. Every
+    public method except ``to_client``/``to_client_delta`` is a coroutine.
+    """
+
+    is_async = True
+
+    def __init__(
+        self,
+        client: Optional[Any] = None,
+        derive_layout: bool = False,
+        packed_moves: bool = False,
+        stats_cache_ttl: float = STATS_CACHE_TTL,
+        compact_boards: bool = False,
+    ) -> None:
+        self.derive_layout = derive_layout
+        self.packed_moves = packed_moves
+        self.compact_boards = compact_boards
+        self.stats_cache_ttl = stats_cache_ttl
+        self._stats_cache = {}
+        if client is None:
+            if firestore is None:
+                raise RuntimeError("google-cloud-firestore not available")
+            client = firestore.AsyncClient(project=os.environ.get("GOOGLE_CLOUD_PROJECT"))
+        self.client = CountingClient(client, is_async=True)
+
+    async def _read_game(self, tx, user_id: str) -> Dict[str, Any]:
+        snap = await self._game_ref(user_id).get(transaction=tx)
+        if not snap.exists:
+            raise KeyError("game_not_found")
+        game = snap.to_dict()
+        assert game is not None
+        return game
+
+    async def get_game(self, user_id: str) -> Optional[Dict[str, Any]]:
+        doc = await self._game_ref(user_id).get()
+        if not doc.exists:
+            return None
+        return doc.to_dict()
+
+    async def get_moves(self, user_id: str) -> list[Dict[str, Any]]:
+        game = await self.get_game(user_id)
+        if not game:
+            raise KeyError("game_not_found")
+        if game.get("move_log_format") == "packed":
+            refs = [self._move_chunk_ref(user_id, game, c) for c in range(self._move_chunk_count(game))]
+            chunks = [(snap.to_dict() or {}).get("moves", []) async for snap in self.client.get_all(refs) if snap.exists] if refs else []
+            return move_log.expand_chunks(chunks)
+        moves = [snap.to_dict() async for snap in self._moves_ref(user_id).stream()]
+        return [m for m in moves if m and m["timestamp"] >= game["created_at"]]
+
+    async def start_game(
+        self,
+        user_id: str,
+        width: int,
+        height: int,
+        num_mines: int,
+        rng_seed: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        @firestore.async_transactional  # type: ignore
+        async def _tx(tx):
+            snap = await self._game_ref(user_id).get(transaction=tx)
+            existing = snap.to_dict() if snap.exists else None
+            return self._start_in_tx(tx, user_id, existing, width, height, num_mines, rng_seed)
+
+        return await _tx(self.client.transaction())
+
+    async def mark_error(self, user_id: str, reason: str) -> Dict[str, Any]:
+        @firestore.async_transactional  # type: ignore
+        async def _tx(tx):
+            return self._error_in_tx(tx, user_id, await self._read_game(tx, user_id), reason)
+
+        return await _tx(self.client.transaction())
+
+    async def reveal(self, user_id: str, row: int, col: int) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        @firestore.async_transactional  # type: ignore
+        async def _tx(tx):
+            return self._reveal_in_tx(tx, user_id, await self._read_game(tx, user_id), row, col)
+
+        return self._committed(user_id, await _tx(self.client.transaction()))
+
+    async def apply_moves(self, user_id: str, actions: list[Dict[str, Any]]) -> Tuple[Dict[str, Any], list[Dict[str, Any]]]:
+        @firestore.async_transactional  # type: ignore
+        async def _tx(tx):
+            return self._moves_in_tx(tx, user_id, await self._read_game(tx, user_id), actions)
+
+        return self._committed(user_id, await _tx(self.client.transaction()))
+
+    async def flag(self, user_id: str, row: int, col: int) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        @firestore.async_transactional  # type: ignore
+        async def _tx(tx):
+            return self._flag_in_tx(tx, user_id, await self._read_game(tx, user_id), row, col)
+
+        return await _tx(self.client.transaction())
+
+    async def abandon(self, user_id: str) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        @firestore.async_transactional  # type: ignore
+        async def _tx(tx):
+            return self._abandon_in_tx(tx, user_id, await self._read_game(tx, user_id))
+
+        return self._committed(user_id, await _tx(self.client.transaction()))
+
+    async def get_stats(self, user_id: str) -> Dict[str, Any]:
+        cached = self._cached_stats(user_id)
+        if cached is not None:
+            return cached
+        sref = self._stats_ref(user_id)
+        snap = await sref.get()
+        data = (snap.to_dict() or {}) if snap.exists else {}
+        if snap.exists and not self._summary_complete(data):
+            data = await self._backfill_summary(user_id)
+        stats = _stats_response(data, self._summary_options(data))
+        self._cache_stats(user_id, stats)
+        return stats
+
+    async def _backfill_summary(self, user_id: str) -> Dict[str, Any]:
+        sref = self._stats_ref(user_id)
+
+        @firestore.async_transactional  # type: ignore
+        async def _tx(tx):
+            data = (await sref.get(transaction=tx)).to_dict() or {}
+            if self._summary_complete(data):
+                return data
+            options = [snap.to_dict() or {} async for snap in sref.collection("byOption").stream(transaction=tx)]
+            return self._backfill_in_tx(tx, sref, data, options)
+
+        return await _tx(self.client.transaction())
+
+    async def _read_chunks(self, user_id: str, chunks: list[infinite.Chunk], transaction=None) -> Dict[infinite.Chunk, Tuple[bytes, bytes]]:
+        refs = [self._chunk_ref(user_id, c) for c in chunks]
+        by_path = {ref.path: c for ref, c in zip(refs, chunks)}
+        found: Dict[infinite.Chunk, Tuple[bytes, bytes]] = {}
+        async for snap in self.client.get_all(refs, transaction=transaction):
+            if snap.exists:
+                found[by_path[snap.reference.path]] = self._chunk_from_snap(snap)
+        return found
+
+    async def _read_infinite_game(self, tx, user_id: str) -> Dict[str, Any]:
+        snap = await self._infinite_ref(user_id).get(transaction=tx)
+        if not snap.exists:
+            raise KeyError("game_not_found")
+        game = snap.to_dict()
+        assert game is not None
+        return game
+
+    async def get_infinite_game(self, user_id: str) -> Optional[Dict[str, Any]]:
+        doc = await self._infinite_ref(user_id).get()
+        if not doc.exists:
+            return None
+        return doc.to_dict()
+
+    async def start_infinite_game(self, user_id: str, mines_per_chunk: int, rng_seed: Optional[int] = None) -> Dict[str, Any]:
+        @firestore.async_transactional  # type: ignore
+        async def _tx(tx):
+            snap = await self._infinite_ref(user_id).get(transaction=tx)
+            existing = snap.to_dict() if snap.exists else None
+            return self._start_infinite_in_tx(tx, user_id, existing, mines_per_chunk, rng_seed)
+
+        return await _tx(self.client.transaction())
+
+    async def _infinite_move(self, user_id: str, action: str, row: int, col: int) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        @firestore.async_transactional  # type: ignore
+        async def _tx(tx):
+            game = await self._read_infinite_game(tx, user_id)
+            prefetch = _prefetch_chunks(game, action, row, col)
+            fetched = set(prefetch)
+            loaded = await self._read_chunks(user_id, prefetch, transaction=tx)
+
+            def load(cr: int, cc: int):
+                if (cr, cc) not in fetched:
+                    raise _ChunkNotLoaded((cr, cc))
+                return loaded.get((cr, cc))
+
+            # The engine cannot await a read mid flood fill: when it walks past the
+            # loaded chunks, fetch the missing chunk's ring and replay the move.
+            now = _now()
+            while True:
+                try:
+                    update, result, changed = _apply_infinite_action(game, load, action, row, col, now)
+                    break
+                except _ChunkNotLoaded as missing:
+                    ring = [c for c in _chunk_ring(*missing.chunk) if c not in fetched]
+                    fetched.update(ring)
+                    loaded.update(await self._read_chunks(user_id, ring, transaction=tx))
+            return self._write_infinite_move(tx, user_id, game, update, changed, now), result
+
+        return await _tx(self.client.transaction())
+
+    async def infinite_reveal(self, user_id: str, row: int, col: int) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        return await self._infinite_move(user_id, "reveal", row, col)
+
+    async def infinite_flag(self, user_id: str, row: int, col: int) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        return await self._infinite_move(user_id, "flag", row, col)
+
+    async def infinite_abandon(self, user_id: str) -> Dict[str, Any]:
+        @firestore.async_transactional  # type: ignore
+        async def _tx(tx):
+            return self._abandon_infinite_in_tx(tx, user_id, await self._read_infinite_game(tx, user_id))
+
+        return await _tx(self.client.transaction())
+
+    async def infinite_view(self, user_id: str, row: int, col: int, height: int, width: int) -> Tuple[Dict[str, Any], list[str]]:
+        game = await self.get_infinite_game(user_id)
+        if not game:
+            raise KeyError("game_not_found")
+        loaded = await self._read_chunks(user_id, _view_chunks(row, col, height, width))
+        masks = infinite.ChunkMasks(lambda cr, cc: loaded.get((cr, cc)))
+        return game, infinite.view(_to_infinite_state(game), masks, row, col, height, width)
+
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS games (
+    user_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    created_at INTEGER NOT NULL,
+    updated_at INTEGER NOT NULL,
+    finished_at INTEGER,
+    board_width INTEGER NOT NULL,
+    board_height INTEGER NOT NULL,
+    num_mines INTEGER NOT NULL,
+    moves_count INTEGER NOT NULL,
+    mine_layout BLOB,
+    revealed_mask BLOB NOT NULL,
+    flag_mask BLOB NOT NULL,
+    mines_placed INTEGER NOT NULL,
+    rng_seed INTEGER,
+    first_click INTEGER,
+    first_reveal_at INTEGER,
+    result_time_ms INTEGER,
+    final_score INTEGER,
+    end_result TEXT
+);
+CREATE TABLE IF NOT EXISTS moves (
+    user_id TEXT NOT NULL,
+    seq INTEGER,
+    action TEXT NOT NULL,
+    row INTEGER,
+    col INTEGER,
+    hit_mine INTEGER NOT NULL,
+    cleared_cells INTEGER NOT NULL,
+    flags_total INTEGER NOT NULL,
+    revealed_total INTEGER NOT NULL,
+    status_after TEXT NOT NULL,
+    timestamp INTEGER NOT NULL,
+    ms_since_game_start INTEGER,
+    ms_since_prev_move INTEGER,
+    error_reason TEXT
+);
+CREATE INDEX IF NOT EXISTS moves_by_user ON moves (user_id);
+CREATE TABLE IF NOT EXISTS stats_by_option (
+    user_id TEXT NOT NULL,
+    board_width INTEGER NOT NULL,
+    board_height INTEGER NOT NULL,
+    num_mines INTEGER NOT NULL,
+    played INTEGER NOT NULL DEFAULT 0,
+    wins INTEGER NOT NULL DEFAULT 0,
+    losses INTEGER NOT NULL DEFAULT 0,
+    aborts INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, board_width, board_height, num_mines)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS infinite_games (
+    user_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    created_at INTEGER NOT NULL,
+    updated_at INTEGER NOT NULL,
+    finished_at INTEGER,
+    mines_per_chunk INTEGER NOT NULL,
+    rng_seed INTEGER NOT NULL,
+    origin_row INTEGER,
+    origin_col INTEGER,
+    moves_count INTEGER NOT NULL,
+    revealed_total INTEGER NOT NULL,
+    flags_total INTEGER NOT NULL,
+    end_result TEXT
+);
+CREATE TABLE IF NOT EXISTS infinite_chunks (
+    user_id TEXT NOT NULL,
+    crow INTEGER NOT NULL,
+    ccol INTEGER NOT NULL,
+    revealed BLOB NOT NULL,
+    flags BLOB NOT NULL,
+    PRIMARY KEY (user_id, crow, ccol)
+) WITHOUT ROWID;
+"""
+_MOVE_COLUMNS = (
+    "seq",
+    "action",
+    "row",
+    "col",
+    "hit_mine",
+    "cleared_cells",
+    "flags_total",
+    "revealed_total",
+    "status_after",
+    "timestamp",
+    "ms_since_game_start",
+    "ms_since_prev_move",
+    "error_reason",
+)
+_INFINITE_COLUMNS = (
+    "status",
+    "created_at",
+    "updated_at",
+    "finished_at",
+    "mines_per_chunk",
+    "rng_seed",
+    "origin_row",
+    "origin_col",
+    "moves_count",
+    "revealed_total",
+    "flags_total",
+    "end_result",
+)
+_TIME_COLUMNS = frozenset({"created_at", "updated_at", "finished_at", "first_reveal_at", "timestamp"})
+_SQL_GAME = f"SELECT {', '.join(_GAME_COLUMNS)} FROM games WHERE user_id = ?"
+_SQL_PUT_GAME = f"INSERT OR REPLACE INTO games (user_id, {', '.join(_GAME_COLUMNS)}) VALUES (?{', ?' * len(_GAME_COLUMNS)})"
+_SQL_MOVES = f"SELECT {', '.join(_MOVE_COLUMNS)} FROM moves WHERE user_id = ? ORDER BY rowid"
+_SQL_ADD_MOVE = f"INSERT INTO moves (user_id, {', '.join(_MOVE_COLUMNS)}) VALUES (?{', ?' * len(_MOVE_COLUMNS)})"
+_SQL_ADD_STATS = """
+INSERT INTO stats_by_option (user_id, board_width, board_height, num_mines, played, wins, losses, aborts)
+VALUES (?, ?, ?, ?, 1, ?, ?, ?)
+ON CONFLICT (user_id, board_width, board_height, num_mines) DO UPDATE SET
+    played = played + 1, wins = wins + excluded.wins, losses = losses + excluded.losses, aborts = aborts + excluded.aborts
+"""
+_SQL_STATS = (
+    "SELECT board_width, board_height, num_mines, played, wins, losses, aborts FROM stats_by_option"
+    " WHERE user_id = ? ORDER BY board_width, board_height, num_mines"
+)
+_SQL_INFINITE = f"SELECT {', '.join(_INFINITE_COLUMNS)} FROM infinite_games WHERE user_id = ?"
+_SQL_PUT_INFINITE = f"INSERT OR REPLACE INTO infinite_games (user_id, {', '.join(_INFINITE_COLUMNS)}) VALUES (?{', ?' * len(_INFINITE_COLUMNS)})"
+_SQL_ACTIVE = "SELECT (SELECT COUNT(*) FROM games WHERE status = 'active'), (SELECT COUNT(*) FROM infinite_games WHERE status = 'active')"
+_SQL_CHUNK = "SELECT revealed, flags FROM infinite_chunks WHERE user_id = ? AND crow = ? AND ccol = ?"
+_SQL_PUT_CHUNK = "INSERT OR REPLACE INTO infinite_chunks (user_id, crow, ccol, revealed, flags) VALUES (?, ?, ?, ?, ?)"
+_SQL_DELETE_CHUNK = "DELETE FROM infinite_chunks WHERE user_id = ? AND crow = ? AND ccol = ?"
+
+
+def _to_micros(value: Optional[datetime]) -> Optional[int]:
+    return (value - _EPOCH) // timedelta(microseconds=1) if value is not None else None
+
+
+def _from_micros(value: Optional[int]) -> Optional[datetime]:
+    return _EPOCH + timedelta(microseconds=value) if value is not None else None
+
+
+def _game_row(user_id: str, game: Dict[str, Any]) -> tuple:
+    values = dict(game)
+    for col in _TIME_COLUMNS & values.keys():
+        values[col] = _to_micros(values[col])
+    values["revealed_mask"] = bitmask.from_str(game["revealed_mask"])
+    values["flag_mask"] = bitmask.from_str(game["flag_mask"])
+    values["mine_layout"] = game["mine_layout"].encode("ascii") if game.get("mine_layout") else None
+    values["mines_placed"] = int(bool(game.get("mines_placed")))
+    return (user_id, *(values.get(col) for col in _GAME_COLUMNS))
+
+
+def _game_from_row(row: tuple) -> Dict[str, Any]:
+    game = dict(zip(_GAME_COLUMNS, row))
+    cells = game["board_width"] * game["board_height"]
+    for col in _TIME_COLUMNS & game.keys():
+        game[col] = _from_micros(game[col])
+    game["revealed_mask"] = bitmask.to_str(game["revealed_mask"], cells)
+    game["flag_mask"] = bitmask.to_str(game["flag_mask"], cells)
+    game["mine_layout"] = game["mine_layout"].decode("ascii") if game["mine_layout"] is not None else None
+    game["mines_placed"] = bool(game["mines_placed"])
+    return game
+
+
+def _move_row(user_id: str, move: Dict[str, Any]) -> tuple:
+    return (user_id, *(_to_micros(move.get(col)) if col in _TIME_COLUMNS else move.get(col) for col in _MOVE_COLUMNS))
+
+
+def _move_from_row(row: tuple) -> Dict[str, Any]:
+    move = dict(zip(_MOVE_COLUMNS, row))
+    move["timestamp"] = _from_micros(move["timestamp"])
+    move["hit_mine"] = bool(move["hit_mine"])
+    # error_reason only exists on error moves, as in the other backends
+    if move["error_reason"] is None:
+        del move["error_reason"]
+    return move
+
+
+def _infinite_row(user_id: str, game: Dict[str, Any]) -> tuple:
+    values = dict(game)
+    for col in _TIME_COLUMNS & values.keys():
+        values[col] = _to_micros(values[col])
+    origin = game.get("origin")
+    values["origin_row"], values["origin_col"] = origin if origin is not None else (None, None)
+    return (user_id, *(values.get(col) for col in _INFINITE_COLUMNS))
+
+
+def _infinite_from_row(row: tuple) -> Dict[str, Any]:
+    values = dict(zip(_INFINITE_COLUMNS, row))
+    origin_row, origin_col = values.pop("origin_row"), values.pop("origin_col")
+    game: Dict[str, Any] = {"mode": "infinite", **values}
+    game["origin"] = [origin_row, origin_col] if origin_row is not None else None
+    for col in _TIME_COLUMNS & game.keys():
+        game[col] = _from_micros(game[col])
+    return game
+
+
+class SqlitePersistence:
+    """Single-file SQLite persistence for self-hosted and single-node deployments.
+
+    The database runs in WAL mode, so readers never wait on the writer. Each
+    thread gets its own connection; every write is one ``BEGIN IMMEDIATE``
+    transaction, which serializes concurrent moves on the database write lock.
+    Masks are stored as packed bitmask blobs, timestamps as epoch microseconds.
+    Statements are fixed strings and come out of each connection's statement cache.
+    """
+
+    def __init__(self, path: str, derive_layout: bool = False, busy_timeout: float = 5.0) -> None:
+        if path == ":memory:" or not path:
+            # Every connection would open its own private database
+            raise ValueError("sqlite persistence needs a database file")
+        self.path = path
+        self.derive_layout = derive_layout
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._connections: list[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        self._conn().executescript(_SQLITE_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Autocommit mode: transactions are opened explicitly in _write
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None, check_same_thread=False, cached_statements=256)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # Durable across process crashes; a power loss may drop the last transactions
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    @contextlib.contextmanager
+    def _write(self):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def close(self) -> None:
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+    def _read_game(self, conn: sqlite3.Connection, user_id: str) -> Optional[Dict[str, Any]]:
+        row = conn.execute(_SQL_GAME, (user_id,)).fetchone()
+        return _game_from_row(row) if row is not None else None
+
+    def _require_game(self, conn: sqlite3.Connection, user_id: str) -> Dict[str, Any]:
+        game = self._read_game(conn, user_id)
+        if game is None:
+            raise KeyError("game_not_found")
+        return game
+
+    def _save_game(self, conn: sqlite3.Connection, user_id: str, game: Dict[str, Any], moves: list[Dict[str, Any]]) -> None:
+        conn.execute(_SQL_PUT_GAME, _game_row(user_id, game))
+        conn.executemany(_SQL_ADD_MOVE, [_move_row(user_id, m) for m in moves])
+
+    def _update_stats(self, conn: sqlite3.Connection, user_id: str, game: Dict[str, Any], outcome: str) -> None:
+        conn.execute(
+            _SQL_ADD_STATS,
+            (
+                user_id,
+                int(game["board_width"]),
+                int(game["board_height"]),
+                int(game["num_mines"]),
+                int(outcome == "win"),
+                int(outcome == "loss"),
+                int(outcome == "abort"),
+            ),
+        )
+
+    def get_game(self, user_id: str) -> Optional[Dict[str, Any]]:
+        return self._read_game(self._conn(), user_id)
+
+    def get_moves(self, user_id: str) -> list[Dict[str, Any]]:
+        conn = self._conn()
+        # One read transaction, so the game and its moves come from the same snapshot
+        conn.execute("BEGIN")
+        try:
+            self._require_game(conn, user_id)
+            return [_move_from_row(row) for row in conn.execute(_SQL_MOVES, (user_id,))]
+        finally:
+            conn.execute("COMMIT")
+
+    def start_game(
+        self,
+        user_id: str,
+        width: int,
+        height: int,
+        num_mines: int,
+        rng_seed: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        with self._write() as conn:
+            existing = self._read_game(conn, user_id)
+            if existing and existing.get("status") == "active":
+                raise ValueError("active_game_exists")
+            seed = rng_seed
+            if seed is None and self.derive_layout:
+                seed = random.SystemRandom().randrange(1 << 62)
+            state = generate_new_game(width, height, num_mines, rng_seed=seed)
             now = _now()
-            update = {
-                "status": "abandoned",
+            doc = {
+                "status": state.status,
+                "created_at": now,
                 "updated_at": now,
+                "finished_at": None,
+                "board_width": width,
+                "board_height": height,
+                "num_mines": num_mines,
+                "moves_count": 0,
+                "mine_layout": None if self.derive_layout else state.mine_layout,
+                "revealed_mask": bitmask.to_str(state.revealed_mask, state.cells),
+                "flag_mask": bitmask.to_str(state.flag_mask, state.cells),
+                "mines_placed": state.mines_placed,
+                "rng_seed": state.rng_seed,
+                "first_click": None,
+                "first_reveal_at": None,
+                "result_time_ms": None,
+                "final_score": None,
+                "end_result": None,
             }
+            conn.execute("DELETE FROM moves WHERE user_id = ?", (user_id,))
+            self._save_game(conn, user_id, doc, [])
+        return doc
+
+    def _finish(self, user_id: str, action: str, status: str, end_result: str, reason: Optional[str] = None) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """Abandon or error out the current game, logging one move without a cell."""
+        with self._write() as conn:
+            game = self._require_game(conn, user_id)
+            now = _now()
             finishing_now = not game.get("finished_at")
-            if finishing_now:
-                update["finished_at"] = now
-            update["end_result"] = "abort"
-            tx.update(gref, update)
-            moves_count = int(game.get("moves_count", 0)) + 1
             last_ts = game.get("updated_at") or game.get("created_at")
+            game.update({"status": status, "updated_at": now, "end_result": end_result})
+            if finishing_now:
+                game["finished_at"] = now
             move = {
-                "seq": moves_count,
-                "action": "abandon",
+                "seq": int(game.get("moves_count", 0)) + 1,
+                "action": action,
                 "row": None,
                 "col": None,
                 "timestamp": now,
                 "hit_mine": False,
                 "cleared_cells": 0,
-                "flags_total": _count_flags(game["flag_mask"]),
-                "revealed_total": _count_revealed(game["revealed_mask"]),
-                "status_after": "abandoned",
-                "ms_since_game_start": int((now - (game.get("first_reveal_at") or now)).total_seconds() * 1000) if game.get("first_reveal_at") else None,
+                "flags_total": _count_set(game["flag_mask"]),
+                "revealed_total": _count_set(game["revealed_mask"]),
+                "status_after": status,
+                "ms_since_game_start": int((now - game["first_reveal_at"]).total_seconds() * 1000) if game.get("first_reveal_at") else None,
                 "ms_since_prev_move": int((now - last_ts).total_seconds() * 1000) if last_ts else None,
             }
-            self._write_move(tx, user_id, game, move)
-            merged = dict(game)
-            merged.update(update)
-            merged["moves_count"] = moves_count
-            if finishing_now:
-                self._update_stats_tx(tx, user_id, merged, "abort", now)
-            return merged, move
+            if reason is not None:
+                move["error_reason"] = reason
+            self._save_game(conn, user_id, game, [move])
+            if finishing_now and action == "abandon":
+                self._update_stats(conn, user_id, game, "abort")
+        return game, move
 
-        return _tx(self.client.transaction())
+    def mark_error(self, user_id: str, reason: str) -> Dict[str, Any]:
+        return self._finish(user_id, "error", "error", "error", reason)[0]
+
+    def abandon(self, user_id: str) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        return self._finish(user_id, "abandon", "abandoned", "abort")
+
+    def apply_moves(self, user_id: str, actions: list[Dict[str, Any]]) -> Tuple[Dict[str, Any], list[Dict[str, Any]]]:
+        with self._write() as conn:
+            game = self._require_game(conn, user_id)
+            now = _now()
+            last_ts = game.get("updated_at") or game.get("created_at")
+            update, moves, outcome = _apply_actions(game, actions, now, last_ts, _derives_layout(game))
+            game.update(update)
+            self._save_game(conn, user_id, game, [_move_record(m) for m in moves])
+            if outcome:
+                self._update_stats(conn, user_id, game, outcome)
+        return game, moves
+
+    def reveal(self, user_id: str, row: int, col: int) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        game, moves = self.apply_moves(user_id, [{"action": "reveal", "row": row, "col": col}])
+        return game, moves[0]
+
+    def flag(self, user_id: str, row: int, col: int) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        game, moves = self.apply_moves(user_id, [{"action": "flag", "row": row, "col": col}])
+        return game, moves[0]
 
     def get_stats(self, user_id: str) -> Dict[str, Any]:
-        sref = self._stats_ref(user_id)
-        snap = sref.get()
-        if snap.exists:
-            data = snap.to_dict() or {}
-        else:
-            data = {}
-        played = int(data.get("played", 0) or 0)
-        wins = int(data.get("wins", 0) or 0)
-        losses = int(data.get("losses", 0) or 0)
-        aborts = int(data.get("aborts", 0) or 0)
-        denom = wins + losses + aborts
-        win_pct = float(wins) / denom if denom > 0 else 0.0
-        by_option_list: list[Dict[str, Any]] = []
-        options_coll = sref.collection("byOption")
-        for opt_snap in options_coll.stream():
-            opt = opt_snap.to_dict() or {}
-            width = int(opt.get("board_width", 0) or 0)
-            height = int(opt.get("board_height", 0) or 0)
-            num_mines = int(opt.get("num_mines", 0) or 0)
-            o_played = int(opt.get("played", 0) or 0)
-            o_wins = int(opt.get("wins", 0) or 0)
-            o_losses = int(opt.get("losses", 0) or 0)
-            o_aborts = int(opt.get("aborts", 0) or 0)
-            o_denom = o_wins + o_losses + o_aborts
-            o_win_pct = float(o_wins) / o_denom if o_denom > 0 else 0.0
-            key = self._stats_key(width, height, num_mines)
-            by_option_list.append(
-                {
-                    "key": key,
-                    "board_width": width,
-                    "board_height": height,
-                    "num_mines": num_mines,
-                    "played": o_played,
-                    "wins": o_wins,
-                    "losses": o_losses,
-                    "aborts": o_aborts,
-                    "winPct": o_win_pct,
-                }
-            )
-        return {
-            "totals": {
-                "played": played,
-                "wins": wins,
-                "losses": losses,
-                "aborts": aborts,
-                "winPct": win_pct,
-            },
-            "byOption": by_option_list,
-        }
+        options = [dict(zip(_SUMMARY_FIELDS, row)) for row in self._conn().execute(_SQL_STATS, (user_id,))]
+        totals = {k: sum(opt[k] for opt in options) for k in ("played", "wins", "losses", "aborts")}
+        return _stats_response(totals, options)
+
+    def active_games(self) -> Dict[str, int]:
+        """Games in progress, by kind."""
+        classic, infinite_ = self._conn().execute(_SQL_ACTIVE).fetchone()
+        return {"classic": classic, "infinite": infinite_}
 
-    def to_client(self, game: Dict[str, Any]) -> Dict[str, Any]:
+    def to_client(self, game: Dict[str, Any], board_format: str = "rows") -> Dict[str, Any]:
         s = _to_state(game)
-        board = to_client_view(s)
+        board = to_client_string(s) if board_format == "flat" else to_client_view(s)
         return {
             "status": game["status"],
             "board": board,
+            "board_format": board_format,
             "board_width": game["board_width"],
             "board_height": game["board_height"],
             "moves_count": game.get("moves_count", 0),
-            "flags_total": _count_flags(game["flag_mask"]),
-            "revealed_total": _count_revealed(game["revealed_mask"]),
+            "flags_total": s.flags_count,
+            "revealed_total": s.revealed_count,
             "num_mines": game["num_mines"],
             "end_result": game.get("end_result"),
         }
+
+    def to_client_delta(self, game: Dict[str, Any], move: Dict[str, Any]) -> Dict[str, Any]:
+        """Counters plus only the cells changed by ``move``, for ``?view=delta``."""
+        return _client_delta(game, move)
+
+    def _read_infinite_game(self, conn: sqlite3.Connection, user_id: str) -> Optional[Dict[str, Any]]:
+        row = conn.execute(_SQL_INFINITE, (user_id,)).fetchone()
+        return _infinite_from_row(row) if row is not None else None
+
+    def _chunk_loader(self, conn: sqlite3.Connection, user_id: str) -> infinite.ChunkLoader:
+        def load(crow: int, ccol: int) -> Optional[Tuple[bytes, bytes]]:
+            return conn.execute(_SQL_CHUNK, (user_id, crow, ccol)).fetchone()
+
+        return load
+
+    def get_infinite_game(self, user_id: str) -> Optional[Dict[str, Any]]:
+        return self._read_infinite_game(self._conn(), user_id)
+
+    def start_infinite_game(self, user_id: str, mines_per_chunk: int, rng_seed: Optional[int] = None) -> Dict[str, Any]:
+        with self._write() as conn:
+            existing = self._read_infinite_game(conn, user_id)
+            if existing and existing.get("status") == "active":
+                raise ValueError("active_game_exists")
+            state = infinite.new_game(mines_per_chunk, rng_seed=rng_seed)
+            doc = _new_infinite_doc(state, _now())
+            conn.execute("DELETE FROM infinite_chunks WHERE user_id = ?", (user_id,))
+            conn.execute(_SQL_PUT_INFINITE, _infinite_row(user_id, doc))
+        return doc
+
+    def _infinite_move(self, user_id: str, action: str, row: int, col: int) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        with self._write() as conn:
+            game = self._read_infinite_game(conn, user_id)
+            if not game:
+                raise KeyError("game_not_found")
+            update, result, changed = _apply_infinite_action(game, self._chunk_loader(conn, user_id), action, row, col, _now())
+            game.update(update)
+            conn.execute(_SQL_PUT_INFINITE, _infinite_row(user_id, game))
+            for (crow, ccol), masks in changed.items():
+                if _chunk_is_empty(masks):
+                    conn.execute(_SQL_DELETE_CHUNK, (user_id, crow, ccol))
+                else:
+                    conn.execute(_SQL_PUT_CHUNK, (user_id, crow, ccol, masks[0], masks[1]))
+        return game, result
+
+    def infinite_reveal(self, user_id: str, row: int, col: int) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        return self._infinite_move(user_id, "reveal", row, col)
+
+    def infinite_flag(self, user_id: str, row: int, col: int) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        return self._infinite_move(user_id, "flag", row, col)
+
+    def infinite_abandon(self, user_id: str) -> Dict[str, Any]:
+        with self._write() as conn:
+            game = self._read_infinite_game(conn, user_id)
+            if not game:
+                raise KeyError("game_not_found")
+            now = _now()
+            game.update({"status": "abandoned", "updated_at": now, "end_result": "abort"})
+            if not game.get("finished_at"):
+                game["finished_at"] = now
+            conn.execute(_SQL_PUT_INFINITE, _infinite_row(user_id, game))
+        return game
+
+    def infinite_view(self, user_id: str, row: int, col: int, height: int, width: int) -> Tuple[Dict[str, Any], list[str]]:
+        conn = self._conn()
+        conn.execute("BEGIN")
+        try:
+            game = self._read_infinite_game(conn, user_id)
+            if not game:
+                raise KeyError("game_not_found")
+            masks = infinite.ChunkMasks(self._chunk_loader(conn, user_id))
+            return game, infinite.view(_to_infinite_state(game), masks, row, col, height, width)
+        finally:
+            conn.execute("COMMIT")
@@ -0,0 +1,219 @@
+"""Sampling profiler for individual requests, writing collapsed-stack files.
+
+While at least one profiled request is in flight, a daemon thread samples the
+stacks of the threads working on it every ``interval`` seconds:
+- the event loop thread, whenever it is running that request's coroutine;
+- any worker thread running a call handed off with ``attributed()``.
+
+Each sample is a ``frame;frame;...`` path from the request's entry point,
+prefixed with its method and route. After ``requests_per_profile`` profiled
+requests, the sampling thread writes the counts as one file in the collapsed
+format that flamegraph.pl and speedscope read.
+"""
+from __future__ import annotations
+
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterator, Optional, Set
+import functools
+import os
+import random
+import sys
+import threading
+import time
+
+PROFILE_SUFFIX = ".collapsed"
+
+
+@dataclass(frozen=True)
+class ProfileConfig:
+    directory: str
+    # Fraction of requests profiled; requests with the debug header always are
+    sample_rate: float = 0.01
+    # Seconds between stack samples
+    interval: float = 0.005
+    # Profiled requests aggregated into each file
+    requests_per_profile: int = 100
+    # Files kept in ``directory``; older ones are deleted
+    keep: int = 20
+
+
+class _Session:
+    __slots__ = ("root", "loop_thread", "threads", "stacks")
+
+    def __init__(self, root, loop_thread: int) -> None:
+        # Frame of the request's entry point; stacks are cut there
+        self.root = root
+        self.loop_thread = loop_thread
+        # Worker thread ident -> frame of the call attributed to this request
+        self.threads: Dict[int, object] = {}
+        self.stacks: Counter = Counter()
+
+
+_session: ContextVar[Optional[_Session]] = ContextVar("profile_session", default=None)
+_labels: Dict[object, str] = {}
+
+
+def _label(code) -> str:
+    label = _labels.get(code)
+    if label is None:
+        module = os.path.splitext(os.path.basename(code.co_filename))[0]
+        label = _labels[code] = f"{module}:{getattr(code, 'co_qualname', code.co_name)}"
+    return label
+
+
+def _stack(frame, root=None) -> Optional[str]:
+    """Collapsed stack of ``frame`` up to ``root``, outermost first; None if ``root`` is not on it."""
+    names = []
+    while frame is not None:
+        names.append(_label(frame.f_code))
+        if frame is root:
+            break
+        frame = frame.f_back
+    else:
+        if root is not None:
+            return None
+    return ";".join(reversed(names))
+
+
+def attributed(fn: Callable) -> Callable:
+    """``fn``, attributing its run to the current request's profile when there is one."""
+    session = _session.get()
+    if session is None:
+        return fn
+
+    @functools.wraps(fn)
+    def run(*args, **kwargs):
+        ident = threading.get_ident()
+        session.threads[ident] = sys._getframe()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            session.threads.pop(ident, None)
+
+    return run
+
+
+class Profiler:
+    def __init__(self, config: ProfileConfig) -> None:
+        self.config = config
+        os.makedirs(config.directory, exist_ok=True)
+        self._sessions: Set[_Session] = set()
+        # Taken on the event loop, so only ever held to add, remove or copy sessions
+        self._sessions_lock = threading.Lock()
+        # Held while sampling and while merging or writing samples, never on the event loop
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        # (session, label) of requests whose samples are not merged yet
+        self._finished: deque = deque()
+        self._stacks: Counter = Counter()
+        self._requests = 0
+        self._thread: Optional[threading.Thread] = None
+        self._written = 0
+
+    def wanted(self, forced: bool) -> bool:
+        return forced or random.random() < self.config.sample_rate
+
+    @contextmanager
+    def profile(self, root) -> Iterator[_Session]:
+        """Sample the current request, whose coroutine has frame ``root``, until the block ends."""
+        session = _Session(root, threading.get_ident())
+        token = _session.set(session)
+        with self._sessions_lock:
+            self._sessions.add(session)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._sample_loop, name="request-profiler", daemon=True)
+                self._thread.start()
+        self._wake.set()
+        try:
+            yield session
+        finally:
+            _session.reset(token)
+            with self._sessions_lock:
+                self._sessions.discard(session)
+
+    def finish(self, session: _Session, label: str) -> None:
+        """Queue ``session``'s samples under ``label``; the sampling thread merges them and writes the files."""
+        self._finished.append((session, label))
+        self._wake.set()
+
+    def _merge(self) -> None:
+        """Fold finished sessions into the pending profile, writing it whenever it is due; needs ``_lock``."""
+        while self._finished:
+            session, label = self._finished.popleft()
+            for stack, n in session.stacks.items():
+                self._stacks[f"{label};{stack}"] += n
+            self._requests += 1
+            if self._requests >= self.config.requests_per_profile:
+                self._write()
+
+    def _sample_loop(self) -> None:
+        me = threading.get_ident()
+        while True:
+            # Cleared first, so a request queued after the merge below still wakes the wait
+            self._wake.clear()
+            with self._lock:
+                self._merge()
+            with self._sessions_lock:
+                sessions = list(self._sessions)
+            if not sessions:
+                self._wake.wait()
+                continue
+            # Held while sampling, so a session is never written to while it is merged
+            with self._lock:
+                frames = sys._current_frames()
+                for session in sessions:
+                    frame = frames.get(session.loop_thread)
+                    if frame is not None:
+                        stack = _stack(frame, session.root)
+                        if stack is not None:
+                            session.stacks[stack] += 1
+                    for ident, root in list(session.threads.items()):
+                        if ident != me and ident in frames:
+                            stack = _stack(frames[ident], root)
+                            if stack is not None:
+                                session.stacks[stack] += 1
+                del frames
+            time.sleep(self.config.interval)
+
+    def flush(self) -> Optional[str]:
+        """Write the samples gathered so far to a new file; returns its path, or None if there were none.
+
+        Blocks while the sampling thread samples, so it is not for the event loop.
+        """
+        with self._lock:
+            self._merge()
+            return self._write()
+
+    def _write(self) -> Optional[str]:
+        stacks, self._stacks = self._stacks, Counter()
+        self._requests = 0
+        if not stacks:
+            return None
+        self._written += 1
+        written = self._written
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+        path = os.path.join(self.config.directory, f"profile-{stamp}-{os.getpid()}-{written:04d}{PROFILE_SUFFIX}")
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            for stack, n in stacks.most_common():
+                f.write(f"{stack} {n}\n")
+        os.replace(tmp, path)
+        for old in self.profiles()[: -self.config.keep]:
+            os.remove(old)
+        return path
+
+    def profiles(self) -> list[str]:
+        """Profile files in ``directory``, oldest first."""
+        names = [n for n in os.listdir(self.config.directory) if n.endswith(PROFILE_SUFFIX)]
+        paths = [os.path.join(self.config.directory, n) for n in names]
+        return sorted(paths, key=lambda p: (os.path.getmtime(p), p))
+
+    def latest(self) -> Optional[str]:
+        """The newest profile, after writing out any samples not in a file yet."""
+        self.flush()
+        paths = self.profiles()
+        return paths[-1] if paths else None
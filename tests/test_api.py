@@ -1,6 +1,10 @@
+import logging
+
+import pytest
 from fastapi.testclient import TestClient
 
-from app.main import create_app
+from app.main import choose_persistence, create_app, move_log_from_env
+from minesweeper.move_log import MoveLogConfig
 from minesweeper.persistence import InMemoryPersistence
 
 
@@ -117,3 +121,249 @@ def test_isolation_with_google_headers():
     assert s_alice["moves_count"] >= 1
     assert s_bob["moves_count"] == 0
     assert s_alice["game_id"] != s_bob["game_id"]
+
+
+def _patch(board, changed):
+    width = len(board[0])
+    board = [row[:] for row in board]
+    for i, value in changed:
+        board[i // width][i % width] = value
+    return board
+
+
+def test_delta_view_reports_only_changed_cells():
+    c = make_client()
+    headers = {"X-User-Id": "u6"}
+    board = c.post("/api/minesweeper/start", json={"board_width": 8, "board_height": 8, "num_mines": 10}, headers=headers).json()["board"]
+
+    r = c.post("/api/minesweeper/reveal?view=delta", json={"row": 0, "col": 0}, headers=headers)
+    assert r.status_code == 200
+    d = r.json()
+    assert "board" not in d
+    assert d["moves_count"] == 1
+    assert d["last_move"] == {"row": 0, "col": 0, "hit_mine": False}
+    board = _patch(board, d["changed"])
+    full = c.get("/api/minesweeper/state", headers=headers).json()
+    assert board == full["board"]
+    assert d["revealed_total"] == full["revealed_total"] == len(d["changed"])
+
+    hidden = next((r, c_) for r, row in enumerate(board) for c_, v in enumerate(row) if v == "H")
+    d = c.post("/api/minesweeper/flag?view=delta", json={"row": hidden[0], "col": hidden[1]}, headers=headers).json()
+    assert d["changed"] == [[hidden[0] * 8 + hidden[1], "F"]]
+    assert d["flags_total"] == 1
+    assert _patch(board, d["changed"]) == c.get("/api/minesweeper/state", headers=headers).json()["board"]
+
+    assert c.post("/api/minesweeper/flag?view=bogus", json={"row": 0, "col": 0}, headers=headers).status_code == 422
+
+
+def test_flat_board_format_via_query_and_accept_header():
+    c = make_client()
+    headers = {"X-User-Id": "u7"}
+    c.post("/api/minesweeper/start", json={"board_width": 6, "board_height": 4, "num_mines": 4}, headers=headers)
+    c.post("/api/minesweeper/reveal", json={"row": 0, "col": 0}, headers=headers)
+    c.post("/api/minesweeper/flag", json={"row": 3, "col": 5}, headers=headers)
+    rows = c.get("/api/minesweeper/state", headers=headers).json()
+    assert rows["board_format"] == "rows"
+
+    flat = c.get("/api/minesweeper/state?board=flat", headers=headers).json()
+    assert flat["board_format"] == "flat"
+    assert flat["board"] == "".join("".join(row) for row in rows["board"])
+    assert len(flat["board"]) == 24
+
+    accept = {**headers, "Accept": "application/vnd.minesweeper.flat+json"}
+    assert c.get("/api/minesweeper/state", headers=accept).json()["board"] == flat["board"]
+    r = c.post("/api/minesweeper/flag", json={"row": 3, "col": 5}, headers=accept)
+    assert isinstance(r.json()["board"], str)
+
+
+def test_batched_moves_match_individual_requests():
+    actions = [
+        {"action": "reveal", "row": 0, "col": 0},
+        {"action": "flag", "row": 5, "col": 5},
+        {"action": "reveal", "row": 6, "col": 1},
+        {"action": "flag", "row": 5, "col": 5},
+        {"action": "chord", "row": 0, "col": 0},
+    ]
+    c = make_client()
+    persistence = c.app.state.persistence
+    single, batch = {"X-User-Id": "single"}, {"X-User-Id": "batch"}
+    for h in (single, batch):
+        c.post("/api/minesweeper/start", json={"board_width": 8, "board_height": 8, "num_mines": 10}, headers=h)
+    for a in actions[:4]:
+        c.post(f"/api/minesweeper/{a['action']}", json={"row": a["row"], "col": a["col"]}, headers=single)
+    # give the batched game the same mines as the one played move by move
+    layout = persistence.games["single"]["mine_layout"]
+    persistence.games["batch"].update(mine_layout=layout, mines_placed=True)
+
+    r = c.post("/api/minesweeper/moves", json={"actions": actions}, headers=batch)
+    assert r.status_code == 200
+    body = r.json()
+    assert body["moves_applied"] == len(actions)
+    # (0, 0) is always a zero cell, so the trailing chord is a no-op
+    expected = c.get("/api/minesweeper/state", headers=single).json()
+    for key in ("board", "moves_count", "flags_total", "revealed_total", "status"):
+        assert body[key] == expected[key]
+    assert [m["action"] for m in persistence.moves["batch"]] == [a["action"] for a in actions]
+    assert all("changed" not in m for m in persistence.moves["batch"])
+
+
+def test_batched_moves_delta_and_atomic_rejection():
+    c = make_client()
+    headers = {"X-User-Id": "u8"}
+    start = c.post("/api/minesweeper/start", json={"board_width": 6, "board_height": 6, "num_mines": 4}, headers=headers).json()
+    r = c.post(
+        "/api/minesweeper/moves?view=delta",
+        json={"actions": [{"action": "reveal", "row": 0, "col": 0}, {"action": "flag", "row": 5, "col": 5}]},
+        headers=headers,
+    )
+    assert r.status_code == 200
+    d = r.json()
+    state = c.get("/api/minesweeper/state", headers=headers).json()
+    assert _patch(start["board"], d["changed"]) == state["board"]
+
+    # an invalid action anywhere rejects the whole batch
+    r = c.post(
+        "/api/minesweeper/moves",
+        json={"actions": [{"action": "flag", "row": 5, "col": 4}, {"action": "reveal", "row": 9, "col": 9}]},
+        headers=headers,
+    )
+    assert r.status_code == 400
+    assert c.get("/api/minesweeper/state", headers=headers).json() == state
+    assert c.post("/api/minesweeper/moves", json={"actions": []}, headers=headers).status_code == 422
+
+
+def test_infinite_board_endpoints():
+    c = make_client()
+    headers = {"X-User-Id": "u9"}
+    r = c.post("/api/minesweeper/infinite/start", json={"mines_per_chunk": 40}, headers=headers)
+    assert r.status_code == 200
+    assert c.post("/api/minesweeper/infinite/start", json={}, headers=headers).status_code == 409
+    r = c.post("/api/minesweeper/infinite/reveal", json={"row": -3, "col": 7}, headers=headers)
+    assert r.status_code == 200
+    d = r.json()
+    assert d["revealed_total"] == len(d["changed"]) >= 1
+    s = c.get("/api/minesweeper/infinite/state?row=-3&col=7&height=2&width=3", headers=headers).json()
+    assert len(s["rows"]) == 2 and all(len(row) == 3 for row in s["rows"])
+    assert s["rows"][0][0] == "0"
+    f = c.post("/api/minesweeper/infinite/flag", json={"row": 900, "col": 900}, headers=headers).json()
+    assert f["changed"] == [[900, 900, "F"]] and f["flags_total"] == 1
+    a = c.post("/api/minesweeper/infinite/abandon", headers=headers).json()
+    assert a["status"] == "abandoned"
+    assert c.get("/api/minesweeper/infinite/state", headers={"X-User-Id": "nobody"}).status_code == 404
+
+
+def test_game_without_stored_layout_is_derived_from_seed():
+    c = make_client()
+    h = {"X-User-Id": "derived"}
+    c.post("/api/minesweeper/start", json={"board_width": 9, "board_height": 9, "num_mines": 10}, headers=h)
+    persistence = c.app.state.persistence
+    game = persistence.games["derived"]
+    # what a derive-layout backend stores: a seed and no layout
+    game.update(rng_seed=4242, mine_layout=None)
+    c.post("/api/minesweeper/reveal", json={"row": 4, "col": 4}, headers=h)
+    assert game["mine_layout"] is None and game["first_click"] == 4 * 9 + 4
+    reference = InMemoryPersistence()
+    reference.start_game("u", 9, 9, 10)
+    reference.games["u"]["rng_seed"] = 4242
+    reference.reveal("u", 4, 4)
+    assert reference.games["u"]["mine_layout"].count("M") == 10
+    assert c.get("/api/minesweeper/state", headers=h).json()["board"] == reference.to_client(reference.games["u"])["board"]
+    r = c.post("/api/minesweeper/moves", json={"actions": [{"action": "reveal", "row": 0, "col": 0}]}, headers=h)
+    assert r.status_code == 200
+    assert r.json()["board"] == reference.to_client(reference.reveal("u", 0, 0)[0])["board"]
+
+
+def test_moves_do_not_read_the_game_twice():
+    class CountingPersistence(InMemoryPersistence):
+        reads = 0
+
+        def get_game(self, user_id):
+            self.reads += 1
+            return super().get_game(user_id)
+
+    persistence = CountingPersistence()
+    c = TestClient(create_app(persistence=persistence))
+    h = {"X-User-Id": "reads"}
+    for path, body in (("reveal", {"row": 0, "col": 0}), ("flag", {"row": 0, "col": 0}), ("abandon", None)):
+        assert c.post(f"/api/minesweeper/{path}", json=body, headers=h).status_code == 404
+    assert c.post("/api/minesweeper/moves", json={"actions": [{"action": "flag", "row": 0, "col": 0}]}, headers=h).status_code == 404
+    c.post("/api/minesweeper/start", json={"board_width": 8, "board_height": 8, "num_mines": 10}, headers=h)
+    c.post("/api/minesweeper/reveal", json={"row": 0, "col": 0}, headers=h)
+    c.post("/api/minesweeper/flag", json={"row": 7, "col": 7}, headers=h)
+    c.post("/api/minesweeper/moves", json={"actions": [{"action": "flag", "row": 7, "col": 7}]}, headers=h)
+    assert c.post("/api/minesweeper/abandon", headers=h).status_code == 200
+    # each move's own (transactional) read is the only lookup
+    assert persistence.reads == 0
+
+
+def test_natively_async_backend_is_awaited_directly():
+    class AsyncInMemory:
+        is_async = True
+
+        def __init__(self):
+            self.inner = InMemoryPersistence()
+            self.calls = []
+
+        def __getattr__(self, name):
+            attr = getattr(self.inner, name)
+            if name.startswith("to_client"):
+                return attr
+
+            async def call(*args, **kwargs):
+                self.calls.append(name)
+                return attr(*args, **kwargs)
+
+            return call
+
+    backend = AsyncInMemory()
+    c = TestClient(create_app(persistence=backend))
+    h = {"X-User-Id": "async"}
+    assert c.post("/api/minesweeper/start", json={"board_width": 8, "board_height": 8, "num_mines": 10}, headers=h).status_code == 200
+    assert c.post("/api/minesweeper/reveal", json={"row": 0, "col": 0}, headers=h).json()["revealed_total"] > 0
+    assert c.post("/api/minesweeper/abandon", headers=h).json()["status"] == "abandoned"
+    assert c.post("/api/minesweeper/flag", json={"row": 0, "col": 0}, headers={"X-User-Id": "nobody"}).status_code == 404
+    # Only the latency timing layer sits in between, no threadpool adapter
+    assert c.app.state.store.store is backend
+    assert backend.calls == ["start_game", "reveal", "abandon", "flag"]
+
+
+def test_identity_config_is_read_once(monkeypatch):
+    monkeypatch.setenv("K_SERVICE", "minesweeper")
+    monkeypatch.delenv("TRUST_X_USER_ID", raising=False)
+    monkeypatch.delenv("ALLOW_ANON", raising=False)
+    c = make_client()
+    # Cloud Run defaults: no trusted X-User-Id and no anonymous fallback
+    assert c.get("/api/minesweeper/state", headers={"X-User-Id": "u"}).status_code == 401
+    monkeypatch.setenv("TRUST_X_USER_ID", "1")
+    assert c.get("/api/minesweeper/state", headers={"X-User-Id": "u"}).status_code == 401
+    r = c.get("/api/minesweeper/state", headers={"X-Goog-Authenticated-User-Email": "accounts.google.com:a@example.com"})
+    assert r.status_code == 404
+
+
+def test_auth_paths_are_counted_and_logged_sparingly(monkeypatch, caplog):
+    monkeypatch.setenv("IDENTITY_LOG_INTERVAL", "3600")
+    caplog.set_level(logging.INFO, logger="uvicorn.error")
+    c = make_client()
+    for _ in range(3):
+        c.get("/api/minesweeper/state", headers={"X-User-Id": "u"})
+    c.get("/api/minesweeper/state", headers={"X-Forwarded-User": "f"})
+    c.get("/api/minesweeper/state")
+    text = c.get("/metrics").text
+    assert 'minesweeper_auth_requests_total{path="x-user-id"} 3' in text
+    assert 'minesweeper_auth_requests_total{path="forwarded_user"} 1' in text
+    assert 'minesweeper_auth_requests_total{path="anon"} 1' in text
+    lines = [r for r in caplog.records if r.getMessage().startswith("[minesweeper] get_user_id")]
+    assert [(r.auth_path, r.user_id) for r in lines] == [("x-user-id", "u"), ("forwarded_user", "f"), ("anon", "local-user")]
+
+
+def test_write_behind_env_with_and_without_async(monkeypatch):
+    for name in ("USE_INMEMORY", "SQLITE_PATH", "FIRESTORE_ASYNC", "MOVE_LOG_WRITE_BEHIND"):
+        monkeypatch.delenv(name, raising=False)
+    assert move_log_from_env() is None
+    monkeypatch.setenv("MOVE_LOG_WRITE_BEHIND", "1")
+    monkeypatch.setenv("MOVE_LOG_FLUSH_SIZE", "50")
+    assert move_log_from_env() == MoveLogConfig(flush_size=50)
+    # The async backend writes moves in its transactions; it must not silently ignore the flag
+    monkeypatch.setenv("FIRESTORE_ASYNC", "1")
+    with pytest.raises(ValueError, match="FIRESTORE_ASYNC"):
+        choose_persistence()
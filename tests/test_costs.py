@@ -0,0 +1,108 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import API_BASE, COST_BUDGETS, create_app
+from minesweeper import costs
+from minesweeper.fake_firestore import FakeAsyncFirestoreClient, FakeFirestoreClient
+from minesweeper.move_log import MoveLogConfig
+from minesweeper.persistence import AsyncFirestorePersistence, FirestorePersistence, _to_state
+
+BACKENDS = {
+    "docs": lambda: FirestorePersistence(client=FakeFirestoreClient(), stats_cache_ttl=0),
+    "packed": lambda: FirestorePersistence(client=FakeFirestoreClient(), packed_moves=True, stats_cache_ttl=0),
+    "write_behind": lambda: FirestorePersistence(client=FakeFirestoreClient(), write_behind=MoveLogConfig(), stats_cache_ttl=0),
+    "async": lambda: AsyncFirestorePersistence(client=FakeAsyncFirestoreClient(), stats_cache_ttl=0),
+}
+
+
+def _session(c, persistence):
+    """Every budgeted endpoint, including moves that finish games."""
+    h = {"X-User-Id": "u"}
+    start = {"board_width": 9, "board_height": 9, "num_mines": 10}
+    assert c.post(f"{API_BASE}/start", json=start, headers=h).status_code == 200
+    c.post(f"{API_BASE}/flag", json={"row": 8, "col": 8}, headers=h)
+    c.post(f"{API_BASE}/reveal", json={"row": 0, "col": 0}, headers=h)
+    c.get(f"{API_BASE}/state", headers=h)
+    c.post(f"{API_BASE}/abandon", headers=h)
+    c.get(f"{API_BASE}/stats", headers=h)
+
+    c.post(f"{API_BASE}/start", json=start, headers=h)
+    c.post(f"{API_BASE}/reveal", json={"row": 4, "col": 4}, headers=h)
+    if getattr(persistence, "is_async", False):
+        game = c.portal.call(persistence.get_game, "u")
+    else:
+        game = persistence.get_game("u")
+    s = _to_state(game)
+    hidden = [i for i in range(s.cells) if s.mine_layout[i] != "M" and s.revealed_mask[i // 8] >> (i % 8) & 1 == 0]
+    mine = s.mine_layout.index("M")
+    actions = [{"action": "reveal", "row": i // 9, "col": i % 9} for i in hidden] + [{"action": "reveal", "row": mine // 9, "col": mine % 9}]
+    assert c.post(f"{API_BASE}/moves", json={"actions": actions}, headers=h).status_code == 200
+    c.get(f"{API_BASE}/stats", headers=h)
+
+    assert c.post(f"{API_BASE}/infinite/start", json={"mines_per_chunk": 10}, headers=h).status_code == 200
+    c.post(f"{API_BASE}/infinite/reveal", json={"row": 0, "col": 0}, headers=h)
+    c.post(f"{API_BASE}/infinite/flag", json={"row": 100, "col": -100}, headers=h)
+    for cell in range(-40, 40, 7):
+        c.post(f"{API_BASE}/infinite/reveal", json={"row": cell, "col": -cell}, headers=h)
+    view = {"row": -64, "col": -64, "height": 128, "width": 128}
+    assert c.get(f"{API_BASE}/infinite/state", params=view, headers=h).status_code == 200
+    c.post(f"{API_BASE}/infinite/abandon", headers=h)
+
+
+@pytest.mark.parametrize("backend", sorted(BACKENDS))
+def test_endpoints_stay_within_budget(backend):
+    persistence = BACKENDS[backend]()
+    app = create_app(persistence=persistence)
+    with TestClient(app) as c:
+        _session(c, persistence)
+        routes = c.get(f"{API_BASE}/metrics/costs").json()["routes"]
+    assert set(COST_BUDGETS) <= set(routes)
+    over = {route: entry["max"] for route, entry in routes.items() if entry["over_budget"]}
+    assert over == {}
+
+
+def test_infinite_flag_reads_only_its_chunk():
+    p = FirestorePersistence(client=FakeFirestoreClient())
+    p.start_infinite_game("u", 40, rng_seed=3)
+    p.infinite_reveal("u", 0, 0)
+    with costs.tracking() as cost:
+        p.infinite_flag("u", 100, -100)
+    assert (cost.reads, cost.writes) == (2, 2)
+
+
+def test_cost_header_and_budget_overruns(monkeypatch):
+    monkeypatch.setenv("COST_HEADERS", "1")
+    app = create_app(persistence=FirestorePersistence(client=FakeFirestoreClient()))
+    app.state.costs.budgets[f"{API_BASE}/start"] = costs.CostBudget(reads=0)
+    with TestClient(app) as c:
+        r = c.post(f"{API_BASE}/start", json={"board_width": 5, "board_height": 5, "num_mines": 5}, headers={"X-User-Id": "u"})
+        assert r.headers["x-persistence-cost"].startswith("reads=1, writes=1,")
+        entry = c.get(f"{API_BASE}/metrics/costs").json()["routes"][f"{API_BASE}/start"]
+    assert entry["over_budget"] == 1 and entry["max"]["reads"] == 1
+
+
+def test_counts_agree_with_the_store():
+    client = FakeFirestoreClient(abort_rate=0.5, seed=1)
+    p = FirestorePersistence(client=client, packed_moves=True)
+    p.start_game("u", 9, 9, 10, rng_seed=5)
+    client.reset_counters()
+    with costs.tracking() as cost:
+        for col in range(9):
+            p.flag("u", 0, col)
+        p.get_moves("u")
+    counts = client.counters()
+    assert cost.retries == counts["retries"] > 0
+    # Aborted attempts read but never write
+    assert (cost.reads, cost.writes) == (counts["reads"], counts["writes"]) == (counts["transactions"] + 2, 18)
+    assert cost.read_bytes > 0 and cost.write_bytes > 0
+
+
+def test_work_outside_requests_is_background():
+    p = FirestorePersistence(client=FakeFirestoreClient(), write_behind=MoveLogConfig())
+    p.start_game("u", 9, 9, 10, rng_seed=5)
+    with costs.tracking() as cost:
+        p.flag("u", 8, 8)
+    before = costs.background.writes
+    p.close()
+    assert cost.writes == 1
+    assert costs.background.writes == before + 1
@@ -1,5 +1,19 @@
+import random
+from dataclasses import replace
+
 import pytest
-from minesweeper.game_engine import generate_new_game, apply_reveal, apply_flag, to_client_view, index
+from minesweeper import bitmask
+from minesweeper.game_engine import generate_new_game, apply_reveal, apply_flag, apply_chord, to_client_view, index, is_win, neighbor_table
+from minesweeper.game_engine import (
+    _CellsExcept,
+    derived_layout,
+    _build_layout_with_mines,
+    _excluded_indices,
+    _flood_fill,
+    _layout_from_mines_numpy,
+    _layout_from_mines_python,
+    _open_zero_region,
+)
 
 
 def count_mines(layout: str) -> int:
@@ -11,8 +25,8 @@ def test_generate_new_game_counts_and_first_click_places_mines():
     assert s.width == 8 and s.height == 8
     assert count_mines(s.mine_layout) == 0
     assert s.mines_placed is False
-    assert set(s.revealed_mask) == {"0"}
-    assert set(s.flag_mask) == {"0"}
+    assert bitmask.popcount(s.revealed_mask) == 0
+    assert bitmask.popcount(s.flag_mask) == 0
 
     s2, res = apply_reveal(s, 0, 0)
     assert s2.mines_placed is True
@@ -37,12 +51,12 @@ def test_reveal_zero_floods():
     s = generate_new_game(6, 6, 5, rng_seed=7)
     s1, _ = apply_reveal(s, 0, 0)
     # find a zero cell
-    idx = next(i for i, ch in enumerate(s1.mine_layout) if ch == "0" and s1.revealed_mask[i] == "0")
+    idx = next(i for i, ch in enumerate(s1.mine_layout) if ch == "0" and not bitmask.test(s1.revealed_mask, i))
     r, c = divmod(idx, s1.width)
     s2, res = apply_reveal(s1, r, c)
     assert res["cleared_cells"] >= 1
     # revealed mask should have ones where cleared
-    assert s2.revealed_mask.count("1") >= res["cleared_cells"]
+    assert bitmask.popcount(s2.revealed_mask) >= res["cleared_cells"]
 
 
 def test_repeated_reveal_noop():
@@ -103,3 +117,236 @@ def test_insufficient_space_for_mines_error():
     with pytest.raises(ValueError) as exc:
         apply_reveal(s, 1, 1)
     assert str(exc.value) == "insufficient_space_for_mines"
+
+
+def test_bitmask_string_round_trip():
+    s = "0110000011" + "1" * 13 + "0"
+    mask = bitmask.from_str(s)
+    assert len(mask) == bitmask.nbytes(len(s))
+    assert bitmask.to_str(mask, len(s)) == s
+    assert bitmask.popcount(mask) == s.count("1")
+    assert [i for i in range(len(s)) if bitmask.test(mask, i)] == [i for i, ch in enumerate(s) if ch == "1"]
+    assert list(bitmask.iter_runs(mask, len(s))) == [(1, 3), (8, 23)]
+    assert bitmask.to_str(bitmask.toggled(mask, 0), len(s))[0] == "1"
+
+
+def test_to_client_view_shows_revealed_flags_and_mines_after_loss():
+    s = generate_new_game(6, 6, 5, rng_seed=11)
+    s1, _ = apply_reveal(s, 0, 0)
+    hidden = [i for i in range(s1.cells) if not bitmask.test(s1.revealed_mask, i)]
+    safe_hidden = next(i for i in hidden if s1.mine_layout[i] != "M")
+    s2, _ = apply_flag(s1, *divmod(safe_hidden, s1.width))
+    board = to_client_view(s2)
+    for i in range(s2.cells):
+        r, c = divmod(i, s2.width)
+        if bitmask.test(s2.revealed_mask, i):
+            assert board[r][c] == s2.mine_layout[i]
+        elif i == safe_hidden:
+            assert board[r][c] == "F"
+        else:
+            assert board[r][c] == "H"
+    mine = s2.mine_layout.index("M")
+    s3, _ = apply_reveal(s2, *divmod(mine, s2.width))
+    board = to_client_view(s3)
+    assert sum(cell == "M" for row in board for cell in row) == 5
+    assert board[safe_hidden // 6][safe_hidden % 6] == "F"
+
+
+def _assert_counters_match_recount(s):
+    assert s.revealed_count == bitmask.popcount(s.revealed_mask)
+    assert s.flags_count == bitmask.popcount(s.flag_mask)
+    safe_revealed = sum(
+        1 for i in range(s.cells) if s.mine_layout[i] != "M" and bitmask.test(s.revealed_mask, i)
+    )
+    assert s.safe_left == s.cells - s.num_mines - safe_revealed
+    assert (s.status == "won") == (s.mines_placed and is_win(s.mine_layout, s.revealed_mask))
+
+
+def test_running_counters_match_full_recount():
+    for seed in range(40):
+        rnd = random.Random(seed)
+        s = generate_new_game(rnd.randint(4, 12), rnd.randint(4, 12), rnd.randint(1, 10), rng_seed=seed)
+        _assert_counters_match_recount(s)
+        while s.status == "active":
+            r, c = rnd.randrange(s.height), rnd.randrange(s.width)
+            move = apply_flag if rnd.random() < 0.3 else apply_reveal
+            s, res = move(s, r, c)
+            _assert_counters_match_recount(s)
+            assert res["revealed_total"] == s.revealed_count
+            assert res["flags_total"] == s.flags_count
+            # A state rebuilt from its masks alone recounts to the same values
+            rebuilt = replace(s, revealed_count=None, flags_count=None, safe_left=None)
+            assert (rebuilt.revealed_count, rebuilt.flags_count, rebuilt.safe_left) == (
+                s.revealed_count,
+                s.flags_count,
+                s.safe_left,
+            )
+
+
+def _reference_layout(width, height, num_mines, excluded, rng_seed):
+    n = width * height
+    available = [i for i in range(n) if i not in excluded]
+    mines = set(random.Random(rng_seed).sample(available, num_mines))
+    out = []
+    for i in range(n):
+        if i in mines:
+            out.append("M")
+            continue
+        r, c = divmod(i, width)
+        out.append(str(sum(
+            1
+            for nr in range(max(0, r - 1), min(height, r + 2))
+            for nc in range(max(0, c - 1), min(width, c + 2))
+            if (nr, nc) != (r, c) and index(nr, nc, width) in mines
+        )))
+    return "".join(out)
+
+
+def test_layout_generation_matches_seeded_reference():
+    for seed in range(60):
+        rnd = random.Random(seed)
+        w, h = rnd.randint(2, 25), rnd.randint(2, 25)
+        excluded = _excluded_indices(rnd.randrange(h), rnd.randrange(w), w, h)
+        k = rnd.randint(0, w * h - len(excluded))
+        expected = _reference_layout(w, h, k, excluded, seed)
+        assert _build_layout_with_mines(w, h, k, excluded, seed) == expected
+        mines = random.Random(seed).sample(_CellsExcept(w * h, excluded), k)
+        assert _layout_from_mines_python(w, h, mines) == expected
+
+
+def test_numpy_layout_matches_python_layout():
+    pytest.importorskip("numpy")
+    rnd = random.Random(0)
+    mines = rnd.sample(range(120 * 90), 2000)
+    assert _layout_from_mines_numpy(120, 90, mines) == _layout_from_mines_python(120, 90, mines)
+
+
+def test_zero_region_open_matches_flood_fill():
+    for seed in range(25):
+        rnd = random.Random(seed)
+        s = generate_new_game(rnd.randint(3, 20), rnd.randint(3, 20), rnd.randint(1, 12), rng_seed=seed)
+        s, _ = apply_reveal(s, rnd.randrange(s.height), rnd.randrange(s.width))
+        hidden = [i for i in range(s.cells) if not bitmask.test(s.revealed_mask, i)]
+        # flag a few numbered cells; those are simply left closed by both paths
+        for i in rnd.sample(hidden, min(3, len(hidden))):
+            if s.mine_layout[i] not in "0M":
+                s, _ = apply_flag(s, *divmod(i, s.width))
+        for i in range(s.cells):
+            if s.mine_layout[i] != "0" or bitmask.test(s.revealed_mask, i) or bitmask.test(s.flag_mask, i):
+                continue
+            by_region = bytearray(s.revealed_mask)
+            by_fill = bytearray(s.revealed_mask)
+            opened = _open_zero_region(s, by_region, i)
+            assert sorted(opened) == sorted(_flood_fill(s, by_fill, *divmod(i, s.width)))
+            assert by_region == by_fill
+
+
+def test_flag_on_zero_cell_splits_region():
+    # Single row: the flag on the middle zero stops the opening from spreading past it
+    s = generate_new_game(9, 1, 0, rng_seed=1)
+    s, _ = apply_reveal(s, 0, 0)
+    s = replace(s, status="active", revealed_mask=bitmask.empty(9), revealed_count=0, safe_left=9)
+    s, _ = apply_flag(s, 0, 4)
+    rev = bytearray(s.revealed_mask)
+    assert _open_zero_region(s, rev, 0) is None
+    s2, res = apply_reveal(s, 0, 0)
+    assert res["cleared_cells"] == 4
+    assert bitmask.to_str(s2.revealed_mask, 9) == "111100000"
+
+
+@pytest.mark.parametrize("width,height", [(1, 1), (1, 6), (5, 1), (2, 2), (7, 4), (12, 12)])
+def test_neighbor_table_matches_bounds_checks(width, height):
+    table = neighbor_table(width, height)
+    assert len(table.offsets) == width * height + 1
+    for r in range(height):
+        for c in range(width):
+            expected = [
+                index(nr, nc, width)
+                for nr in range(max(0, r - 1), min(height, r + 2))
+                for nc in range(max(0, c - 1), min(width, c + 2))
+                if (nr, nc) != (r, c)
+            ]
+            assert list(table.of(index(r, c, width))) == expected
+    assert neighbor_table(width, height) is table
+
+
+def test_neighbor_table_numpy_matches_python(monkeypatch):
+    pytest.importorskip("numpy")
+    import minesweeper.game_engine as engine
+
+    with_numpy = engine._neighbor_table_numpy(23, 17)
+    monkeypatch.setattr(engine, "np", None)
+    engine.neighbor_table.cache_clear()
+    try:
+        assert engine.neighbor_table(23, 17) == with_numpy
+    finally:
+        engine.neighbor_table.cache_clear()
+
+
+def _apply_changed(board, changed, width):
+    board = [row[:] for row in board]
+    for i, value in changed:
+        board[i // width][i % width] = value
+    return board
+
+
+def test_changed_cells_patch_previous_view_into_next_view():
+    for seed in range(30):
+        rnd = random.Random(seed)
+        s = generate_new_game(rnd.randint(3, 14), rnd.randint(3, 14), rnd.randint(1, 10), rng_seed=seed)
+        board = to_client_view(s)
+        while s.status == "active":
+            r, c = rnd.randrange(s.height), rnd.randrange(s.width)
+            move = apply_flag if rnd.random() < 0.3 else apply_reveal
+            s, res = move(s, r, c)
+            assert len({i for i, _ in res["changed"]}) == len(res["changed"])
+            board = _apply_changed(board, res["changed"], s.width)
+            assert board == to_client_view(s)
+        _, res = apply_reveal(s, 0, 0)
+        assert res["changed"] == []
+
+
+def test_chord_reveals_unflagged_neighbors_when_flags_match():
+    s = generate_new_game(8, 8, 10, rng_seed=21)
+    s, _ = apply_reveal(s, 0, 0)
+    # a revealed number whose mines we can flag from the layout
+    i = next(
+        i for i in range(s.cells)
+        if bitmask.test(s.revealed_mask, i) and s.mine_layout[i] not in "0M"
+        and any(not bitmask.test(s.revealed_mask, j) and s.mine_layout[j] != "M" for j in neighbor_table(8, 8).of(i))
+    )
+    r, c = divmod(i, 8)
+    noop, res = apply_chord(s, r, c)
+    assert noop is s and res["cleared_cells"] == 0
+    for j in neighbor_table(8, 8).of(i):
+        if s.mine_layout[j] == "M":
+            s, _ = apply_flag(s, *divmod(j, 8))
+    s2, res = apply_chord(s, r, c)
+    assert res["hit_mine"] is False and res["cleared_cells"] >= 1
+    assert s2.moves_count == s.moves_count + 1
+    for j in neighbor_table(8, 8).of(i):
+        assert bitmask.test(s2.revealed_mask, j) or bitmask.test(s2.flag_mask, j)
+    assert _apply_changed(to_client_view(s), res["changed"], 8) == to_client_view(s2)
+
+
+def test_chord_with_wrong_flag_hits_mine():
+    s = generate_new_game(8, 8, 10, rng_seed=21)
+    s, _ = apply_reveal(s, 0, 0)
+    table = neighbor_table(8, 8)
+    i = next(
+        i for i in range(s.cells)
+        if bitmask.test(s.revealed_mask, i) and s.mine_layout[i] == "1"
+        and any(not bitmask.test(s.revealed_mask, j) and s.mine_layout[j] != "M" for j in table.of(i))
+    )
+    wrong = next(j for j in table.of(i) if not bitmask.test(s.revealed_mask, j) and s.mine_layout[j] != "M")
+    s, _ = apply_flag(s, *divmod(wrong, 8))
+    s2, res = apply_chord(s, *divmod(i, 8))
+    assert res["hit_mine"] is True
+    assert s2.status == "lost"
+
+
+def test_derived_layout_matches_first_reveal():
+    s = generate_new_game(12, 9, 20, rng_seed=1234)
+    s2, _ = apply_reveal(s, 4, 7)
+    assert s2.first_click == index(4, 7, 12)
+    assert derived_layout(12, 9, 20, 1234, s2.first_click) == s2.mine_layout
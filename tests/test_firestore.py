@@ -0,0 +1,217 @@
+import asyncio
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import create_app
+from minesweeper import migrate_boards
+from minesweeper.fake_firestore import FakeAsyncFirestoreClient, FakeFirestoreClient
+from minesweeper.move_log import MoveLogConfig
+from minesweeper.persistence import BOARD_ENCODING, AsyncFirestorePersistence, FirestorePersistence, InMemoryPersistence
+
+from test_persistence import _play
+
+
+def _flags(p, user="u"):
+    return p.to_client(p.get_game(user))["flags_total"]
+
+
+@pytest.mark.parametrize("options", [{}, {"packed_moves": True}, {"derive_layout": True}, {"compact_boards": True}])
+def test_firestore_matches_in_memory(options):
+    mem, fs = InMemoryPersistence(), FirestorePersistence(client=FakeFirestoreClient(), **options)
+    _play(mem)
+    _play(fs)
+    game, expected = fs.get_game("u"), mem.get_game("u")
+    assert fs.to_client(game) == mem.to_client(expected)
+    assert [m["action"] for m in fs.get_moves("u")] == [m["action"] for m in mem.get_moves("u")]
+    assert fs.get_stats("u") == mem.get_stats("u")
+
+
+@pytest.mark.parametrize("move", ["reveal", "moves"])
+def test_games_keep_their_layout_mode_across_instances(move):
+    # A rolling deploy: the game is started with DERIVE_MINE_LAYOUT off and played with it on
+    client = FakeFirestoreClient()
+    FirestorePersistence(client=client).start_game("u", 9, 9, 10)
+    fs = FirestorePersistence(client=client, derive_layout=True)
+    if move == "reveal":
+        fs.reveal("u", 4, 4)
+    else:
+        fs.apply_moves("u", [{"action": "reveal", "row": 4, "col": 4}])
+    game = fs.get_game("u")
+    assert game["rng_seed"] is None
+    assert game["mine_layout"].count("M") == 10
+
+
+def test_async_firestore_shares_documents_with_sync():
+    sync_client = FakeFirestoreClient()
+    fs, afs = FirestorePersistence(client=sync_client), AsyncFirestorePersistence(client=FakeAsyncFirestoreClient(store=sync_client.store))
+
+    async def play():
+        await afs.start_game("u", 9, 9, 10, rng_seed=5)
+        await afs.reveal("u", 0, 0)
+        await afs.flag("u", 8, 8)
+        await afs.start_infinite_game("u", 40, rng_seed=2)
+        return await afs.infinite_reveal("u", 0, 0)
+
+    inf, _ = asyncio.run(play())
+    assert [m["action"] for m in fs.get_moves("u")] == ["reveal", "flag"]
+    assert fs.get_infinite_game("u") == inf
+
+
+@pytest.mark.parametrize(
+    "options,move_writes",
+    [({}, 1), ({"packed_moves": True}, 1), ({"write_behind": MoveLogConfig(flush_interval=0.01)}, 0)],
+)
+def test_round_trips_per_operation(options, move_writes):
+    client = FakeFirestoreClient()
+    p = FirestorePersistence(client=client, stats_cache_ttl=0, **options)
+    p.start_game("u", 9, 9, 10, rng_seed=5)
+    # One transaction is begin, read the game, commit
+    for move in (lambda: p.flag("u", 8, 8), lambda: p.reveal("u", 0, 0)):
+        with client.track() as t:
+            move()
+        assert (t["round_trips"], t["reads"], t["writes"]) == (3, 1, 1 + move_writes)
+    with client.track() as t:
+        p.abandon("u")
+    # The game, stats totals and stats by option, plus the move
+    assert (t["round_trips"], t["writes"]) == (3, 3 + move_writes)
+    with client.track() as t:
+        p.get_game("u")
+    assert t["round_trips"] == 1
+    with client.track() as t:
+        stats = p.get_stats("u")
+    assert (t["round_trips"], t["reads"]) == (1, 1)
+    assert stats["totals"]["aborts"] == 1
+    # Closing flushes write-behind moves
+    p.close()
+    assert p.get_moves("u")[-1]["action"] == "abandon"
+
+
+def test_stats_backfill_only_for_legacy_documents():
+    client = FakeFirestoreClient()
+    p = FirestorePersistence(client=client, stats_cache_ttl=0)
+    # Written before the summary map: totals plus one document per board size
+    stats = client.collection("minesweeperStats").document("u")
+    stats.collection("byOption").document("9x9x10").set({"board_width": 9, "board_height": 9, "num_mines": 10, "played": 2, "wins": 1, "losses": 1})
+    stats.set({"played": 2, "wins": 1, "losses": 1})
+    p.start_game("u", 9, 9, 10, rng_seed=5)
+    p.abandon("u")
+    with client.track() as t:
+        first = p.get_stats("u")
+    assert t["writes"] == 1
+    assert first["totals"]["played"] == 3 and first["byOption"][0]["aborts"] == 1
+    with client.track() as t:
+        assert p.get_stats("u") == first
+    assert (t["reads"], t.get("writes", 0)) == (1, 0)
+
+
+def test_contended_transaction_retries_on_fresh_data():
+    client = FakeFirestoreClient()
+    p, other = FirestorePersistence(client=client, packed_moves=True), FirestorePersistence(client=client, packed_moves=True)
+    p.start_game("u", 9, 9, 10, rng_seed=5)
+    interfere = [True]
+
+    def latency(op):
+        # Another writer commits between this transaction's read and its commit, once
+        if op == "commit" and interfere[0]:
+            interfere[0] = False
+            other.flag("u", 8, 8)
+        return 0.0
+
+    client.store.latency = latency
+    client.reset_counters()
+    p.flag("u", 8, 7)
+    assert client.counters()["aborts"] == 1 and client.counters()["retries"] == 1
+    assert _flags(p) == 2
+    assert [m["col"] for m in p.get_moves("u")] == [8, 7]
+
+
+def test_injected_aborts_are_retried_until_attempts_run_out():
+    client = FakeFirestoreClient(abort_rate=0.5, seed=1)
+    p = FirestorePersistence(client=client)
+    p.start_game("u", 9, 9, 10, rng_seed=5)
+    for col in range(9):
+        p.flag("u", 0, col)
+    assert client.counters()["retries"] > 0
+    assert _flags(p) == 9
+
+    client.store.abort_rate = 1.0
+    with pytest.raises(ValueError):
+        p.flag("u", 1, 1)
+    assert _flags(p) == 9
+
+
+@pytest.mark.parametrize("finish", ["abandon", "moves"])
+def test_stats_read_during_the_finishing_commit_is_not_cached(finish):
+    before_commit = []
+
+    def latency(op):
+        if op == "commit" and before_commit:
+            before_commit.pop()()
+        return 0.0
+
+    p = FirestorePersistence(client=FakeFirestoreClient(latency=latency))
+    p.start_game("u", 9, 9, 10, rng_seed=5)
+    assert p.get_stats("u")["totals"]["played"] == 0
+    # A /stats request landing while the finishing transaction commits
+    before_commit.append(lambda: p.get_stats("u"))
+    if finish == "abandon":
+        p.abandon("u")
+    else:
+        p.apply_moves("u", [{"action": "reveal", "row": r, "col": c} for r in range(9) for c in range(9)])
+    assert not before_commit
+    assert p.get_stats("u")["totals"]["played"] == 1
+
+
+def test_concurrent_writers_lose_no_moves():
+    # Every conflict costs the losers an attempt, so stay below the five attempts a transaction gets
+    client = FakeFirestoreClient(latency=0.001)
+    p = FirestorePersistence(client=client, packed_moves=True)
+    p.start_game("u", 9, 9, 10, rng_seed=5)
+    threads = [threading.Thread(target=p.flag, args=("u", 0, col)) for col in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert _flags(p) == 4
+    assert len(p.get_moves("u")) == 4
+
+
+def test_migrate_boards_converts_text_documents():
+    client = FakeFirestoreClient()
+    p = FirestorePersistence(client=client)
+    for i in range(5):
+        p.start_game(f"u{i}", 9, 9, 10, rng_seed=i)
+        p.reveal(f"u{i}", 4, 4)
+    before = {f"u{i}": p.to_client(p.get_game(f"u{i}")) for i in range(5)}
+    FirestorePersistence(client=client, compact_boards=True).start_game("new", 9, 9, 10)
+
+    counts = migrate_boards.migrate(client, workers=2, batch_size=2)
+    assert counts == {"scanned": 6, "skipped": 1, "migrated": 5, "retried": 0}
+    for user, view in before.items():
+        game = p.get_game(user)
+        assert game["board_encoding"] == BOARD_ENCODING and isinstance(game["revealed_mask"], bytes)
+        assert p.to_client(game) == view
+    assert migrate_boards.migrate(client)["migrated"] == 0
+
+
+def test_migrate_boards_retries_documents_written_since_read():
+    client = FakeFirestoreClient()
+    p = FirestorePersistence(client=client)
+    p.start_game("u", 9, 9, 10, rng_seed=5)
+    snaps = list(client.collection(migrate_boards.GAMES_COLLECTION).stream())
+    p.flag("u", 8, 8)
+    assert migrate_boards._migrate_batch(client, snaps) == {"migrated": 1, "retried": 1}
+    game = p.get_game("u")
+    assert game["board_encoding"] == BOARD_ENCODING and _flags(p) == 1
+
+
+def test_api_on_fake_firestore():
+    app = create_app(persistence=FirestorePersistence(client=FakeFirestoreClient(), packed_moves=True))
+    headers = {"X-User-Id": "u1"}
+    with TestClient(app) as c:
+        r = c.post("/api/minesweeper/start", json={"board_width": 5, "board_height": 5, "num_mines": 5}, headers=headers)
+        assert r.status_code == 200
+        assert c.post("/api/minesweeper/flag", json={"row": 1, "col": 1}, headers=headers).json()["flags_total"] == 1
+        assert c.post("/api/minesweeper/start", json={"board_width": 5, "board_height": 5, "num_mines": 5}, headers=headers).status_code == 409
@@ -0,0 +1,84 @@
+from minesweeper import infinite
+from minesweeper.infinite import CHUNK, ChunkMasks, apply_flag, apply_reveal, chunk_layout, new_game, view
+from minesweeper.persistence import InMemoryPersistence
+
+
+def cell(s, row, col):
+    crow, ccol = infinite.chunk_of(row, col)
+    return chunk_layout(s.rng_seed, s.mines_per_chunk, s.origin, crow, ccol)[(row % CHUNK) * CHUNK + col % CHUNK]
+
+
+def empty_masks():
+    return ChunkMasks(lambda cr, cc: None)
+
+
+def test_numbers_are_consistent_across_chunk_borders():
+    s, _ = apply_reveal(new_game(60, rng_seed=5), empty_masks(), 0, 0)
+    for row in range(-CHUNK - 2, CHUNK + 2):
+        for col in range(-CHUNK - 2, CHUNK + 2):
+            if cell(s, row, col) == "M":
+                continue
+            mines = sum(
+                cell(s, r, c) == "M"
+                for r in (row - 1, row, row + 1)
+                for c in (col - 1, col, col + 1)
+                if (r, c) != (row, col)
+            )
+            assert cell(s, row, col) == str(mines)
+    # the first click's neighborhood is mine-free, even across a chunk corner
+    assert all(cell(s, r, c) != "M" for r in (-1, 0, 1) for c in (-1, 0, 1))
+
+
+def test_layout_is_a_pure_function_of_seed_and_chunk():
+    a = chunk_layout(9, 40, (3, 3), 2, -4)
+    chunk_layout.cache_clear()
+    infinite._chunk_mines.cache_clear()
+    assert chunk_layout(9, 40, (3, 3), 2, -4) == a
+    assert a.count("M") == 40
+    assert chunk_layout(10, 40, (3, 3), 2, -4) != a
+
+
+def test_reveal_floods_across_chunks_and_only_touches_what_it_opens():
+    masks = empty_masks()
+    s, res = apply_reveal(new_game(25, rng_seed=3), masks, CHUNK - 1, CHUNK - 1)
+    assert res["hit_mine"] is False
+    assert res["cleared_cells"] == len(res["changed"]) == s.revealed_count
+    opened = {infinite.chunk_of(r, c) for r, c, _ in res["changed"]}
+    assert set(masks.changed_chunks()) == opened
+    assert len(opened) > 1
+    for r, c, value in res["changed"]:
+        assert value == cell(s, r, c) != "M"
+
+
+def test_flag_and_view():
+    masks = empty_masks()
+    s, _ = apply_reveal(new_game(40, rng_seed=11), masks, 0, 0)
+    hidden = next(
+        (r, c) for r in range(-8, 8) for c in range(-8, 8)
+        if view(s, masks, r, c, 1, 1) == ["H"]
+    )
+    s, res = apply_flag(s, masks, *hidden)
+    assert res["changed"] == [[hidden[0], hidden[1], "F"]]
+    assert s.flags_count == 1
+    rows = view(s, masks, hidden[0], hidden[1], 1, 2)
+    assert rows[0][0] == "F"
+    s, _ = apply_flag(s, masks, *hidden)
+    assert s.flags_count == 0
+    assert view(s, masks, 0, 0, 1, 1) == [cell(s, 0, 0)]
+
+
+def test_in_memory_persists_only_touched_chunks():
+    p = InMemoryPersistence()
+    p.start_infinite_game("u", 40, rng_seed=7)
+    game, result = p.infinite_reveal("u", 100, -100)
+    assert game["origin"] == [100, -100]
+    touched = {infinite.chunk_of(r, c) for r, c, _ in result["changed"]}
+    assert set(p.infinite_chunks["u"]) == touched
+    far = (5000, 5000)
+    _, res = p.infinite_flag("u", *far)
+    assert infinite.chunk_of(*far) in p.infinite_chunks["u"]
+    p.infinite_flag("u", *far)
+    # un-flagging the only marked cell drops the chunk again
+    assert infinite.chunk_of(*far) not in p.infinite_chunks["u"]
+    _, rows = p.infinite_view("u", 100, -100, 1, 1)
+    assert rows == [result["changed"][0][2]]
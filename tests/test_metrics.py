@@ -0,0 +1,103 @@
+import threading
+
+from fastapi.testclient import TestClient
+
+from app.main import API_BASE, create_app
+from minesweeper import metrics
+from minesweeper.fake_firestore import FakeFirestoreClient
+from minesweeper.move_log import MoveLogConfig
+from minesweeper.persistence import FirestorePersistence, InMemoryPersistence
+
+
+def _samples(text):
+    """Sample lines as {name{labels}: value}."""
+    return {line.rsplit(" ", 1)[0]: float(line.rsplit(" ", 1)[1]) for line in text.splitlines() if line and not line.startswith("#")}
+
+
+def test_registry_renders_exposition_format():
+    r = metrics.Registry()
+    r.counter("jobs", "Jobs run.", ("kind",)).labels('a"b').inc(2)
+    r.gauge("depth", "Queue depth.").labels().set(3)
+    h = r.histogram("took_seconds", "Time taken.", buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5.0):
+        h.observe(value)
+    text = r.render()
+    assert "# TYPE took_seconds histogram" in text
+    assert _samples(text) == {
+        'jobs_total{kind="a\\"b"}': 2,
+        "depth": 3,
+        'took_seconds_bucket{le="0.1"}': 1,
+        'took_seconds_bucket{le="1"}': 3,
+        'took_seconds_bucket{le="+Inf"}': 4,
+        "took_seconds_sum": 6.05,
+        "took_seconds_count": 4,
+    }
+
+
+def test_histogram_loses_no_observations_across_threads():
+    h = metrics.Histogram("x_seconds", "x")
+    child = h.labels()
+    threads = [threading.Thread(target=lambda: [child.observe(0.002) for _ in range(5000)]) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert _samples("\n".join(h.render()))["x_seconds_count"] == 40000
+
+
+def test_metrics_endpoint_breaks_down_requests():
+    app = create_app(persistence=InMemoryPersistence())
+    h = {"X-User-Id": "u"}
+    with TestClient(app) as c:
+        c.post(f"{API_BASE}/start", json={"board_width": 9, "board_height": 9, "num_mines": 10}, headers=h)
+        c.post(f"{API_BASE}/reveal", json={"row": 0, "col": 0}, headers=h)
+        c.post(f"{API_BASE}/flag", json={"row": 0, "col": 0}, headers={"X-User-Id": "nobody"})
+        r = c.get("/metrics")
+    assert r.headers["content-type"] == metrics.CONTENT_TYPE
+    samples = _samples(r.text)
+    assert samples[f'minesweeper_http_request_duration_seconds_count{{route="{API_BASE}/reveal",method="POST",status="200"}}'] == 1
+    assert samples[f'minesweeper_http_request_duration_seconds_count{{route="{API_BASE}/flag",method="POST",status="404"}}'] == 1
+    assert samples['minesweeper_persistence_call_seconds_count{method="reveal"}'] == 1
+    assert samples['minesweeper_engine_seconds_count{function="apply_reveal"}'] >= 1
+    assert samples['minesweeper_engine_seconds_count{function="_build_layout_with_mines"}'] >= 1
+    assert samples['minesweeper_active_games{kind="classic"}'] == 1
+
+
+def test_metrics_count_transaction_retries_by_route():
+    client = FakeFirestoreClient(abort_rate=0.5, seed=1)
+    app = create_app(persistence=FirestorePersistence(client=client))
+    h = {"X-User-Id": "u"}
+    with TestClient(app) as c:
+        c.post(f"{API_BASE}/start", json={"board_width": 9, "board_height": 9, "num_mines": 10}, headers=h)
+        for col in range(9):
+            c.post(f"{API_BASE}/flag", json={"row": 0, "col": col}, headers=h)
+        samples = _samples(c.get("/metrics").text)
+    # background is process-wide, so other tests' work outside requests shows up there
+    retries = sum(v for k, v in samples.items() if k.startswith("minesweeper_persistence_retries_total") and "background" not in k)
+    assert retries == client.counters()["retries"] > 0
+    assert samples[f'minesweeper_persistence_writes_total{{route="{API_BASE}/flag"}}'] == 18
+    # Firestore backends have no cheap count of active games
+    assert not any(k.startswith("minesweeper_active_games") for k in samples)
+
+
+def test_metrics_export_the_write_behind_move_log():
+    # No flush before shutdown, and room for two records
+    persistence = FirestorePersistence(client=FakeFirestoreClient(), write_behind=MoveLogConfig(flush_interval=3600, max_buffer=2))
+    app = create_app(persistence=persistence)
+    h = {"X-User-Id": "u"}
+    with TestClient(app) as c:
+        c.post(f"{API_BASE}/start", json={"board_width": 9, "board_height": 9, "num_mines": 10}, headers=h)
+        for col in range(3):
+            c.post(f"{API_BASE}/flag", json={"row": 0, "col": col}, headers=h)
+        samples = _samples(c.get("/metrics").text)
+        assert samples["minesweeper_move_log_depth"] == 2
+        assert samples["minesweeper_move_log_lag_seconds"] >= 0
+        assert samples["minesweeper_move_log_dropped_records_total"] == 1
+        assert samples["minesweeper_move_log_flushed_records_total"] == 0
+        assert samples["minesweeper_move_log_flush_errors_total"] == 0
+        assert "minesweeper_move_log_last_flush_lag_seconds" not in samples
+        persistence.move_log.flush()
+        samples = _samples(c.get("/metrics").text)
+    assert samples["minesweeper_move_log_depth"] == 0
+    assert samples["minesweeper_move_log_flushed_records_total"] == 2
+    assert samples["minesweeper_move_log_last_flush_lag_seconds"] >= 0
@@ -0,0 +1,132 @@
+import threading
+from datetime import datetime, timezone
+
+import pytest
+
+from minesweeper import move_log
+from minesweeper.move_log import MoveLogConfig, WriteBehindMoveLog, expand_chunks, pack_move, unpack_move
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def _moves(n, start=1):
+    return [{"seq": i, "action": "reveal"} for i in range(start, start + n)]
+
+
+def test_flush_writes_batches_in_order():
+    batches = []
+    log = WriteBehindMoveLog(batches.append, MoveLogConfig(flush_size=3))
+    log.extend("a", _moves(4))
+    log.extend("b", _moves(2))
+    assert log.metrics()["depth"] == 6
+    assert log.flush() == 6
+    assert [len(b) for b in batches] == [3, 3]
+    assert [(u, m["seq"]) for b in batches for u, m in b] == [("a", 1), ("a", 2), ("a", 3), ("a", 4), ("b", 1), ("b", 2)]
+    assert log.metrics()["depth"] == 0 and log.flushed_total == 6
+
+
+def test_buffer_is_bounded_and_reports_lag():
+    clock = Clock()
+    log = WriteBehindMoveLog(lambda records: None, MoveLogConfig(flush_size=10, max_buffer=5), clock=clock)
+    log.extend("a", _moves(7))
+    clock.now += 2.5
+    m = log.metrics()
+    assert m["depth"] == 5 and m["dropped_total"] == 2
+    assert m["lag_seconds"] == pytest.approx(2.5)
+    log.flush()
+    assert log.metrics()["lag_seconds"] == 0.0
+    assert log.metrics()["last_flush_lag_seconds"] == pytest.approx(2.5)
+
+
+def test_failed_commit_requeues_records():
+    calls = []
+
+    def commit(records):
+        calls.append(list(records))
+        if len(calls) == 1:
+            raise RuntimeError("unavailable")
+
+    log = WriteBehindMoveLog(commit, MoveLogConfig(flush_size=2))
+    log.extend("a", _moves(3))
+    assert log.flush() == 0
+    assert log.flush_errors == 1 and log.metrics()["depth"] == 3
+    assert log.flush() == 3
+    assert [m["seq"] for _, m in calls[1] + calls[2]] == [1, 2, 3]
+
+
+def test_background_flush_and_close():
+    flushed = threading.Event()
+    batches = []
+
+    def commit(records):
+        batches.append(records)
+        flushed.set()
+
+    log = WriteBehindMoveLog(commit, MoveLogConfig(flush_interval=60.0, flush_size=2))
+    log.start()
+    # reaching flush_size wakes the thread well before the interval
+    log.extend("a", _moves(2))
+    assert flushed.wait(5)
+    log.extend("a", _moves(1, start=3))
+    log.close()
+    assert [m["seq"] for b in batches for _, m in b] == [1, 2, 3]
+
+
+@pytest.mark.parametrize("failures, written, abandoned", [(2, 3, 0), (3, 0, 3)])
+def test_close_retries_then_counts_abandoned_records(monkeypatch, caplog, failures, written, abandoned):
+    monkeypatch.setattr(move_log, "CLOSE_RETRY_DELAY", 0)
+    batches = []
+
+    def commit(records):
+        batches.append(records)
+        if len(batches) <= failures:
+            raise RuntimeError("unavailable")
+
+    log = WriteBehindMoveLog(commit, MoveLogConfig(flush_size=5))
+    log.extend("a", _moves(3))
+    log.close()
+    assert len(batches) == min(failures + 1, move_log.CLOSE_FLUSH_ATTEMPTS)
+    m = log.metrics()
+    assert (m["flushed_total"], m["dropped_total"], m["depth"]) == (written, abandoned, 0)
+    assert ("3 records abandoned" in caplog.text) == bool(abandoned)
+
+
+def test_packed_moves_round_trip():
+    ts = datetime(2025, 3, 1, 12, 0, 0, 123000, tzinfo=timezone.utc)
+    moves = [
+        {
+            "seq": 7, "action": "reveal", "row": 3, "col": 11, "timestamp": ts, "hit_mine": True,
+            "cleared_cells": 1, "flags_total": 2, "revealed_total": 40, "status_after": "lost",
+            "ms_since_game_start": 5120, "ms_since_prev_move": 830,
+        },
+        {
+            "seq": 1, "action": "error", "row": None, "col": None, "timestamp": ts, "hit_mine": False,
+            "cleared_cells": 0, "flags_total": 0, "revealed_total": 0, "status_after": "error",
+            "ms_since_game_start": None, "ms_since_prev_move": None, "error_reason": "insufficient_space_for_mines",
+        },
+    ]
+    for i, move in enumerate(moves):
+        packed = pack_move(i, move)
+        assert len(packed) < 80
+        assert unpack_move(packed) == (i, move)
+
+
+def test_expand_chunks_restores_log_order():
+    ts = datetime(2025, 3, 1, tzinfo=timezone.utc)
+    moves = [
+        {
+            "seq": i // 2 + 1, "action": "flag", "row": 0, "col": i, "timestamp": ts, "hit_mine": False,
+            "cleared_cells": 0, "flags_total": i % 2, "revealed_total": 0, "status_after": "active",
+            "ms_since_game_start": None, "ms_since_prev_move": 10,
+        }
+        for i in range(6)
+    ]
+    packed = [pack_move(i, m) for i, m in enumerate(moves)]
+    # chunks may come back in any order; entries within a chunk are unordered for ArrayUnion
+    assert expand_chunks([packed[4:][::-1], packed[:4]]) == moves
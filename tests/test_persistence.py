@@ -0,0 +1,380 @@
+import sys
+import threading
+from datetime import timedelta
+
+import pytest
+
+from minesweeper import bitmask
+from minesweeper.journal import JournalConfig, read_frames
+from minesweeper.move_log import CompactMove
+from minesweeper.persistence import (
+    BOARD_ENCODING,
+    FirestorePersistence,
+    InMemoryPersistence,
+    MemoryLimits,
+    SqlitePersistence,
+    _to_state,
+    encode_board_fields,
+    pack_layout,
+    unpack_layout,
+)
+
+
+@pytest.fixture
+def tight_switching():
+    # Switch threads as often as possible so unsynchronized read-modify-writes interleave
+    old = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    yield
+    sys.setswitchinterval(old)
+
+
+def _hammer(n_threads, work):
+    barrier = threading.Barrier(n_threads)
+    errors = []
+
+    def run(t):
+        barrier.wait()
+        try:
+            work(t)
+        except Exception as e:  # pragma: no cover - surfaced by the assert below
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(t,)) for t in range(n_threads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == []
+
+
+def test_concurrent_moves_for_one_user_stay_consistent(tight_switching):
+    p = InMemoryPersistence()
+    p.start_game("u", 16, 16, 40, rng_seed=3)
+    p.reveal("u", 0, 0)
+    game = p.get_game("u")
+    s = _to_state(game)
+    hidden = [i for i in range(s.cells) if not bitmask.test(s.revealed_mask, i)]
+    flag_cells = hidden[:8]
+    # numbered cells open only themselves, so no reveal can reach a flag cell while it is toggled off
+    reveal_cells = [i for i in hidden[8:] if s.mine_layout[i] not in "0M"][:8]
+
+    def work(t):
+        r, c = divmod(flag_cells[t], 16)
+        for _ in range(51):
+            p.flag("u", r, c)
+        p.reveal("u", *divmod(reveal_cells[t], 16))
+
+    _hammer(8, work)
+    game = p.get_game("u")
+    s = _to_state(game)
+    assert sorted(bitmask.iter_set(s.flag_mask, s.cells)) == flag_cells
+    assert all(bitmask.test(s.revealed_mask, i) for i in reveal_cells)
+    # counters recomputed from the masks agree with what the last move reported
+    last = p.moves["u"][-1]
+    assert last["flags_total"] == s.flags_count == 8
+    assert last["revealed_total"] == s.revealed_count
+    assert len(p.moves["u"]) == 1 + 8 * 52
+    seqs = [m["seq"] for m in p.moves["u"] if m["action"] == "reveal"]
+    assert game["moves_count"] == len(seqs) and seqs == list(range(seqs[0], seqs[0] + len(seqs)))
+
+
+def test_concurrent_abandon_counts_one_result(tight_switching):
+    p = InMemoryPersistence()
+    p.start_game("u", 9, 9, 10)
+    _hammer(8, lambda t: p.abandon("u"))
+    assert p.get_stats("u")["totals"]["aborts"] == 1
+
+
+def test_users_do_not_share_state_under_concurrency(tight_switching):
+    p = InMemoryPersistence(lock_stripes=4)
+    users = [f"user-{i}" for i in range(16)]
+    for u in users:
+        p.start_game(u, 8, 8, 10, rng_seed=1)
+
+    def work(t):
+        for _ in range(20):
+            p.flag(users[t], 7, 7)
+        p.flag(users[t], 7, 7)
+
+    _hammer(len(users), work)
+    for u in users:
+        assert p.get_game(u)["flag_mask"][63] == "1"
+        assert len(p.moves[u]) == 21
+
+
+def test_returned_games_are_snapshots():
+    p = InMemoryPersistence()
+    doc = p.start_game("u", 8, 8, 10)
+    game, _ = p.flag("u", 0, 0)
+    assert doc["flag_mask"][0] == "0" and game["flag_mask"][0] == "1"
+    p.flag("u", 0, 0)
+    assert game["flag_mask"][0] == "1"
+
+
+def test_max_users_evicts_finished_games_first():
+    p = InMemoryPersistence(limits=MemoryLimits(max_users=3))
+    for u in ("a", "b", "c"):
+        p.start_game(u, 8, 8, 10)
+    p.abandon("a")
+    p.get_game("b")
+    p.start_game("d", 8, 8, 10)
+    # "a" is least recently used among finished games; "b" and "c" are still active
+    # checked on the dicts directly: reads through the API count as use
+    assert set(p.games) == {"b", "c", "d"} and "a" not in p.stats_totals
+    p.start_game("e", 8, 8, 10)
+    # all active now, so plain LRU: "c" was used longest ago
+    assert set(p.games) == {"b", "d", "e"}
+    assert p.memory_usage()["evicted_users"] == 2
+
+
+def test_eviction_follows_games_between_finished_and_active():
+    p = InMemoryPersistence(limits=MemoryLimits(max_users=2))
+    p.start_game("a", 8, 8, 10)
+    p.abandon("a")
+    p.start_game("b", 8, 8, 10)
+    p.abandon("b")
+    # "a" plays again, so "b" is now the only finished game
+    p.start_game("a", 8, 8, 10)
+    p.start_game("c", 8, 8, 10)
+    assert set(p.games) == {"a", "c"}
+
+
+def test_finished_games_expire_after_ttl():
+    p = InMemoryPersistence(limits=MemoryLimits(finished_ttl=60))
+    p.start_game("old", 8, 8, 10)
+    p.abandon("old")
+    p.start_game("live", 8, 8, 10)
+    assert p.sweep() == 0
+    p.games["old"]["finished_at"] -= timedelta(minutes=5)
+    assert p.sweep() == 1
+    assert p.get_game("old") is None and "old" not in p.moves
+    assert p.get_stats("old")["totals"]["aborts"] == 1
+    assert p.get_game("live") is not None
+
+
+def test_move_history_cap_and_compact_records():
+    p = InMemoryPersistence(limits=MemoryLimits(max_moves_per_game=5))
+    p.start_game("u", 8, 8, 10)
+    for _ in range(12):
+        p.flag("u", 7, 7)
+    moves = p.get_moves("u")
+    assert len(moves) == 5 and all(type(m) is dict for m in moves)
+    assert [m["flags_total"] for m in moves] == [0, 1, 0, 1, 0]
+    assert set(moves[-1]) == {
+        "seq", "action", "row", "col", "timestamp", "hit_mine", "cleared_cells", "flags_total",
+        "revealed_total", "status_after", "ms_since_game_start", "ms_since_prev_move",
+    }
+    assert isinstance(p.moves["u"][-1], CompactMove)
+    p.mark_error("u", "insufficient_space_for_mines")
+    assert p.get_moves("u")[-1]["error_reason"] == "insufficient_space_for_mines"
+
+
+def test_memory_usage_reports_holdings():
+    p = InMemoryPersistence()
+    empty = p.memory_usage()
+    assert empty["users"] == 0 and empty["approx_bytes"] == 0
+    p.start_game("u", 16, 16, 40)
+    p.reveal("u", 0, 0)
+    p.start_infinite_game("u", 40)
+    p.infinite_reveal("u", 0, 0)
+    usage = p.memory_usage()
+    assert usage["users"] == 1 and usage["games"] == 1 and usage["infinite_games"] == 1
+    assert usage["move_records"] == 1 and usage["infinite_chunks"] >= 1
+    assert usage["approx_bytes"] > empty["approx_bytes"]
+
+
+def _play(p):
+    p.start_game("u", 9, 9, 10, rng_seed=5)
+    p.flag("u", 8, 8)
+    p.reveal("u", 0, 0)
+    p.apply_moves("u", [{"action": "flag", "row": 8, "col": 8}, {"action": "chord", "row": 0, "col": 0}])
+    p.abandon("u")
+    p.start_game("u", 9, 9, 10, rng_seed=6)
+    p.reveal("u", 4, 4)
+    p.mark_error("u", "insufficient_space_for_mines")
+
+
+@pytest.mark.parametrize("derive_layout", [False, True])
+def test_sqlite_matches_in_memory(tmp_path, derive_layout):
+    mem, db = InMemoryPersistence(), SqlitePersistence(str(tmp_path / "ms.db"), derive_layout=derive_layout)
+    _play(mem)
+    _play(db)
+    volatile = ("created_at", "updated_at", "finished_at", "first_reveal_at", "result_time_ms", "mine_layout")
+    game, expected = db.get_game("u"), mem.get_game("u")
+    assert {k: v for k, v in game.items() if k not in volatile} == {k: v for k, v in expected.items() if k not in volatile}
+    assert db.to_client(game) == mem.to_client(expected)
+    # in-memory reveals number seq after the move, the stored backends before it
+    timing = ("seq", "timestamp", "ms_since_game_start", "ms_since_prev_move")
+    strip = lambda moves: [{k: v for k, v in m.items() if k not in timing} for m in moves]  # noqa: E731
+    assert strip(db.get_moves("u")) == strip(mem.get_moves("u"))
+    assert db.get_stats("u") == mem.get_stats("u")
+
+
+def test_sqlite_survives_reopening(tmp_path):
+    path = str(tmp_path / "ms.db")
+    db = SqlitePersistence(path)
+    db.start_game("u", 8, 8, 10, rng_seed=1)
+    game, _ = db.reveal("u", 0, 0)
+    db.start_infinite_game("u", 40, rng_seed=2)
+    inf, _ = db.infinite_reveal("u", 0, 0)
+    _, rows = db.infinite_view("u", -4, -4, 8, 8)
+    db.close()
+
+    reopened = SqlitePersistence(path)
+    assert reopened.get_game("u") == game
+    assert reopened.get_infinite_game("u") == inf
+    assert reopened.infinite_view("u", -4, -4, 8, 8)[1] == rows
+    assert [m["action"] for m in reopened.get_moves("u")] == ["reveal"]
+    with pytest.raises(ValueError):
+        reopened.start_game("u", 8, 8, 10)
+
+
+@pytest.mark.parametrize("derive_layout", [False, True])
+def test_sqlite_games_keep_their_layout_mode_when_reopened(tmp_path, derive_layout):
+    path = str(tmp_path / "ms.db")
+    mem, db = InMemoryPersistence(), SqlitePersistence(path, derive_layout=derive_layout)
+    mem.start_game("seeded", 9, 9, 10, rng_seed=5)
+    db.start_game("seeded", 9, 9, 10, rng_seed=5)
+    db.start_game("seedless", 9, 9, 10)
+    db.close()
+
+    reopened = SqlitePersistence(path, derive_layout=not derive_layout)
+    for p in (mem, reopened):
+        p.reveal("seeded", 4, 4)
+    reopened.apply_moves("seedless", [{"action": "reveal", "row": 4, "col": 4}])
+    assert reopened.to_client(reopened.get_game("seeded")) == mem.to_client(mem.get_game("seeded"))
+    assert _to_state(reopened.get_game("seedless")).mine_layout.count("M") == 10
+    reopened.close()
+    assert SqlitePersistence(path, derive_layout=derive_layout).get_game("seedless") == reopened.get_game("seedless")
+
+
+def test_sqlite_serializes_concurrent_writers(tmp_path):
+    db = SqlitePersistence(str(tmp_path / "ms.db"))
+    db.start_game("u", 8, 8, 10)
+    _hammer(8, lambda t: [db.flag("u", 0, t) for _ in range(9)])
+    game = db.get_game("u")
+    assert game["flag_mask"][:8] == "1" * 8
+    assert len(db.get_moves("u")) == 72
+    db.close()
+
+
+def _journaled(tmp_path, **kwargs):
+    return InMemoryPersistence(journal=JournalConfig(directory=str(tmp_path / "journal"), **kwargs))
+
+
+def _state(p):
+    return p.games, {u: [dict(m) for m in ms] for u, ms in p.moves.items()}, p.stats_totals, p.stats_by_option, p.infinite_games, p.infinite_chunks
+
+
+def test_journal_replays_after_restart(tmp_path):
+    p = _journaled(tmp_path)
+    _play(p)
+    p.start_game("other", 8, 8, 10)
+    p.apply_moves("other", [{"action": "reveal", "row": 0, "col": 0}, {"action": "flag", "row": 7, "col": 7}])
+    p.start_infinite_game("other", 40, rng_seed=3)
+    p.infinite_reveal("other", 0, 0)
+    p.infinite_flag("other", 40, 40)
+    # no close(): the journal alone has to carry everything
+    recovered = _journaled(tmp_path)
+    assert _state(recovered) == _state(p)
+    assert recovered.journal.metrics()["generation"] == 0
+
+
+def test_journal_snapshots_and_replays_the_tail(tmp_path):
+    p = _journaled(tmp_path, snapshot_every=5)
+    for i in range(4):
+        p.start_game(f"u{i}", 8, 8, 10)
+        p.flag(f"u{i}", 0, 0)
+    p.abandon("u0")
+    p.evict_user("u1")
+    # Due snapshots are written in the background, holding the snapshot lock;
+    # one falling due meanwhile is taken on the next request
+    with p._snapshot_lock:
+        pass
+    p.get_game("u2")
+    with p._snapshot_lock:
+        assert p.journal.snapshots_total >= 1 and p.journal.pending < 5
+    recovered = _journaled(tmp_path)
+    assert _state(recovered) == _state(p)
+    p.close()
+    # close() leaves a snapshot and an empty journal
+    assert _state(_journaled(tmp_path)) == _state(p)
+    assert len(list((tmp_path / "journal").glob("journal.*"))) == 1
+
+
+def test_journal_recovers_from_an_unwritten_snapshot(tmp_path):
+    p = _journaled(tmp_path)
+    _play(p)
+    # A crash between rotating the journal and writing its snapshot
+    p._rotate()
+    p.start_game("other", 8, 8, 10)
+    p.flag("other", 0, 0)
+    assert sorted(path.name for path in (tmp_path / "journal").iterdir()) == ["journal.00000000", "journal.00000001"]
+    recovered = _journaled(tmp_path)
+    assert _state(recovered) == _state(p)
+    recovered.close()
+    assert _state(_journaled(tmp_path)) == _state(p)
+
+
+def test_journal_records_only_changed_game_fields(tmp_path):
+    p = _journaled(tmp_path)
+    p.start_game("u", 30, 30, 99, rng_seed=1)
+    p.reveal("u", 15, 15)
+    p.flag("u", 0, 0)
+    p.journal.close()
+    (path,) = (tmp_path / "journal").glob("journal.*")
+    start, reveal, flag = [record for _, record in read_frames(str(path))]
+    assert start[0] == "game" and reveal[0] == flag[0] == "game_update"
+    # The layout is journaled when it is placed, and not with later moves
+    assert "mine_layout" in reveal[2]
+    assert set(flag[2]) == {"flag_mask", "updated_at"}
+    assert _state(_journaled(tmp_path)) == _state(p)
+
+
+def test_journal_drops_a_torn_tail(tmp_path):
+    p = _journaled(tmp_path)
+    p.start_game("u", 8, 8, 10)
+    p.flag("u", 0, 0)
+    p.journal.close()
+    (path,) = (tmp_path / "journal").glob("journal.*")
+    size = path.stat().st_size
+    with open(path, "ab") as f:
+        f.write(b"\x40\x00\x00\x00garbage")
+    recovered = _journaled(tmp_path)
+    assert recovered.get_game("u")["flag_mask"][0] == "1"
+    assert path.stat().st_size == size
+    recovered.flag("u", 0, 0)
+    assert _journaled(tmp_path).get_game("u")["flag_mask"][0] == "0"
+
+
+def test_compact_board_encoding_reads_like_text():
+    p = InMemoryPersistence()
+    p.start_game("u", 7, 5, 6, rng_seed=2)
+    p.reveal("u", 0, 0)
+    p.flag("u", 4, 6)
+    game = p.get_game("u")
+    compact = encode_board_fields(game)
+    assert compact["board_encoding"] == BOARD_ENCODING
+    assert isinstance(compact["mine_layout"], bytes) and len(compact["mine_layout"]) == 18
+    assert unpack_layout(compact["mine_layout"], 35) == game["mine_layout"]
+    assert _to_state(compact) == _to_state(game)
+    assert p.to_client(compact) == p.to_client(game)
+    assert encode_board_fields(compact) == compact
+
+
+def test_first_compact_write_converts_the_whole_board():
+    fs = FirestorePersistence(client=object(), compact_boards=True)
+    game = {"revealed_mask": "1100", "flag_mask": "0010", "mine_layout": "11M1"}
+    stored = fs._stored(game, {"flag_mask": "0011", "status": "active"})
+    assert stored == {
+        "revealed_mask": bitmask.from_str("1100"),
+        "flag_mask": bitmask.from_str("0011"),
+        "mine_layout": pack_layout("11M1"),
+        "status": "active",
+        "board_encoding": BOARD_ENCODING,
+    }
+    # Documents already compact stay compact even where the option is off
+    text = FirestorePersistence(client=object())
+    assert text._stored(game, {"status": "won"}) == {"status": "won"}
+    assert text._stored(stored, {"flag_mask": "0000"}) == {"flag_mask": bitmask.from_str("0000"), "board_encoding": BOARD_ENCODING}
@@ -0,0 +1,91 @@
+import os
+import threading
+import time
+
+from fastapi.testclient import TestClient
+
+from app.main import API_BASE, create_app
+from minesweeper import profiling
+from minesweeper.fake_firestore import FakeFirestoreClient
+from minesweeper.persistence import FirestorePersistence, InMemoryPersistence
+from minesweeper.profiling import ProfileConfig, Profiler
+
+
+def _spin(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def _read(path):
+    with open(path) as f:
+        return dict(line.rsplit(" ", 1) for line in f.read().splitlines())
+
+
+def test_samples_the_request_and_its_attributed_threads(tmp_path):
+    profiler = Profiler(ProfileConfig(str(tmp_path), interval=0.001))
+    with profiler.profile(None) as session:
+        worker = profiling.attributed(_spin)
+        t = threading.Thread(target=worker, args=(0.05,))
+        t.start()
+        t.join()
+    profiler.finish(session, "GET /x")
+    # Outside a session there is nothing to attribute to
+    assert profiling.attributed(_spin) is _spin
+    stacks = _read(profiler.latest())
+    assert any(s.startswith("GET /x;") and s.endswith("test_profiling:_spin") for s in stacks)
+
+
+def test_rotates_old_profiles(tmp_path):
+    profiler = Profiler(ProfileConfig(str(tmp_path), requests_per_profile=1, keep=2))
+    for n in range(4):
+        session = profiling._Session(None, threading.get_ident())
+        session.stacks[f"a;b{n}"] = 1
+        profiler.finish(session, "GET /x")
+    # Nothing new to write, so no empty file either
+    assert profiler.flush() is None
+    paths = profiler.profiles()
+    assert len(paths) == 2
+    assert list(_read(paths[-1])) == ["GET /x;a;b3"]
+
+
+def test_finish_leaves_the_file_to_the_sampling_thread(tmp_path):
+    profiler = Profiler(ProfileConfig(str(tmp_path), requests_per_profile=1))
+    with profiler.profile(None) as session:
+        pass
+    session.stacks["a;b"] = 1
+    with profiler._lock:
+        # Does not wait for the sampler, nor write on the calling thread
+        profiler.finish(session, "GET /x")
+        assert profiler.profiles() == []
+    deadline = time.monotonic() + 5
+    while not profiler.profiles() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert "GET /x;a;b" in _read(profiler.profiles()[0])
+
+
+def test_profiles_requests_with_the_debug_header(tmp_path, monkeypatch):
+    monkeypatch.setenv("PROFILE_DIR", str(tmp_path))
+    monkeypatch.setenv("PROFILE_SAMPLE_RATE", "0")
+    monkeypatch.setenv("PROFILE_INTERVAL_MS", "1")
+    client = FakeFirestoreClient(latency=0.01)
+    app = create_app(persistence=FirestorePersistence(client=client))
+    h = {"X-User-Id": "u"}
+    with TestClient(app) as c:
+        assert c.get(f"{API_BASE}/debug/profile").status_code == 404
+        c.post(f"{API_BASE}/start", json={"board_width": 9, "board_height": 9, "num_mines": 10}, headers=h)
+        assert c.get(f"{API_BASE}/debug/profile").status_code == 404
+        c.post(f"{API_BASE}/reveal", json={"row": 0, "col": 0}, headers={**h, "X-Profile": "1"})
+        r = c.get(f"{API_BASE}/debug/profile")
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/plain")
+    stacks = dict(line.rsplit(" ", 1) for line in r.text.splitlines())
+    assert all(s.startswith(f"POST {API_BASE}/reveal;") for s in stacks)
+    assert any("persistence:FirestorePersistence.reveal" in s for s in stacks)
+    assert os.listdir(tmp_path) == [os.path.basename(app.state.profiler.latest())]
+
+
+def test_debug_endpoint_is_404_when_disabled(monkeypatch):
+    monkeypatch.delenv("PROFILE_DIR", raising=False)
+    with TestClient(create_app(persistence=InMemoryPersistence())) as c:
+        assert c.get(f"{API_BASE}/debug/profile").status_code == 404